@@ -0,0 +1,231 @@
+"""
+Incremental evaluator for the Achievements / User_Achievements tables.
+Keeps one running counter per condition type and re-checks only the rules of the
+types an event touched, so each completion costs O(rules) instead of a Task rescan.
+The counters are saved in AchievementCounters together with the last Task they
+cover, so a restart replays only the Tasks written since.
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from archive import history_source
+from clock import get_clock, parse_date, period_key
+
+logger = logging.getLogger(__name__)
+
+EARLY_HOUR = 8
+
+class AchievementEngine:
+    """
+    Awards achievements from habit/completion events.
+
+    Supported condition types:
+        streak: best streak reached by any habit
+        total_completions: completions across all habits
+        completion / total_days: completions of a single habit
+        create_habit: habits created
+        early_completion: completions logged before 8 AM
+        weekend_streak: weekend days (Sat/Sun of the same week) with a completion
+
+    Register it as a MyHabits listener after calling resume() (or backfill() to
+    rebuild from the full history), and save() before closing the connection.
+    Listener hooks write awards without committing; the connection's next commit
+    (MyHabits' next write, or the caller's) persists them.
+    """
+    def __init__(self, db_cursor, db_connection):
+        self.cursor = db_cursor
+        self.connection = db_connection
+        self.rules: Dict[str, List[Tuple[int, int, str]]] = defaultdict(list)
+        self.earned: Set[int] = set()
+        self._reset_counters()
+        self._load_rules()
+
+    def _reset_counters(self):
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.habit_completions: Dict[int, int] = defaultdict(int)
+        self._weekend: Tuple[Optional[Tuple[int, int]], Set[int]] = (None, set())
+        self.last_task_id = 0
+
+    def _load_rules(self):
+        self.rules.clear()
+        for achievement_id, name, condition_type, condition_value in self.cursor.execute(
+                "SELECT id, name, condition_type, condition_value FROM Achievements").fetchall():
+            if condition_type:
+                self.rules[condition_type].append((achievement_id, condition_value or 0, name))
+        self.earned = {row[0] for row in self.cursor.execute(
+            "SELECT DISTINCT achievement_id FROM User_Achievements").fetchall()}
+
+    # --- MyHabits listener hooks ---
+    def habit_added(self, creation_date=None, **_):
+        self.counters["create_habit"] += 1
+        awarded = self._evaluate(("create_habit",), (creation_date or get_clock().today().isoformat())[:10])
+        self._announce(awarded)
+
+    def task_completed(self, habit_id, log_date, streak=None, completed_at=None, task_id=None, **_):
+        awarded = []
+        if task_id is not None:
+            # Completions written by other processes since the last one seen come first
+            awarded += self._replay(until=task_id - 1)
+        awarded += self._record(habit_id, log_date, streak or 0, completed_at)
+        if task_id is not None:
+            self.last_task_id = max(self.last_task_id, task_id)
+        self._announce(awarded)
+
+    # --- Core ---
+    def _record(self, habit_id: int, log_date: str, streak: int,
+                completed_at: Optional[str]) -> List[Tuple[int, str]]:
+        day = parse_date(log_date)
+        self.counters["total_completions"] += 1
+        self.habit_completions[habit_id] += 1
+        per_habit = self.habit_completions[habit_id]
+        if per_habit > self.counters["completion"]:
+            self.counters["completion"] = self.counters["total_days"] = per_habit
+        if streak > self.counters["streak"]:
+            self.counters["streak"] = streak
+
+        touched = ["total_completions", "completion", "total_days", "streak"]
+        timestamp = completed_at or (log_date if len(log_date) > 10 else None)
+        if timestamp and timestamp[11:13].isdigit() and int(timestamp[11:13]) < EARLY_HOUR:
+            self.counters["early_completion"] += 1
+            touched.append("early_completion")
+        if day.weekday() >= 5:
+            week = day.isocalendar()[:2]
+            current_week, days = self._weekend
+            if week != current_week:
+                days = set()
+            days.add(day.weekday())
+            self._weekend = (week, days)
+            self.counters["weekend_streak"] = max(self.counters["weekend_streak"], len(days))
+            touched.append("weekend_streak")
+        return self._evaluate(touched, log_date[:10])
+
+    def _evaluate(self, condition_types, earned_date: str) -> List[Tuple[int, str]]:
+        awarded = []
+        for condition_type in condition_types:
+            value = self.counters[condition_type]
+            for achievement_id, threshold, name in self.rules.get(condition_type, ()):
+                if achievement_id not in self.earned and value >= threshold:
+                    self._award(achievement_id, earned_date)
+                    awarded.append((achievement_id, name))
+        return awarded
+
+    def _award(self, achievement_id: int, earned_date: str):
+        # The NOT EXISTS guard keeps awards idempotent across engines and restarts
+        self.cursor.execute("""
+            INSERT INTO User_Achievements (achievement_id, earned_date)
+            SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM User_Achievements WHERE achievement_id = ?)
+        """, (achievement_id, earned_date, achievement_id))
+        self.earned.add(achievement_id)
+
+    def _announce(self, awarded):
+        # Awards are written in the caller's transaction; committing here would end a batch early
+        if awarded:
+            for _, name in awarded:
+                logger.info(f"Achievement unlocked: {name}")
+                print(f"🏆 Achievement unlocked: {name}")
+
+    def _count_habits(self, creation_dates: List[str]) -> List[Tuple[int, str]]:
+        """Advance the create_habit counter over habits in creation order; the Nth dates awards for N."""
+        awarded = []
+        for count, created in enumerate(creation_dates, 1):
+            if count > self.counters["create_habit"]:
+                self.counters["create_habit"] = count
+                awarded += self._evaluate(("create_habit",), created[:10])
+        return awarded
+
+    def save(self):
+        """Store the counters and the last Task they cover (the caller commits)."""
+        week, days = self._weekend
+        state = dict(self.counters)
+        state.update({f"habit:{habit_id}": count for habit_id, count in self.habit_completions.items()})
+        state["weekend_week"] = week[0] * 100 + week[1] if week else 0
+        state["weekend_days"] = sum(1 << day for day in days)
+        state["last_task_id"] = self.last_task_id
+        self.cursor.executemany("INSERT OR REPLACE INTO AchievementCounters (name, value) VALUES (?, ?)",
+                                list(state.items()))
+
+    def _load_counters(self) -> bool:
+        state = dict(self.cursor.execute("SELECT name, value FROM AchievementCounters").fetchall())
+        if "last_task_id" not in state:
+            return False
+        self._reset_counters()
+        self.last_task_id = state.pop("last_task_id")
+        week, days = state.pop("weekend_week", 0), state.pop("weekend_days", 0)
+        self._weekend = ((divmod(week, 100) if week else None), {day for day in (5, 6) if days >> day & 1})
+        for name, value in state.items():
+            if name.startswith("habit:"):
+                self.habit_completions[int(name[6:])] = value
+            else:
+                self.counters[name] = value
+        return True
+
+    def _replay(self, until: Optional[int] = None) -> List[Tuple[int, str]]:
+        """Record the completed Tasks after last_task_id (up to `until`), using their stored streaks."""
+        awarded = []
+        if until is not None and until <= self.last_task_id:
+            return awarded
+        bound = "AND task_id <= ?" if until is not None else ""
+        params = (self.last_task_id, until) if until is not None else (self.last_task_id,)
+        for task_id, habit_id, log_date, streak in self.cursor.execute(f"""
+                SELECT task_id, habit_id, task_log_date, streak FROM {history_source(self.cursor)}
+                WHERE task_status = 'completed' AND task_id > ? {bound}
+                ORDER BY task_id""", params).fetchall():
+            awarded += self._record(habit_id, log_date, streak, None)
+            self.last_task_id = task_id
+        return awarded
+
+    def resume(self) -> List[Tuple[int, str]]:
+        """
+        Restore the saved counters and replay only the Tasks written after them;
+        falls back to backfill() when nothing was saved yet.
+
+        Returns:
+            list: (achievement_id, name) pairs awarded by this run
+        """
+        self._load_rules()
+        if not self._load_counters():
+            return self.backfill()
+        awarded = self._count_habits([created for (created,) in self.cursor.execute(
+            "SELECT creation_date FROM Habits ORDER BY creation_date").fetchall()])
+        awarded += self._replay()
+        self.save()
+        self.connection.commit()
+        logger.info(f"Achievement counters resumed at task {self.last_task_id}: {len(awarded)} awarded")
+        return awarded
+
+    def backfill(self) -> List[Tuple[int, str]]:
+        """
+        Rebuild all counters from history in one ordered pass over Tasks and award
+        anything already earned, dated on the day its condition was first met.
+
+        Returns:
+            list: (achievement_id, name) pairs awarded by this run
+        """
+        self._reset_counters()
+        self._load_rules()
+
+        habits = self.cursor.execute("SELECT id, habit_period, creation_date FROM Habits ORDER BY creation_date").fetchall()
+        periods = {habit_id: period for habit_id, period, _ in habits}
+        awarded = self._count_habits([created for _, _, created in habits])
+
+        last_key: Dict[int, int] = {}
+        streaks: Dict[int, int] = defaultdict(int)
+        for task_id, habit_id, log_date in self.cursor.execute(f"""
+                SELECT task_id, habit_id, task_log_date FROM {history_source(self.cursor)}
+                WHERE task_status = 'completed'
+                ORDER BY task_log_date, task_id""").fetchall():
+            day = parse_date(log_date)
+            key = period_key(day, periods.get(habit_id, "daily"))
+            previous = last_key.get(habit_id)
+            if previous != key:
+                streaks[habit_id] = streaks[habit_id] + 1 if previous == key - 1 else 1
+                last_key[habit_id] = key
+            awarded += self._record(habit_id, log_date, streaks[habit_id], None)
+            self.last_task_id = max(self.last_task_id, task_id)
+
+        self.cursor.execute("DELETE FROM AchievementCounters")
+        self.save()
+        self.connection.commit()
+        logger.info(f"Achievement backfill complete: {len(awarded)} awarded")
+        return awarded
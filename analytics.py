@@ -1,6 +1,11 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
 from models import Habit, Task, Difficulty, HabitStatus, TaskStatus
 from db import create_connection
+from clock import get_clock, parse_date, period_key
+from forecast import StreakRiskModel
+from history import HistoryView
+from storage import SQLiteBackend
+from metrics import ANALYTICS_SECONDS, ROWS, timed
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -9,9 +14,40 @@ logger = logging.getLogger(__name__)
 # Establish DB connection
 connection = create_connection()
 cursor = connection.cursor()
+backend = SQLiteBackend(cursor, connection)
+
+replica = None
+
+def use_connection(conn):
+    """Point the module-level analytics functions at another database connection."""
+    global connection, cursor, backend, replica
+    connection = conn
+    cursor = conn.cursor()
+    backend = SQLiteBackend(cursor, conn)
+    replica = None
+
+def use_backend(storage):
+    """Serve the module-level analytics functions from any StorageBackend (e.g. a MemoryBackend)."""
+    global connection, cursor, backend, replica
+    connection, cursor = storage.connection, storage.cursor
+    backend = storage
+    replica = None
+
+def use_replica(read_replica):
+    """Serve the module-level analytics functions from an in-memory ReadReplica."""
+    global replica
+    read_replica.refresh_if_stale()
+    use_connection(read_replica.connection)
+    replica = read_replica
+
+def as_of(day):
+    """Habits and analytics as they stood at the end of `day` (needs a SQLite backend)."""
+    if cursor is None:
+        raise ValueError("As-of queries read HabitHistory and need a SQLite backend")
+    return HistoryView(cursor, day)
 
 def get_current_date():
-    return datetime.now().strftime("%Y-%m-%d")
+    return get_clock().today().isoformat()
 
 def week_diff(start_date, end_date):
     sy, sw, _ = start_date.isocalendar()
@@ -19,17 +55,28 @@ def week_diff(start_date, end_date):
     return (ey - sy) * 52 + (ew - sw) + 1
 
 def get_all_active_habits():
-    query = "SELECT habit_name, creation_date, habit_period FROM Habits WHERE habit_status = 'active'"
-    return cursor.execute(query).fetchall()
-
-def get_longest_streak():
-    query = "SELECT habit_name, MAX(streak) FROM Habits WHERE habit_status = 'active'"
-    result = cursor.execute(query).fetchone()
-    return {"habit_name": result[0], "streak": result[1]} if result else None
-
-def get_longest_streak_for_habit(habit_name):
-    query = "SELECT streak FROM Habits WHERE habit_name = ? AND habit_status = 'active'"
-    result = cursor.execute(query, (habit_name,)).fetchone()
+    return [(h.habit_name, h.creation_date, h.habit_period) for h in backend.habits()]
+
+def _active_habit(habit_name):
+    habit = backend.habit_by_name(habit_name)
+    return habit if habit is not None and habit.habit_status == "active" else None
+
+@timed(ANALYTICS_SECONDS)
+def get_longest_streak(index=None):
+    """Longest streak among active habits; pass a CompletionIndex to use the full history bitsets."""
+    habits = backend.habits()
+    if index is not None:
+        best = max(((index.longest_streak(h.id), h.habit_name) for h in habits if h.id in index.habits), default=None)
+        return {"habit_name": best[1], "streak": best[0]} if best else None
+    best = max(habits, key=lambda h: h.streak or 0, default=None)
+    return {"habit_name": best.habit_name, "streak": best.streak} if best else None
+
+@timed(ANALYTICS_SECONDS)
+def get_longest_streak_for_habit(habit_name, index=None):
+    habit = _active_habit(habit_name)
+    result = None
+    if habit is not None:
+        result = (index.longest_streak(habit.id),) if index is not None else (habit.streak,)
     if result:
         print(f"Longest streak for '{habit_name}': {result[0]} days")
         return result[0]
@@ -37,47 +84,50 @@ def get_longest_streak_for_habit(habit_name):
         print(f"No active habit found with the name: {habit_name}")
         return 0
 
-def get_missed_counts(habit_name, habit_period, creation_date):
-    now = datetime.now()
-    creation = datetime.strptime(creation_date, "%Y-%m-%d")
-    start_date = max(now - timedelta(days=30), creation)
+def get_missed_counts(habit_name, habit_period, creation_date, context=None):
+    """Pass a clock PeriodContext to share one clock reading across habits."""
+    context = context or get_clock().context()
+    today = context.today
+    start_date = max(context.window_start(31), parse_date(creation_date))
 
     if habit_period == 'daily':
-        tracked_units = (now - start_date).days + 1
-        query = """
-            SELECT COUNT(DISTINCT task_log_date) 
-            FROM Tasks WHERE task_name = ? AND task_log_date BETWEEN ? AND ?
-        """
+        tracked_units = (today - start_date).days + 1
     elif habit_period == 'weekly':
-        tracked_units = week_diff(start_date, now)
-        query = """
-            SELECT COUNT(DISTINCT strftime('%Y-%W', task_log_date)) 
-            FROM Tasks WHERE task_name = ? AND task_log_date BETWEEN ? AND ?
-        """
+        tracked_units = week_diff(start_date, today)
     else:
         raise ValueError("Invalid habit period")
 
-    completed_units = cursor.execute(
-        query,
-        (habit_name, start_date.strftime("%Y-%m-%d"), now.strftime("%Y-%m-%d"))
-    ).fetchone()[0]
+    habit = _active_habit(habit_name)
+    dates = backend.completion_dates(habit.id, start_date.isoformat(), today.isoformat()) if habit else []
+    completed_units = len({period_key(d, habit_period) for d in dates})
 
     return tracked_units, completed_units
 
+@timed(ANALYTICS_SECONDS)
 def get_struggled_habits():
     struggled = []
+    context = get_clock().context()
+    today = context.today
     for habit_name, creation_date, period in get_all_active_habits():
-        creation = datetime.strptime(creation_date, "%Y-%m-%d")
-        interval = min((datetime.now() - creation).days if period == 'daily' else week_diff(creation, datetime.now()), 30 if period == 'daily' else 4)
-        tracked, completed = get_missed_counts(habit_name, period, creation_date)
+        creation = parse_date(creation_date)
+        interval = min((today - creation).days if period == 'daily' else week_diff(creation, today), 30 if period == 'daily' else 4)
+        tracked, completed = get_missed_counts(habit_name, period, creation_date, context)
 
         if completed < interval:
             missed = tracked - completed
             struggled.append(f"'{habit_name}' ({period}) missed {missed} of {interval} expected completions last month.")
     return struggled
 
-def get_missed_habits():
+@timed(ANALYTICS_SECONDS)
+def get_missed_habits(index=None):
     missed_list = []
+    if index is not None:
+        # Bitset popcounts cover the full history without a query per habit
+        for habit_id, habit_name in ((h.id, h.habit_name) for h in backend.habits()):
+            missed = index.missed_count(habit_id) if habit_id in index.habits else 0
+            if missed:
+                missed_list.append(f"'{habit_name}' missed {missed} completions since creation.")
+        return missed_list
     for habit_name, creation_date, period in get_all_active_habits():
         tracked, completed = get_missed_counts(habit_name, period, creation_date)
         if completed < tracked:
@@ -91,7 +141,10 @@ def display_data(header, items):
     for item in items:
         print(f"- {item}")
 
+@timed(ANALYTICS_SECONDS)
 def display_analytics_summary():
+    if replica is not None:
+        replica.refresh_if_stale()
     longest = get_longest_streak()
     if longest:
         print(f"Longest streak: {longest['streak']} for habit '{longest['habit_name']}'")
@@ -109,19 +162,19 @@ def display_analytics_summary():
     display_data("Missed Habits Since Creation", missed)
 
 def get_completed_tasks_for_date(log_date):
-    query = "SELECT * FROM Tasks WHERE task_log_date = ?"
-    return cursor.execute(query, (log_date,)).fetchall()
+    return backend.tasks(log_date)
 
 def list_all_tasks():
-    return cursor.execute("SELECT * FROM Tasks").fetchall()
+    return backend.tasks()
 
 def list_all_active_habits():
-    return cursor.execute("SELECT * FROM Habits WHERE habit_status = 'active'").fetchall()
+    return backend.habits()
 
 # --- Advanced Analytics Enhancements ---
 from collections import Counter, defaultdict
 from typing import List, Dict, Tuple
 
+@timed(ANALYTICS_SECONDS)
 def get_most_missed_habits(cursor, top_n: int = 3) -> List[Tuple[int, str, int]]:
     """Return top N most missed habits (by count)."""
     cursor.execute("""
@@ -134,13 +187,21 @@ def get_most_missed_habits(cursor, top_n: int = 3) -> List[Tuple[int, str, int]]
         LIMIT ?
     """, (top_n,))
     result = cursor.fetchall()
-    logger.info(f"Most missed habits: {result}")
+    logger.debug(f"Most missed habits: {len(result)} of top {top_n}")
     return result
 
+@timed(ANALYTICS_SECONDS)
+def get_missed_period_counts(cursor) -> Dict[int, int]:
+    """Missed periods per habit, as materialized by the missed-period sweeper."""
+    cursor.execute("SELECT habit_id, COUNT(*) FROM Tasks WHERE task_status = 'missed' GROUP BY habit_id")
+    return dict(cursor.fetchall())
+
+@timed(ANALYTICS_SECONDS)
 def get_habit_completion_correlation(cursor) -> Dict[Tuple[str, str], float]:
     """Estimate correlation between pairs of habits based on same-day completions."""
     cursor.execute("SELECT habit_id, task_log_date FROM Tasks WHERE task_status = 'completed'")
     completions = cursor.fetchall()
+    ROWS.labels("completion_correlation").inc(len(completions))
     date_habits = defaultdict(set)
     for habit_id, date in completions:
         date_habits[date].add(habit_id)
@@ -157,18 +218,20 @@ def get_habit_completion_correlation(cursor) -> Dict[Tuple[str, str], float]:
     for (h1, h2), count in pair_counts.items():
         total = habit_counts[h1] + habit_counts[h2] - count
         correlations[(h1, h2)] = round(count / total, 2) if total else 0.0
-    logger.info(f"Habit correlations: {correlations}")
+    logger.debug(f"Habit correlations: {len(correlations)} pairs from {len(completions)} completions")
     return correlations
 
-def suggest_habits_to_focus(cursor, user_id: int = None) -> List[str]:
-    """Suggest habits to focus on: most missed or lowest streak."""
-    cursor.execute("SELECT habit_name, streak FROM Habits WHERE habit_status = 'active'")
-    habits = cursor.fetchall()
-    if not habits:
-        return []
-    habits_sorted = sorted(habits, key=lambda x: x[1])
-    suggestions = [h[0] for h in habits_sorted[:3]]
-    logger.info(f"Suggested habits to focus: {suggestions}")
+@timed(ANALYTICS_SECONDS)
+def suggest_habits_to_focus(cursor, user_id: int = None, model=None, top_k: int = 3) -> List[str]:
+    """
+    Suggest the habits most likely to break their streak next period.
+    Pass a loaded StreakRiskModel (e.g. one registered as a MyHabits listener) to
+    skip rebuilding it from the database.
+    """
+    model = model or StreakRiskModel().load(cursor)
+    ranked = model.top_risks(top_k)
+    suggestions = [name for _, name, _ in ranked]
+    logger.debug(f"Suggested habits to focus: {len(suggestions)} of top {top_k}")
     return suggestions
 
 if __name__ == "__main__":
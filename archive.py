@@ -0,0 +1,176 @@
+"""
+Hot/cold partitioning of Tasks.
+Tasks older than a horizon are moved in batches into an ATTACHed archive database
+file, and per-habit totals for what was moved are kept in ArchivedHabitSummary in
+the hot database. DailyRollup, PointsLedger and the HabitSearch index are left
+untouched, so heatmaps, calendars, points and note search keep their history. Readers that need every Task use the
+TEMP view AllTasks (see history_source), which unions the hot and cold tables.
+"""
+import json
+import logging
+import os
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+from clock import get_clock
+from db import retry_on_busy
+from metrics import ROWS
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FILE = "my_habits_archive.db"
+ARCHIVE_SCHEMA = "archive"
+DEFAULT_HORIZON_DAYS = 365
+# Completion writes look back one week for duplicates, and streak checks one period
+MIN_HORIZON_DAYS = 14
+
+def _task_columns(cursor):
+    return [row[1] for row in cursor.execute("PRAGMA main.table_info(Tasks)")]
+
+def is_attached(cursor) -> bool:
+    return any(row[1] == ARCHIVE_SCHEMA for row in cursor.execute("PRAGMA database_list"))
+
+def history_source(cursor) -> str:
+    """Table or view to read for full Task history: AllTasks when the archive is attached."""
+    found = cursor.execute("SELECT 1 FROM sqlite_temp_master WHERE type = 'view' AND name = 'AllTasks'").fetchone()
+    return "AllTasks" if found else "Tasks"
+
+def attach_archive(connection, path: str = ARCHIVE_FILE):
+    """
+    Attach the archive database (created on first use) and define the AllTasks view.
+    Commits any open transaction, since ATTACH cannot run inside one.
+    """
+    cursor = connection.cursor()
+    if is_attached(cursor):
+        return
+    connection.commit()
+    cursor.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (os.fspath(path),))
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.Tasks (
+            task_id INTEGER PRIMARY KEY,
+            habit_id INTEGER NOT NULL,
+            task_name TEXT NOT NULL,
+            periodicity TEXT NOT NULL,
+            task_log_date TEXT NOT NULL,
+            streak INTEGER NOT NULL DEFAULT 0,
+            task_status TEXT NOT NULL,
+            mood INTEGER,
+            notes TEXT,
+            completion_time INTEGER
+        );
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {ARCHIVE_SCHEMA}.idx_archive_tasks_habit ON Tasks(habit_id, task_log_date)")
+    columns = ", ".join(_task_columns(cursor))
+    cursor.execute(f"""
+        CREATE TEMP VIEW IF NOT EXISTS AllTasks AS
+        SELECT {columns} FROM main.Tasks
+        UNION ALL
+        SELECT {columns} FROM {ARCHIVE_SCHEMA}.Tasks
+    """)
+    connection.commit()
+    logger.info(f"Archive attached: {path}")
+
+def detach_archive(connection):
+    cursor = connection.cursor()
+    if not is_attached(cursor):
+        return
+    connection.commit()
+    cursor.execute("DROP VIEW IF EXISTS temp.AllTasks")
+    cursor.execute(f"DETACH DATABASE {ARCHIVE_SCHEMA}")
+
+def archive_tasks(connection, horizon_days: int = DEFAULT_HORIZON_DAYS, batch_size: int = 500,
+                  today: Optional[date] = None, path: str = ARCHIVE_FILE) -> int:
+    """
+    Move Tasks logged more than `horizon_days` ago into the archive, `batch_size` rows
+    per transaction so writers are only ever blocked for one short batch.
+
+    Returns:
+        int: Number of Tasks moved
+    """
+    if horizon_days < MIN_HORIZON_DAYS:
+        raise ValueError(f"Horizon must be at least {MIN_HORIZON_DAYS} days")
+    attach_archive(connection, path)
+    cutoff = ((today or get_clock().today()) - timedelta(days=horizon_days)).isoformat()
+    columns = ", ".join(_task_columns(connection.cursor()))
+
+    def move_batch():
+        cursor = connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            ids = [row[0] for row in cursor.execute(
+                "SELECT task_id FROM main.Tasks WHERE task_log_date < ? ORDER BY task_log_date LIMIT ?",
+                (cutoff, batch_size))]
+            if ids:
+                batch = json.dumps(ids)
+                in_batch = "task_id IN (SELECT value FROM json_each(?))"
+                cursor.execute(f"""
+                    INSERT INTO {ARCHIVE_SCHEMA}.Tasks ({columns})
+                    SELECT {columns} FROM main.Tasks WHERE {in_batch}
+                """, (batch,))
+                cursor.execute(f"""
+                    INSERT INTO ArchivedHabitSummary
+                        (habit_id, task_count, completed, skipped, missed, best_streak, first_date, last_date)
+                    SELECT habit_id, COUNT(*), SUM(task_status = 'completed'), SUM(task_status = 'skipped'),
+                           SUM(task_status = 'missed'), MAX(streak), MIN(task_log_date), MAX(task_log_date)
+                    FROM main.Tasks WHERE {in_batch}
+                    GROUP BY habit_id
+                    ON CONFLICT(habit_id) DO UPDATE SET
+                        task_count = task_count + excluded.task_count,
+                        completed = completed + excluded.completed,
+                        skipped = skipped + excluded.skipped,
+                        missed = missed + excluded.missed,
+                        best_streak = MAX(best_streak, excluded.best_streak),
+                        first_date = MIN(COALESCE(first_date, excluded.first_date), excluded.first_date),
+                        last_date = MAX(COALESCE(last_date, excluded.last_date), excluded.last_date)
+                """, (batch,))
+                # The rows are not gone from history, so the rollup and search index must keep them
+                cursor.execute("INSERT OR REPLACE INTO MaintenanceFlags (name) VALUES ('archiving')")
+                cursor.execute(f"DELETE FROM main.Tasks WHERE {in_batch}", (batch,))
+                cursor.execute("DELETE FROM MaintenanceFlags WHERE name = 'archiving'")
+            connection.commit()
+            return len(ids)
+        except Exception:
+            connection.rollback()
+            raise
+
+    moved = 0
+    while True:
+        count = retry_on_busy(move_batch)
+        moved += count
+        if count < batch_size:
+            break
+    ROWS.labels("archive").inc(moved)
+    logger.info(f"Archived {moved} tasks logged before {cutoff}")
+    return moved
+
+def habit_totals(cursor) -> Dict[int, Dict]:
+    """
+    Full-history per-habit totals from the hot Tasks plus ArchivedHabitSummary;
+    never reads the archive itself.
+
+    Returns:
+        dict: habit_id -> task_count, completed, skipped, missed, best_streak, first_date, last_date
+    """
+    totals: Dict[int, Dict] = {}
+    rows = cursor.execute("""
+        SELECT habit_id, COUNT(*), SUM(task_status = 'completed'), SUM(task_status = 'skipped'),
+               SUM(task_status = 'missed'), MAX(streak), MIN(task_log_date), MAX(task_log_date)
+        FROM main.Tasks GROUP BY habit_id
+        UNION ALL
+        SELECT habit_id, task_count, completed, skipped, missed, best_streak, first_date, last_date
+        FROM ArchivedHabitSummary
+    """)
+    for habit_id, count, completed, skipped, missed, best, first, last in rows:
+        entry = totals.get(habit_id)
+        if entry is None:
+            totals[habit_id] = {"task_count": count, "completed": completed, "skipped": skipped, "missed": missed,
+                                "best_streak": best, "first_date": first, "last_date": last}
+            continue
+        entry["task_count"] += count
+        entry["completed"] += completed
+        entry["skipped"] += skipped
+        entry["missed"] += missed
+        entry["best_streak"] = max(entry["best_streak"], best)
+        entry["first_date"] = min(d for d in (entry["first_date"], first) if d)
+        entry["last_date"] = max(d for d in (entry["last_date"], last) if d)
+    return totals
@@ -0,0 +1,105 @@
+"""
+Online backups, restores and in-memory snapshots via the sqlite3 backup API.
+Pages are copied a few at a time with a pause between steps, so writers on the
+live database are never blocked for the whole copy. Backups are written to a
+temporary file and renamed into place, so a backup file is never torn.
+"""
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from db import DB_FILE
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = "backups"
+BACKUP_PREFIX = "my_habits-"
+DEFAULT_KEEP = 7
+
+def _copy(source, target, pages: int, throttle: float,
+          progress: Optional[Callable[[int, int], None]] = None):
+    """Copy `source` into `target` `pages` pages per step, sleeping `throttle` seconds between steps."""
+    def step(status, remaining, total):
+        if progress is not None:
+            progress(total - remaining, total)
+        if remaining and throttle:
+            time.sleep(throttle)
+    source.backup(target, pages=pages, progress=step)
+
+def list_backups(directory: str = BACKUP_DIR) -> List[str]:
+    """Backup files in `directory`, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(n for n in os.listdir(directory) if n.startswith(BACKUP_PREFIX) and n.endswith(".db"))
+    return [os.path.join(directory, n) for n in names]
+
+def rotate_backups(directory: str = BACKUP_DIR, keep: int = DEFAULT_KEEP) -> List[str]:
+    """Delete all but the newest `keep` backups; returns the paths removed."""
+    backups = list_backups(directory)
+    removed = backups[:-keep] if keep > 0 else backups
+    for path in removed:
+        os.remove(path)
+        logger.info(f"Removed old backup: {path}")
+    return removed
+
+def backup_database(connection, directory: str = BACKUP_DIR, keep: int = DEFAULT_KEEP,
+                    pages: int = 256, throttle: float = 0.005,
+                    progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """
+    Write a consistent online backup of `connection` to a timestamped file in `directory`,
+    then keep only the newest `keep` backups.
+
+    Returns:
+        str: Path of the new backup
+    """
+    os.makedirs(directory, exist_ok=True)
+    # Microsecond stamps keep file names unique and in chronological order
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    path = os.path.join(directory, f"{BACKUP_PREFIX}{stamp}.db")
+
+    partial = path + ".partial"
+    target = sqlite3.connect(partial)
+    try:
+        _copy(connection, target, pages, throttle, progress)
+    except Exception:
+        target.close()
+        os.remove(partial)
+        raise
+    target.close()
+    os.replace(partial, path)
+    logger.info(f"Backup written: {path}")
+    rotate_backups(directory, keep)
+    return path
+
+def restore_database(backup_path: str, db_file: str = DB_FILE, pages: int = 256, throttle: float = 0.0):
+    """
+    Replace the contents of `db_file` with `backup_path` through the backup API,
+    so open connections see the restored data instead of a swapped-out file.
+    The backup is integrity-checked first.
+    """
+    source = sqlite3.connect(f"file:{backup_path}?mode=ro", uri=True)
+    try:
+        result = source.execute("PRAGMA integrity_check").fetchone()[0]
+        if result != "ok":
+            raise ValueError(f"Backup {backup_path} failed integrity check: {result}")
+        target = sqlite3.connect(db_file)
+        try:
+            _copy(source, target, pages, throttle)
+        finally:
+            target.close()
+    finally:
+        source.close()
+    logger.info(f"Restored {db_file} from {backup_path}")
+
+def snapshot_to_memory(connection) -> sqlite3.Connection:
+    """
+    Copy the live database into a private in-memory connection, e.g. to run
+    analytics (analytics.use_connection) without holding locks on the file.
+    """
+    snapshot = sqlite3.connect(":memory:")
+    connection.backup(snapshot)
+    snapshot.execute("PRAGMA foreign_keys = ON;")
+    return snapshot
@@ -0,0 +1,107 @@
+"""
+Category-level analytics.
+Completion, skip, miss and mood totals come from CategoryDailyRollup, points from
+the (category_id, event_date) covering index on PointsLedger, and streaks and
+expected periods from the small Habits table, so no query here scans Tasks.
+"""
+import logging
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from clock import DateLike, get_clock, period_key, to_date
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the streak distribution buckets
+STREAK_BUCKETS = [(0, "0"), (2, "1-2"), (6, "3-6"), (13, "7-13"), (29, "14-29"), (None, "30+")]
+UNCATEGORIZED = 0
+
+def resolve_category(cursor, value: str) -> Optional[int]:
+    """Category id from an id or a (case-insensitive) name."""
+    if value.strip().isdigit():
+        found = cursor.execute("SELECT id FROM Categories WHERE id = ?", (int(value),)).fetchone()
+    else:
+        found = cursor.execute("SELECT id FROM Categories WHERE name = ? COLLATE NOCASE", (value.strip(),)).fetchone()
+    return found[0] if found else None
+
+def _bucket(streak: int) -> str:
+    for bound, label in STREAK_BUCKETS:
+        if bound is None or streak <= bound:
+            return label
+    return STREAK_BUCKETS[-1][1]
+
+def _expected_units(habit_period: str, created: date, start: date, end: date) -> int:
+    lo, hi = max(start, created), end
+    if lo > hi:
+        return 0
+    return period_key(hi, habit_period) - period_key(lo, habit_period) + 1
+
+def get_category_summary(cursor, start_date: DateLike, end_date: DateLike,
+                         category_id: Optional[int] = None,
+                         today: Optional[DateLike] = None) -> Dict[int, Dict]:
+    """
+    Per-category totals over [start_date, end_date].
+
+    Returns:
+        dict: category_id (0 = uncategorized) -> name, habits, completed, skipped,
+            missed, expected, completion_rate, avg_mood, points, streak_distribution
+    """
+    start, end = to_date(start_date), to_date(end_date)
+    end = min(end, to_date(today or get_clock().today()))
+    names = dict(cursor.execute("SELECT id, name FROM Categories").fetchall())
+
+    summary: Dict[int, Dict] = {}
+
+    def entry(cid):
+        if cid not in summary:
+            summary[cid] = {"name": names.get(cid, "Uncategorized"), "habits": 0, "completed": 0, "skipped": 0,
+                            "missed": 0, "expected": 0, "completion_rate": None, "avg_mood": None, "points": 0,
+                            "streak_distribution": {label: 0 for _, label in STREAK_BUCKETS}}
+        return summary[cid]
+
+    habit_query = """
+        SELECT COALESCE(category_id, 0), habit_period, creation_date, streak FROM Habits
+        WHERE habit_status = 'active'
+    """
+    rollup_query = """
+        SELECT category_id, SUM(completed), SUM(skipped), SUM(missed), SUM(mood_total), SUM(mood_count)
+        FROM CategoryDailyRollup WHERE day BETWEEN ? AND ?
+    """
+    points_query = """
+        SELECT COALESCE(category_id, 0), SUM(points) FROM PointsLedger
+        WHERE event_date BETWEEN ? AND ?
+    """
+    params: list = [start.isoformat(), end.isoformat()]
+    if category_id is not None:
+        # category_id is the leading column of idx_habits_category and of both rollup/points indexes
+        habit_query += " AND category_id = ?"
+        rollup_query += " AND category_id = ?"
+        points_query = points_query.replace("WHERE event_date", "WHERE category_id = ? AND event_date")
+    for cid, period, created, streak in cursor.execute(habit_query, [category_id] if category_id is not None else []):
+        item = entry(cid)
+        item["habits"] += 1
+        item["expected"] += _expected_units(period, to_date(created), start, end)
+        item["streak_distribution"][_bucket(streak or 0)] += 1
+
+    rollup_params = params + ([category_id] if category_id is not None else [])
+    for cid, completed, skipped, missed, mood_total, mood_count in cursor.execute(rollup_query + " GROUP BY category_id", rollup_params):
+        item = entry(cid)
+        item.update(completed=completed, skipped=skipped, missed=missed,
+                    avg_mood=round(mood_total / mood_count, 2) if mood_count else None)
+
+    points_params = ([category_id] if category_id is not None else []) + params
+    for cid, points in cursor.execute(points_query + " GROUP BY 1", points_params):
+        entry(cid)["points"] = points
+
+    for item in summary.values():
+        if item["expected"]:
+            item["completion_rate"] = round(min(item["completed"], item["expected"]) / item["expected"], 3)
+    return summary
+
+def get_category_daily(cursor, category_id: int, start_date: DateLike,
+                       end_date: DateLike) -> List[Tuple[str, int, int, int]]:
+    """(day, completed, skipped, missed) for one category, days with activity only."""
+    return cursor.execute("""
+        SELECT day, completed, skipped, missed FROM CategoryDailyRollup
+        WHERE category_id = ? AND day BETWEEN ? AND ? ORDER BY day
+    """, (category_id, to_date(start_date).isoformat(), to_date(end_date).isoformat())).fetchall()
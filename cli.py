@@ -1,7 +1,22 @@
+import sqlite3
 import typer
 from typing import Optional
 from models import Habit, Difficulty, HabitStatus
-from db import create_connection
+from db import create_connection, create_rollup_tables, create_tables
+from rollup import rebuild_daily_rollup, get_daily_heatmap, render_heatmap
+from search import search_habits, resolve_habit_id, find_habits
+from points import recompute_points, get_leaderboard, get_category_leaderboard, get_total_points
+from reports import build_reports, recent_periods, render_report, write_reports
+from archive import archive_tasks, ARCHIVE_FILE, DEFAULT_HORIZON_DAYS
+from backup import backup_database, restore_database, list_backups, BACKUP_DIR, DEFAULT_KEEP
+from sync import sync as sync_databases
+from sweeper import sweep_missed_periods
+from categories import resolve_category, get_category_summary
+from forecast import StreakRiskModel
+from clock import get_clock
+from history import OPEN, as_of, habit_versions
+from metrics import configure_from_env
+from datetime import timedelta
 import logging
 
 app = typer.Typer()
@@ -58,11 +73,22 @@ def add_habit(
         connection.close()
 
 @app.command()
-def list_habits(status: str = typer.Option("active", help="Status: active, inactive, archived")):
+def list_habits(status: str = typer.Option("active", help="Status: active, inactive, archived"),
+                category: Optional[str] = typer.Option(None, help="Only habits in this category (ID or name)")):
     """List habits by status."""
     connection = create_connection()
     cursor = connection.cursor()
-    cursor.execute("SELECT id, habit_name, habit_period, description, streak, best_streak, points FROM Habits WHERE habit_status = ?", (status,))
+    query = "SELECT id, habit_name, habit_period, description, streak, best_streak, points FROM Habits WHERE habit_status = ?"
+    params: list = [status]
+    if category is not None:
+        category_id = resolve_category(cursor, category)
+        if category_id is None:
+            typer.echo(f"No category '{category}' found.")
+            connection.close()
+            return
+        query += " AND category_id = ?"  # served by idx_habits_category
+        params.append(category_id)
+    cursor.execute(query, params)
     habits = cursor.fetchall()
     if not habits:
         typer.echo(f"No {status} habits found.")
@@ -71,11 +97,47 @@ def list_habits(status: str = typer.Option("active", help="Status: active, inact
             typer.echo(f"ID: {h[0]}, Name: {h[1]}, Period: {h[2]}, Desc: {h[3]}, Streak: {h[4]}, Best: {h[5]}, Points: {h[6]}")
     connection.close()
 
+def _resolve(cursor, habit: str) -> Optional[int]:
+    """Accept either a numeric habit ID or a (possibly partial) habit name."""
+    if habit.isdigit():
+        return int(habit)
+    habit_id = resolve_habit_id(cursor, habit)
+    if habit_id is None:
+        candidates = find_habits(cursor, habit)
+        if candidates:
+            typer.echo("Ambiguous habit name, did you mean: " + ", ".join(f"{n} (ID {i})" for i, n in candidates))
+    return habit_id
+
+def _resolve_for_write(cursor, habit: str, yes: bool) -> Optional[int]:
+    """
+    Resolve a habit for a destructive command: a numeric ID or an exact
+    (case-insensitive) name. A partial or misspelt name lists its candidates
+    and is only used after confirmation (or --yes) when it names a single habit.
+    """
+    if habit.isdigit():
+        return int(habit)
+    exact = cursor.execute("SELECT id FROM Habits WHERE habit_name = ? COLLATE NOCASE", (habit.strip(),)).fetchone()
+    if exact:
+        return exact[0]
+    candidates = find_habits(cursor, habit)
+    if not candidates:
+        return None
+    typer.echo(f"No habit is named '{habit}'. Candidates: " + ", ".join(f"{n} (ID {i})" for i, n in candidates))
+    if len(candidates) > 1:
+        typer.echo("Pass the habit ID to choose one.")
+        raise typer.Exit(1)
+    habit_id, name = candidates[0]
+    if not yes and not typer.confirm(f"Use '{name}' (ID {habit_id})?"):
+        raise typer.Exit(1)
+    return habit_id
+
 @app.command()
-def deactivate_habit(habit_id: int):
-    """Deactivate a habit by ID."""
+def deactivate_habit(habit: str = typer.Argument(..., help="Habit ID or exact name"),
+                     yes: bool = typer.Option(False, "--yes", "-y", help="Accept a single partial name match")):
+    """Deactivate a habit by ID or name."""
     connection = create_connection()
     cursor = connection.cursor()
+    habit_id = _resolve_for_write(cursor, habit, yes)
     cursor.execute("SELECT habit_name FROM Habits WHERE id = ?", (habit_id,))
     result = cursor.fetchone()
     if result:
@@ -87,10 +149,12 @@ def deactivate_habit(habit_id: int):
     connection.close()
 
 @app.command()
-def delete_habit(habit_id: int):
-    """Delete a habit by ID."""
+def delete_habit(habit: str = typer.Argument(..., help="Habit ID or exact name"),
+                 yes: bool = typer.Option(False, "--yes", "-y", help="Accept a single partial name match")):
+    """Delete a habit by ID or name."""
     connection = create_connection()
     cursor = connection.cursor()
+    habit_id = _resolve_for_write(cursor, habit, yes)
     cursor.execute("SELECT habit_name FROM Habits WHERE id = ?", (habit_id,))
     result = cursor.fetchone()
     if result:
@@ -101,5 +165,230 @@ def delete_habit(habit_id: int):
         typer.echo("Habit not found.")
     connection.close()
 
+@app.command()
+def search(query: str = typer.Argument(..., help="Words to look for"),
+           limit: int = typer.Option(10, help="Maximum number of habits to show")):
+    """Search habit names, descriptions and task notes."""
+    connection = create_connection()
+    cursor = connection.cursor()
+    results = search_habits(cursor, query, limit)
+    if not results:
+        typer.echo(f"No habits match '{query}'.")
+    for habit_id, name, _, snippet in results:
+        typer.echo(f"ID: {habit_id}, Name: {name} … {snippet}")
+    connection.close()
+
+@app.command()
+def rebuild_rollup():
+    """Rebuild the daily rollup table from the full Task history."""
+    connection = create_connection()
+    cursor = connection.cursor()
+    create_rollup_tables(cursor)
+    written = rebuild_daily_rollup(cursor)
+    connection.commit()
+    typer.echo(f"Daily rollup rebuilt ({written} rows).")
+    connection.close()
+
+@app.command()
+def heatmap(days: int = typer.Option(28, help="Number of days to show, ending today")):
+    """Show a per-habit completion heatmap for recent days."""
+    connection = create_connection()
+    cursor = connection.cursor()
+    end = get_clock().today()
+    start = end - timedelta(days=days - 1)
+    cursor.execute("SELECT id, habit_name FROM Habits WHERE habit_status = 'active'")
+    labels = dict(cursor.fetchall())
+    grid = get_daily_heatmap(cursor, start, end, habit_ids=labels)
+    if not grid:
+        typer.echo("No active habits found.")
+    else:
+        typer.echo(f"Completions {start} to {end}:")
+        typer.echo(render_heatmap(grid, labels))
+    connection.close()
+
+@app.command("recompute-points")
+def recompute_points_cmd():
+    """Rebuild the points ledger and totals from the full Task history."""
+    connection = create_connection()
+    cursor = connection.cursor()
+    total = recompute_points(cursor)
+    connection.commit()
+    typer.echo(f"Points recomputed. Total: {total}")
+    connection.close()
+
+@app.command()
+def leaderboard(
+    start: Optional[str] = typer.Option(None, help="Start date (YYYY-MM-DD)"),
+    end: Optional[str] = typer.Option(None, help="End date (YYYY-MM-DD)"),
+    category_id: Optional[int] = typer.Option(None, help="Only habits in this category"),
+    by_category: bool = typer.Option(False, help="Rank categories instead of habits"),
+    limit: int = typer.Option(10, help="Number of habits to show")
+):
+    """Show habits (or categories) ranked by points earned."""
+    connection = create_connection()
+    cursor = connection.cursor()
+    if by_category:
+        rows = get_category_leaderboard(cursor, start, end)
+    else:
+        rows = get_leaderboard(cursor, start, end, category_id, limit)
+    if not rows:
+        typer.echo("No points recorded yet.")
+    for rank, (_, name, points) in enumerate(rows, 1):
+        typer.echo(f"{rank:>2}. {name:<20} {points} pts")
+    typer.echo(f"Total points: {get_total_points(cursor)}")
+    connection.close()
+
+@app.command()
+def report(
+    period: str = typer.Option("weekly", help="Period: weekly or monthly"),
+    count: int = typer.Option(1, help="Number of periods, ending with the current one"),
+    fmt: str = typer.Option("text", "--format", help="Format: text, markdown or json"),
+    out_dir: Optional[str] = typer.Option(None, help="Write one file per period here instead of printing")
+):
+    """Show (or write) weekly/monthly summary reports."""
+    connection = create_connection()
+    cursor = connection.cursor()
+    try:
+        start, end = recent_periods(period, count)
+        reports = build_reports(cursor, period, start, end)
+        if out_dir:
+            paths = write_reports(reports, out_dir, fmt)
+            typer.echo(f"Wrote {len(paths)} reports to {out_dir}")
+        else:
+            for item in reports:
+                typer.echo(render_report(item, fmt))
+    except ValueError as e:
+        typer.echo(f"Error: {e}")
+    finally:
+        connection.close()
+
+@app.command()
+def archive(
+    horizon_days: int = typer.Option(DEFAULT_HORIZON_DAYS, help="Archive tasks logged more than this many days ago"),
+    batch_size: int = typer.Option(500, help="Tasks moved per transaction"),
+    archive_file: str = typer.Option(ARCHIVE_FILE, help="Archive database file")
+):
+    """Move old tasks into the archive database."""
+    connection = create_connection()
+    try:
+        moved = archive_tasks(connection, horizon_days, batch_size, path=archive_file)
+        typer.echo(f"Archived {moved} tasks to {archive_file}.")
+    except ValueError as e:
+        typer.echo(f"Error: {e}")
+    finally:
+        connection.close()
+
+@app.command()
+def backup(
+    directory: str = typer.Option(BACKUP_DIR, help="Directory for backup files"),
+    keep: int = typer.Option(DEFAULT_KEEP, help="Number of backups to retain"),
+    pages: int = typer.Option(256, help="Pages copied per step")
+):
+    """Take an online backup of the database."""
+    connection = create_connection()
+    path = backup_database(connection, directory, keep, pages)
+    typer.echo(f"Backup written to {path} ({len(list_backups(directory))} kept).")
+    connection.close()
+
+@app.command()
+def restore(backup_file: str = typer.Argument(..., help="Backup file to restore from")):
+    """Restore the database from a backup file."""
+    if not typer.confirm(f"Replace the current database with {backup_file}?"):
+        raise typer.Abort()
+    try:
+        restore_database(backup_file)
+        typer.echo("Database restored.")
+    except (ValueError, sqlite3.Error) as e:
+        typer.echo(f"Error: {e}")
+
+@app.command()
+def sync(peer_db: str = typer.Argument(..., help="Peer database file to sync with")):
+    """Exchange changes with another tracker database."""
+    connection = create_connection()
+    peer = create_connection(peer_db)
+    for conn in (connection, peer):
+        create_tables(conn.cursor())
+        conn.commit()
+    stats = sync_databases(connection, peer)
+    typer.echo(f"Received {stats['pulled']['applied']} changes, sent {stats['pushed']['applied']}.")
+    peer.close()
+    connection.close()
+
+@app.command()
+def sweep():
+    """Mark elapsed periods without any task as missed (safe to run repeatedly, e.g. from cron)."""
+    connection = create_connection()
+    inserted = sweep_missed_periods(connection)
+    typer.echo(f"Marked {inserted} missed periods.")
+    connection.close()
+
+@app.command()
+def categories(
+    start: Optional[str] = typer.Option(None, help="Start date (YYYY-MM-DD), default 30 days ago"),
+    end: Optional[str] = typer.Option(None, help="End date (YYYY-MM-DD), default today"),
+    category: Optional[str] = typer.Option(None, help="Only this category (ID or name)")
+):
+    """Show completion rates, misses, points and streaks per category."""
+    connection = create_connection()
+    cursor = connection.cursor()
+    today = get_clock().today()
+    end_date = end or today.isoformat()
+    start_date = start or (today - timedelta(days=29)).isoformat()
+    category_id = resolve_category(cursor, category) if category is not None else None
+    if category is not None and category_id is None:
+        typer.echo(f"No category '{category}' found.")
+    else:
+        summary = get_category_summary(cursor, start_date, end_date, category_id)
+        if not summary:
+            typer.echo("No category activity found.")
+        for item in summary.values():
+            rate = f"{item['completion_rate']:.0%}" if item["completion_rate"] is not None else "-"
+            streaks = ", ".join(f"{k}: {v}" for k, v in item["streak_distribution"].items() if v)
+            typer.echo(f"{item['name']:<15} habits {item['habits']:<3} done {item['completed']}/{item['expected']} ({rate}) "
+                       f"missed {item['missed']} points {item['points']} streaks [{streaks}]")
+    connection.close()
+
+@app.command()
+def focus(top: int = typer.Option(3, help="Number of habits to show")):
+    """Show the habits most at risk of missing their next period."""
+    connection = create_connection()
+    model = StreakRiskModel().load(connection.cursor())
+    components = model.risks()
+    ranked = model.top_risks(top)
+    if not ranked:
+        typer.echo("No active habits.")
+    for habit_id, name, risk in ranked:
+        row = model.rows[habit_id]
+        typer.echo(f"{name:<20} miss risk {risk:.0%}  (cadence {components['cadence'][row]:.0%}, "
+                   f"after last period {components['transition'][row]:.0%}, gap {components['gap'][row]:.0%})")
+    connection.close()
+
+@app.command("as-of")
+def as_of_cmd(day: str = typer.Argument(..., help="Date (YYYY-MM-DD)"),
+              habit: Optional[str] = typer.Option(None, help="Show every recorded version of this habit (ID or name)")):
+    """Show habits as they stood at the end of a past date."""
+    connection = create_connection()
+    cursor = connection.cursor()
+    view = as_of(cursor, day)
+    if habit is not None:
+        habit_id = _resolve(cursor, habit)
+        versions = habit_versions(cursor, habit_id) if habit_id is not None else []
+        if not versions:
+            typer.echo(f"No history for habit '{habit}'.")
+        for v in versions:
+            marker = "*" if v.valid_from <= view.day.isoformat() < v.valid_to else " "
+            until = "now" if v.valid_to == OPEN else v.valid_to
+            typer.echo(f"{marker} {v.valid_from} .. {until:<10} {v.habit_name} ({v.habit_period}, {v.habit_status}) "
+                       f"streak {v.streak} best {v.best_streak} points {v.points}")
+    else:
+        habits = view.habits(status=None)
+        if not habits:
+            typer.echo(f"No habits existed on {day}.")
+        for v in habits:
+            typer.echo(f"ID: {v.habit_id}, Name: {v.habit_name}, Period: {v.habit_period}, Status: {v.habit_status}, "
+                       f"Streak: {v.streak}, Points: {v.points}")
+    connection.close()
+
 if __name__ == "__main__":
+    configure_from_env()
     app()
@@ -0,0 +1,160 @@
+"""
+Clock and period-boundary service.
+Every module gets "now", "today", period keys and period bounds from here instead
+of calling datetime.now()/strptime itself. A Clock carries the user's time zone and
+day-rollover hour (e.g. 4 = completions before 4am count for the previous day).
+FrozenClock pins time for tests and benchmarks. PeriodContext computes a request's
+boundaries once from a single clock reading.
+"""
+import logging
+import os
+from datetime import date, datetime, timedelta, tzinfo
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple, Union
+from zoneinfo import ZoneInfo
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DateLike = Union[str, date]
+
+@lru_cache(maxsize=8192)
+def parse_date(text: str) -> date:
+    """Date of a 'YYYY-MM-DD[ HH:MM:SS]' string (cached: the same dates recur constantly)."""
+    return date.fromisoformat(text[:10])
+
+REGISTRY.watch_cache("parse_date", parse_date)
+
+def to_date(value: DateLike) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return parse_date(value)
+
+def period_key(day: DateLike, period: str) -> int:
+    """Consecutive periods have consecutive keys (days, or weeks starting Monday)."""
+    day = to_date(day)
+    ordinal = day.toordinal()
+    return (ordinal - day.weekday()) // 7 if period == "weekly" else ordinal
+
+def period_start(day: DateLike, period: str) -> date:
+    day = to_date(day)
+    if period == "weekly":
+        return day - timedelta(days=day.weekday())
+    if period == "monthly":
+        return day.replace(day=1)
+    return day
+
+def period_bounds(day: DateLike, period: str) -> Tuple[date, date]:
+    """First and last day (inclusive) of the day, week (Monday first) or month containing `day`."""
+    start = period_start(day, period)
+    if period == "weekly":
+        return start, start + timedelta(days=6)
+    if period == "monthly":
+        return start, (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    if period == "daily":
+        return start, start
+    raise ValueError("Period must be one of: daily, weekly, monthly")
+
+def last_elapsed_day(period: str, today: date) -> date:
+    """Last day of the most recent period that is over: yesterday, or last Sunday for weekly habits."""
+    return period_start(today, period) - timedelta(days=1)
+
+class Clock:
+    def __init__(self, tz: Optional[Union[str, tzinfo]] = None, rollover_hour: int = 0,
+                 source: Optional[Callable[[], datetime]] = None):
+        """
+        Args:
+            tz: IANA zone name or tzinfo for the user's wall clock (default: system local time)
+            rollover_hour: Hour at which a new day starts for habit purposes (0-23)
+            source: Returns the current time; aware datetimes are converted to `tz`
+        """
+        if not 0 <= rollover_hour < 24:
+            raise ValueError("Rollover hour must be between 0 and 23")
+        self.tz = ZoneInfo(tz) if isinstance(tz, str) else tz
+        self.rollover = timedelta(hours=rollover_hour)
+        self._source = source
+
+    @classmethod
+    def from_env(cls) -> "Clock":
+        """Clock configured by HABIT_TZ and HABIT_DAY_ROLLOVER_HOUR."""
+        return cls(os.environ.get("HABIT_TZ") or None, int(os.environ.get("HABIT_DAY_ROLLOVER_HOUR", "0")))
+
+    def now(self) -> datetime:
+        """Current naive wall-clock time in the clock's zone (the form stored in the database)."""
+        if self._source is not None:
+            moment = self._source()
+        else:
+            moment = datetime.now(self.tz) if self.tz else datetime.now()
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(self.tz).replace(tzinfo=None) if self.tz else moment.astimezone().replace(tzinfo=None)
+        return moment
+
+    def timestamp(self, moment: datetime) -> float:
+        """POSIX time of a naive wall-clock moment in the clock's zone."""
+        return (moment.replace(tzinfo=self.tz) if self.tz else moment).timestamp()
+
+    def from_timestamp(self, stamp: float) -> datetime:
+        """Naive wall-clock moment in the clock's zone of a POSIX time."""
+        return datetime.fromtimestamp(stamp, self.tz).replace(tzinfo=None) if self.tz else datetime.fromtimestamp(stamp)
+
+    def day_of(self, moment: datetime) -> date:
+        """Habit day a wall-clock moment belongs to, honouring the rollover hour."""
+        return (moment - self.rollover).date()
+
+    def today(self) -> date:
+        return self.day_of(self.now())
+
+    def context(self) -> "PeriodContext":
+        return PeriodContext(self.now(), self)
+
+class FrozenClock(Clock):
+    """Clock stuck at a fixed moment until advanced."""
+
+    def __init__(self, moment: datetime, tz: Optional[Union[str, tzinfo]] = None, rollover_hour: int = 0):
+        super().__init__(tz, rollover_hour, source=lambda: self.moment)
+        self.moment = moment
+
+    def advance(self, **delta) -> datetime:
+        self.moment += timedelta(**delta)
+        return self.moment
+
+class PeriodContext:
+    """Boundaries for one request, all derived from a single clock reading."""
+    __slots__ = ("now", "today", "week_start", "week_end", "_clock", "_windows")
+
+    def __init__(self, now: datetime, clock: Clock):
+        self.now = now
+        self.today = clock.day_of(now)
+        self.week_start, self.week_end = period_bounds(self.today, "weekly")
+        self._clock = clock
+        self._windows: Dict[int, date] = {}
+
+    def bounds(self, period: str) -> Tuple[date, date]:
+        return (self.week_start, self.week_end) if period == "weekly" else period_bounds(self.today, period)
+
+    def key(self, period: str) -> int:
+        return period_key(self.today, period)
+
+    def last_elapsed(self, period: str) -> date:
+        return last_elapsed_day(period, self.today)
+
+    def window_start(self, days: int) -> date:
+        """First day of the `days`-day window ending today."""
+        start = self._windows.get(days)
+        if start is None:
+            start = self._windows[days] = self.today - timedelta(days=days - 1)
+        return start
+
+_clock = Clock.from_env()
+
+def get_clock() -> Clock:
+    return _clock
+
+def set_clock(clock: Clock) -> Clock:
+    """Install a process-wide clock (e.g. a FrozenClock in tests); returns the previous one."""
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
@@ -0,0 +1,195 @@
+"""
+In-memory completion index: one bitset per habit, one bit per period since creation.
+Bit i of a daily habit is day creation+i; bit i of a weekly habit is the i-th ISO week
+counted from the creation week. Lookups are O(1); counts, gaps and streaks run over
+the packed bits instead of issuing SQL per habit.
+"""
+import logging
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from archive import history_source
+from clock import DateLike, get_clock, to_date
+
+logger = logging.getLogger(__name__)
+
+def _longest_run(bits: int) -> int:
+    """Length of the longest run of set bits (each pass shortens every run by one)."""
+    length = 0
+    while bits:
+        bits &= bits >> 1
+        length += 1
+    return length
+
+class HabitBits:
+    """Completion bitset for a single habit."""
+    __slots__ = ("period", "origin", "bits")
+
+    def __init__(self, period: str, creation_date: DateLike):
+        if period not in ("daily", "weekly"):
+            raise ValueError("Period must be 'daily' or 'weekly'")
+        self.period = period
+        origin = to_date(creation_date)
+        if period == "weekly":
+            origin -= timedelta(days=origin.weekday())
+        self.origin = origin
+        self.bits = bytearray()
+
+    def index_of(self, day: date) -> int:
+        days = (day - self.origin).days
+        return days if self.period == "daily" else days // 7
+
+    def set(self, day: date) -> None:
+        i = self.index_of(day)
+        if i < 0:
+            self._rebase(day)
+            i = self.index_of(day)
+        byte = i >> 3
+        if byte >= len(self.bits):
+            self.bits.extend(b"\x00" * (byte + 1 - len(self.bits)))
+        self.bits[byte] |= 1 << (i & 7)
+
+    def get(self, i: int) -> bool:
+        byte = i >> 3
+        return 0 <= i and byte < len(self.bits) and bool(self.bits[byte] >> (i & 7) & 1)
+
+    def as_int(self, stop: int) -> int:
+        """Bits [0, stop) packed into an int (bit i = period i)."""
+        if stop <= 0:
+            return 0
+        return int.from_bytes(self.bits[:(stop + 7) >> 3], "little") & ((1 << stop) - 1)
+
+    def _rebase(self, day: date) -> None:
+        # A completion logged before creation moves the origin back by whole bytes
+        shift = -self.index_of(day)
+        shift_bytes = (shift + 7) >> 3
+        step = timedelta(days=8 * shift_bytes * (1 if self.period == "daily" else 7))
+        self.origin -= step
+        self.bits[0:0] = b"\x00" * shift_bytes
+
+class CompletionIndex:
+    """
+    Per-habit completion bitsets loaded from Tasks in one streaming pass.
+
+    Register it as a MyHabits listener so completions and new habits keep it current.
+    """
+    def __init__(self):
+        self.habits: Dict[int, HabitBits] = {}
+        self._cursor = None
+
+    def load(self, cursor) -> "CompletionIndex":
+        """(Re)build the index from the Habits and Tasks tables."""
+        self._cursor = cursor
+        self.habits = {
+            habit_id: HabitBits(period, creation_date)
+            for habit_id, period, creation_date in cursor.execute(
+                "SELECT id, habit_period, creation_date FROM Habits").fetchall()
+        }
+        parsed: Dict[str, date] = {}
+        rows = 0
+        for habit_id, log_date in cursor.execute(
+                f"SELECT habit_id, task_log_date FROM {history_source(cursor)} WHERE task_status = 'completed'"):
+            habit = self.habits.get(habit_id)
+            if habit is None:
+                continue
+            day = parsed.get(log_date)
+            if day is None:
+                day = parsed[log_date] = to_date(log_date)
+            habit.set(day)
+            rows += 1
+        logger.info(f"Completion index loaded: {len(self.habits)} habits, {rows} completions")
+        return self
+
+    def reload_habit(self, habit_id: int) -> None:
+        """Rebuild a single habit's bitset, e.g. after its periodicity changed."""
+        row = self._cursor.execute(
+            "SELECT habit_period, creation_date FROM Habits WHERE id = ?", (habit_id,)).fetchone()
+        if not row:
+            self.habits.pop(habit_id, None)
+            return
+        habit = self.habits[habit_id] = HabitBits(*row)
+        for (log_date,) in self._cursor.execute(
+                f"SELECT task_log_date FROM {history_source(self._cursor)} WHERE habit_id = ? AND task_status = 'completed'",
+                (habit_id,)).fetchall():
+            habit.set(to_date(log_date))
+
+    # --- MyHabits listener hooks ---
+    def habit_added(self, habit_id, habit_period, creation_date, **_):
+        self.habits[habit_id] = HabitBits(habit_period, creation_date)
+
+    def habit_edited(self, habit_id, habit_period=None, previous_period=None, **_):
+        if habit_period and habit_period != previous_period and self._cursor is not None:
+            self.reload_habit(habit_id)
+
+    def task_completed(self, habit_id, log_date, **_):
+        self.mark(habit_id, log_date)
+
+    # --- Queries ---
+    def mark(self, habit_id: int, day: DateLike) -> None:
+        self.habits[habit_id].set(to_date(day))
+
+    def _current_index(self, habit: HabitBits, through: Optional[DateLike]) -> int:
+        return habit.index_of(to_date(through) if through else get_clock().today())
+
+    def is_done(self, habit_id: int, day: DateLike) -> bool:
+        """Whether the period containing `day` has a completion."""
+        habit = self.habits[habit_id]
+        return habit.get(habit.index_of(to_date(day)))
+
+    def completed_count(self, habit_id: int, start: Optional[DateLike] = None,
+                        end: Optional[DateLike] = None) -> int:
+        """Completed periods between start and end (inclusive), defaulting to all history."""
+        habit = self.habits[habit_id]
+        first = max(habit.index_of(to_date(start)), 0) if start else 0
+        stop = self._current_index(habit, end) + 1
+        return (habit.as_int(stop) >> first).bit_count() if stop > first else 0
+
+    def missed_count(self, habit_id: int, through: Optional[DateLike] = None) -> int:
+        """Elapsed periods without a completion; the period containing `through` is still open."""
+        habit = self.habits[habit_id]
+        stop = self._current_index(habit, through)
+        return max(stop, 0) - habit.as_int(stop).bit_count()
+
+    def longest_gap(self, habit_id: int, through: Optional[DateLike] = None) -> int:
+        """Longest run of consecutive elapsed periods without a completion."""
+        habit = self.habits[habit_id]
+        stop = self._current_index(habit, through)
+        if stop <= 0:
+            return 0
+        return _longest_run(~habit.as_int(stop) & ((1 << stop) - 1))
+
+    def current_streak(self, habit_id: int, through: Optional[DateLike] = None) -> int:
+        """
+        Consecutive completed periods ending at the current one.
+        An open current period does not break the streak.
+        """
+        habit = self.habits[habit_id]
+        current = self._current_index(habit, through)
+        stop = current + 1 if habit.get(current) else current
+        if stop <= 0:
+            return 0
+        zeros = ~habit.as_int(stop) & ((1 << stop) - 1)
+        return stop - zeros.bit_length()
+
+    def longest_streak(self, habit_id: int) -> int:
+        habit = self.habits[habit_id]
+        return _longest_run(habit.as_int(len(habit.bits) * 8))
+
+    def daily_heatmap(self, start_date: DateLike, end_date: DateLike,
+                      habit_ids: Optional[Iterable[int]] = None) -> Dict[int, List[int]]:
+        """
+        Same shape as rollup.get_daily_heatmap, answered from the bitsets.
+        Weekly habits shade every day of a completed week.
+        """
+        start, end = to_date(start_date), to_date(end_date)
+        width = (end - start).days + 1
+        grid = {}
+        for habit_id in (self.habits if habit_ids is None else habit_ids):
+            habit = self.habits[habit_id]
+            first = habit.index_of(start)
+            if habit.period == "daily":
+                grid[habit_id] = [int(habit.get(first + i)) for i in range(width)]
+            else:
+                lead = (start - habit.origin).days % 7
+                grid[habit_id] = [int(habit.get(first + (lead + i) // 7)) for i in range(width)]
+        return grid
@@ -1,5 +1,12 @@
 import sqlite3
 import logging
+import random
+import time
+from contextlib import contextmanager
+from rollup import rebuild_daily_rollup, rebuild_category_rollup, ROLLUP_MEASURES, CATEGORY_MEASURES
+from search import rebuild_search_index
+from period_status import roll_over_period_status, period_bounds_sql
+from clock import to_date
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +26,47 @@ def create_connection(db_file=DB_FILE):
         logger.error(f"Error connecting to database: {e}")
         return None
 
+# "Today" for Habits triggers: the writer's habit day if it set one (see habit_day),
+# else the database's local date, so any connection can write Habits
+HABIT_DAY_SQL = ("COALESCE((SELECT date(value * 86400, 'unixepoch') FROM MaintenanceFlags WHERE name = 'habit_day'), "
+                 "date('now', 'localtime'))")
+_EPOCH_ORDINAL = 719163  # date(1970, 1, 1).toordinal()
+
+@contextmanager
+def habit_day(cursor, day):
+    """
+    Have Habits triggers stamp `day` (the clock's habit day) for writes made in the block.
+    The flag row is removed before the writer commits, so no other connection sees it.
+    """
+    cursor.execute("INSERT OR REPLACE INTO MaintenanceFlags (name, value) VALUES ('habit_day', ?)",
+                   (to_date(day).toordinal() - _EPOCH_ORDINAL,))
+    try:
+        yield
+    finally:
+        cursor.execute("DELETE FROM MaintenanceFlags WHERE name = 'habit_day'")
+
+def is_busy_error(error):
+    """True for SQLITE_BUSY / SQLITE_LOCKED surfaced as OperationalError."""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+def retry_on_busy(operation, attempts=8, base_delay=0.005, max_delay=0.5, on_retry=None):
+    """
+    Run operation(), retrying with jittered exponential backoff while the database is busy.
+    Non-busy errors, and the last busy error once attempts run out, are re-raised.
+    """
+    for attempt in range(attempts):
+        try:
+            return operation()
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e) or attempt == attempts - 1:
+                raise
+            if on_retry is not None:
+                on_retry()
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            logger.debug(f"Database busy, retrying in up to {delay:.3f}s")
+            time.sleep(random.uniform(0, delay))
+
 def create_tables(cursor):
     """
     Create the database tables with enhanced schema.
@@ -98,6 +146,14 @@ def create_tables(cursor):
         );
     """)
 
+    # Running counters of the AchievementEngine, so startup only replays newer Tasks
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS AchievementCounters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+    """)
+
     # Insert default categories if not exists
     cursor.execute("INSERT OR IGNORE INTO Categories (id, name, description, color_code) VALUES (1, 'Health', 'Physical health and wellness', '#e74c3c')")
     cursor.execute("INSERT OR IGNORE INTO Categories (id, name, description, color_code) VALUES (2, 'Productivity', 'Work and productivity habits', '#2ecc71')")
@@ -107,3 +163,641 @@ def create_tables(cursor):
     cursor.execute("INSERT OR IGNORE INTO Achievements (id, name, description, icon, points, condition_type, condition_value, is_secret) VALUES (1, 'First Habit', 'Create your first habit', '🌱', 10, 'create_habit', 1, 0)")
     cursor.execute("INSERT OR IGNORE INTO Achievements (id, name, description, icon, points, condition_type, condition_value, is_secret) VALUES (2, 'One Week Streak', 'Complete a habit for 7 days in a row', '🔥', 20, 'streak', 7, 0)")
     cursor.execute("INSERT OR IGNORE INTO Achievements (id, name, description, icon, points, condition_type, condition_value, is_secret) VALUES (3, 'Consistency', 'Complete any habit 30 times', '🏅', 30, 'completion', 30, 0)")
+
+    create_rollup_tables(cursor)
+    create_points_tables(cursor)
+    create_search_tables(cursor)
+    create_archive_tables(cursor)
+    create_sync_tables(cursor)
+    create_sweeper_tables(cursor)
+    create_period_status_tables(cursor)
+    create_category_rollup_tables(cursor)
+    create_history_tables(cursor)
+
+    # How far each completion journal (see journal.py) has been compacted, keyed by its absolute path
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS JournalWatermark (
+            journal TEXT PRIMARY KEY,
+            applied_seq INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+
+    # Idempotency keys for completion writes (one row per accepted request)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS CompletionRequests (
+            idempotency_key TEXT PRIMARY KEY,
+            habit_id INTEGER NOT NULL,
+            task_id INTEGER,
+            created_at TEXT NOT NULL
+        );
+    """)
+
+def _rollup_delta_sql(row, sign):
+    """Build the UPSERT that applies one Task row (NEW or OLD) to DailyRollup."""
+    op = "+" if sign > 0 else "-"
+    columns = ", ".join(name for name, _ in ROLLUP_MEASURES)
+    values = ",\n            ".join(f"{sign} * {expr.format(row=row)}" for _, expr in ROLLUP_MEASURES)
+    updates = ",\n            ".join(f"{name} = {name} {op} {expr.format(row=row)}" for name, expr in ROLLUP_MEASURES)
+    return f"""
+        INSERT INTO DailyRollup (day, habit_id, {columns})
+        VALUES (
+            COALESCE(date({row}.task_log_date), substr({row}.task_log_date, 1, 10)),
+            {row}.habit_id,
+            {values}
+        )
+        ON CONFLICT(day, habit_id) DO UPDATE SET
+            {updates};
+    """
+
+_ROLLUP_CLEANUP_SQL = """
+        DELETE FROM DailyRollup
+        WHERE day = COALESCE(date(OLD.task_log_date), substr(OLD.task_log_date, 1, 10))
+          AND habit_id = OLD.habit_id
+          AND completed = 0 AND skipped = 0 AND missed = 0;
+"""
+
+_ROLLUP_TRIGGERS = ("trg_tasks_rollup_insert", "trg_tasks_rollup_delete", "trg_tasks_rollup_update")
+
+def create_rollup_tables(cursor):
+    """
+    Create the DailyRollup table and the triggers that keep it in sync with Tasks.
+    One row per (day, habit) so heatmaps and calendars never aggregate raw Task rows.
+    Besides counts it keeps sums and sums of squares of mood and completion_time,
+    so means and variances can be read without touching Tasks.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'DailyRollup'")
+    existed = cursor.fetchone() is not None
+    needs_rebuild = not existed
+
+    measures = ",\n            ".join(f"{name} INTEGER NOT NULL DEFAULT 0" for name, _ in ROLLUP_MEASURES)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS DailyRollup (
+            day TEXT NOT NULL,
+            habit_id INTEGER NOT NULL,
+            {measures},
+            PRIMARY KEY (day, habit_id)
+        ) WITHOUT ROWID;
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_daily_rollup_habit ON DailyRollup(habit_id, day)")
+
+    # Set by maintenance jobs (archiving) whose Task deletes must not touch the rollup
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS MaintenanceFlags (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 1
+        );
+    """)
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_tasks_rollup_delete'")
+    row = cursor.fetchone()
+    if row and "MaintenanceFlags" not in row[0]:
+        cursor.execute("DROP TRIGGER trg_tasks_rollup_delete")
+
+    # Older rollups lack newer measures: add them and regenerate the triggers
+    present = {row[1] for row in cursor.execute("PRAGMA table_info(DailyRollup)").fetchall()}
+    missing = [name for name, _ in ROLLUP_MEASURES if name not in present]
+    if missing:
+        for name in missing:
+            cursor.execute(f"ALTER TABLE DailyRollup ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0")
+        for trigger in _ROLLUP_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        needs_rebuild = True
+
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_rollup_insert AFTER INSERT ON Tasks
+        BEGIN
+            {_rollup_delta_sql("NEW", 1)}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_rollup_delete AFTER DELETE ON Tasks
+        WHEN NOT EXISTS (SELECT 1 FROM MaintenanceFlags WHERE name = 'archiving')
+        BEGIN
+            {_rollup_delta_sql("OLD", -1)}
+            {_ROLLUP_CLEANUP_SQL}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_rollup_update
+        AFTER UPDATE OF habit_id, task_log_date, task_status, mood, completion_time ON Tasks
+        BEGIN
+            {_rollup_delta_sql("OLD", -1)}
+            {_ROLLUP_CLEANUP_SQL}
+            {_rollup_delta_sql("NEW", 1)}
+        END;
+    """)
+
+    # Databases created before the rollup (or a measure) existed need a one-off backfill
+    if needs_rebuild:
+        rebuild_daily_rollup(cursor)
+
+def create_points_tables(cursor):
+    """
+    Create the append-only PointsLedger and the running totals it feeds.
+    A trigger on the ledger keeps Habits.points and PointsTotals in step with every event.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS PointsLedger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            habit_id INTEGER NOT NULL,
+            task_id INTEGER,
+            category_id INTEGER,
+            event_date TEXT NOT NULL,
+            points INTEGER NOT NULL,
+            streak INTEGER NOT NULL DEFAULT 0,
+            reason TEXT NOT NULL DEFAULT 'completion'
+        );
+    """)
+    # Covering indexes so leaderboards never touch the ledger rows themselves
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_points_date ON PointsLedger(event_date, habit_id, points)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_points_category ON PointsLedger(category_id, event_date, habit_id, points)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_points_habit ON PointsLedger(habit_id, event_date)")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS PointsTotals (
+            id INTEGER PRIMARY KEY CHECK(id = 1),
+            total_points INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+    cursor.execute("INSERT OR IGNORE INTO PointsTotals (id, total_points) VALUES (1, 0)")
+
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_points_ledger_insert AFTER INSERT ON PointsLedger
+        BEGIN
+            UPDATE Habits SET points = COALESCE(points, 0) + NEW.points WHERE id = NEW.habit_id;
+            UPDATE PointsTotals SET total_points = total_points + NEW.points WHERE id = 1;
+        END;
+    """)
+
+def create_search_tables(cursor):
+    """
+    Create the FTS5 search index over habit names, descriptions and task notes,
+    plus the triggers that keep it in sync. Habit rows use rowid -habit_id and
+    task-note rows use rowid task_id, so every trigger touches a single rowid.
+    A trigram index over habit names backs substring matching.
+    Skipped with a warning when SQLite was built without FTS5.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'HabitSearch'")
+    existed = cursor.fetchone() is not None
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS HabitSearch USING fts5(
+                habit_name, description, notes, habit_id UNINDEXED,
+                tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+            );
+        """)
+    except sqlite3.OperationalError as e:
+        logger.warning(f"FTS5 unavailable, habit search will fall back to LIKE scans: {e}")
+        return
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS HabitNameTrigrams USING fts5(
+                habit_name, tokenize = 'trigram'
+            );
+        """)
+        trigram_sql = "INSERT INTO HabitNameTrigrams (rowid, habit_name) VALUES (NEW.id, NEW.habit_name);"
+        trigram_delete_sql = "DELETE FROM HabitNameTrigrams WHERE rowid = OLD.id;"
+    except sqlite3.OperationalError as e:
+        logger.warning(f"Trigram tokenizer unavailable, substring search disabled: {e}")
+        trigram_sql = trigram_delete_sql = ""
+
+    habit_insert_sql = """
+        INSERT INTO HabitSearch (rowid, habit_name, description, notes, habit_id)
+        VALUES (-NEW.id, NEW.habit_name, COALESCE(NEW.description, ''), '', NEW.id);
+    """
+    task_insert_sql = """
+        INSERT INTO HabitSearch (rowid, habit_name, description, notes, habit_id)
+        SELECT NEW.task_id, '', '', NEW.notes, NEW.habit_id
+        WHERE COALESCE(NEW.notes, '') != '';
+    """
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_habits_search_insert AFTER INSERT ON Habits
+        BEGIN
+            {habit_insert_sql}
+            {trigram_sql}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_habits_search_update AFTER UPDATE OF habit_name, description ON Habits
+        BEGIN
+            DELETE FROM HabitSearch WHERE rowid = -OLD.id;
+            {trigram_delete_sql}
+            {habit_insert_sql}
+            {trigram_sql}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_habits_search_delete AFTER DELETE ON Habits
+        BEGIN
+            DELETE FROM HabitSearch WHERE rowid = -OLD.id;
+            {trigram_delete_sql}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_search_insert AFTER INSERT ON Tasks
+        BEGIN
+            {task_insert_sql}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_search_update AFTER UPDATE OF notes, habit_id ON Tasks
+        BEGIN
+            DELETE FROM HabitSearch WHERE rowid = OLD.task_id;
+            {task_insert_sql}
+        END;
+    """)
+    # Archived Tasks keep their notes searchable, so archiving must not unindex them
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_tasks_search_delete'")
+    row = cursor.fetchone()
+    if row and "MaintenanceFlags" not in row[0]:
+        cursor.execute("DROP TRIGGER trg_tasks_search_delete")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_search_delete AFTER DELETE ON Tasks
+        WHEN NOT EXISTS (SELECT 1 FROM MaintenanceFlags WHERE name = 'archiving')
+        BEGIN
+            DELETE FROM HabitSearch WHERE rowid = OLD.task_id;
+        END;
+    """)
+
+    if not existed:
+        rebuild_search_index(cursor)
+
+def create_archive_tables(cursor):
+    """
+    Create the hot-side summary of Tasks moved to the archive database (see archive.py).
+    One row per habit, so full-history totals never need the archive attached.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ArchivedHabitSummary (
+            habit_id INTEGER PRIMARY KEY,
+            task_count INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,
+            missed INTEGER NOT NULL DEFAULT 0,
+            best_streak INTEGER NOT NULL DEFAULT 0,
+            first_date TEXT,
+            last_date TEXT
+        );
+    """)
+
+_NOW_SQL = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+_DEVICE_SQL = "(SELECT value FROM SyncState WHERE key = 'device_id')"
+
+def _habit_gid_sql(habit_id):
+    return f"(SELECT global_id FROM HabitGlobalIds WHERE habit_id = {habit_id})"
+
+def _change_sql(entity, global_id, op):
+    return f"""
+        INSERT OR REPLACE INTO ChangeLog (entity, global_id, op, changed_at, origin)
+        VALUES ('{entity}', {global_id}, '{op}', {_NOW_SQL}, {_DEVICE_SQL});
+    """
+
+def create_sync_tables(cursor):
+    """
+    Create the change-tracking tables used by sync.py.
+    Habits get a device-independent global id; a Task's identity is its habit's
+    global id plus its log date. ChangeLog keeps one row per changed entity and
+    re-sequences it on every change, so a peer only ever pulls what changed.
+    Triggers skip changes made while sync applies a peer's rows ('sync_apply')
+    or while old Tasks are archived ('archiving').
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ChangeLog'")
+    existed = cursor.fetchone() is not None
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS SyncState (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """)
+    cursor.execute("INSERT OR IGNORE INTO SyncState (key, value) VALUES ('device_id', lower(hex(randomblob(8))))")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS HabitGlobalIds (
+            habit_id INTEGER PRIMARY KEY,
+            global_id TEXT NOT NULL UNIQUE
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ChangeLog (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL CHECK(entity IN ('habit', 'task')),
+            global_id TEXT NOT NULL,
+            op TEXT NOT NULL CHECK(op IN ('upsert', 'delete')),
+            changed_at TEXT NOT NULL,
+            origin TEXT NOT NULL,
+            UNIQUE(entity, global_id)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS SyncPeers (
+            peer_id TEXT PRIMARY KEY,
+            last_seq INTEGER NOT NULL DEFAULT 0,
+            synced_at TEXT
+        );
+    """)
+
+    not_applying = "WHEN NOT EXISTS (SELECT 1 FROM MaintenanceFlags WHERE name = 'sync_apply')"
+    not_maintaining = "WHEN NOT EXISTS (SELECT 1 FROM MaintenanceFlags WHERE name IN ('sync_apply', 'archiving'))"
+    new_task_gid = f"{_habit_gid_sql('NEW.habit_id')} || '/' || NEW.task_log_date"
+    old_task_gid = f"{_habit_gid_sql('OLD.habit_id')} || '/' || OLD.task_log_date"
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_habits_sync_insert AFTER INSERT ON Habits
+        {not_applying}
+        BEGIN
+            INSERT OR IGNORE INTO HabitGlobalIds (habit_id, global_id) VALUES (NEW.id, {_DEVICE_SQL} || '-' || NEW.id);
+            {_change_sql('habit', _habit_gid_sql('NEW.id'), 'upsert')}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_habits_sync_update AFTER UPDATE ON Habits
+        {not_applying}
+        BEGIN
+            {_change_sql('habit', _habit_gid_sql('NEW.id'), 'upsert')}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_habits_sync_delete AFTER DELETE ON Habits
+        {not_applying}
+        BEGIN
+            {_change_sql('habit', _habit_gid_sql('OLD.id'), 'delete')}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_sync_insert AFTER INSERT ON Tasks
+        {not_applying}
+        BEGIN
+            {_change_sql('task', new_task_gid, 'upsert')}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_sync_update AFTER UPDATE ON Tasks
+        {not_applying}
+        BEGIN
+            INSERT OR REPLACE INTO ChangeLog (entity, global_id, op, changed_at, origin)
+            SELECT 'task', {old_task_gid}, 'delete', {_NOW_SQL}, {_DEVICE_SQL}
+            WHERE OLD.habit_id != NEW.habit_id OR OLD.task_log_date != NEW.task_log_date;
+            {_change_sql('task', new_task_gid, 'upsert')}
+        END;
+    """)
+    # Also fires for Tasks removed by the ON DELETE CASCADE of a habit delete
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_sync_delete AFTER DELETE ON Tasks
+        {not_maintaining}
+        BEGIN
+            {_change_sql('task', old_task_gid, 'delete')}
+        END;
+    """)
+
+    # Existing rows enter the log once, so a first sync sends the whole history
+    if not existed:
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO HabitGlobalIds (habit_id, global_id)
+            SELECT id, {_DEVICE_SQL} || '-' || id FROM Habits
+        """)
+        cursor.execute(f"""
+            INSERT OR REPLACE INTO ChangeLog (entity, global_id, op, changed_at, origin)
+            SELECT 'habit', g.global_id, 'upsert', {_NOW_SQL}, {_DEVICE_SQL}
+            FROM Habits h JOIN HabitGlobalIds g ON g.habit_id = h.id
+        """)
+        cursor.execute(f"""
+            INSERT OR REPLACE INTO ChangeLog (entity, global_id, op, changed_at, origin)
+            SELECT 'task', g.global_id || '/' || t.task_log_date, 'upsert', {_NOW_SQL}, {_DEVICE_SQL}
+            FROM Tasks t JOIN HabitGlobalIds g ON g.habit_id = t.habit_id
+        """)
+
+def create_sweeper_tables(cursor):
+    """
+    Create the per-habit watermark for the missed-period sweeper (see sweeper.py)
+    and the index that turns missed counts into index-only lookups.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS SweepWatermark (
+            habit_id INTEGER PRIMARY KEY,
+            swept_through TEXT NOT NULL,
+            FOREIGN KEY (habit_id) REFERENCES Habits(id) ON DELETE CASCADE
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_habit ON Tasks(task_status, habit_id)")
+
+_STATUS_REFRESH_SQL = """
+        UPDATE HabitPeriodStatus SET
+            done = EXISTS (
+                SELECT 1 FROM Tasks t WHERE t.habit_id = HabitPeriodStatus.habit_id AND t.task_status = 'completed'
+                  AND t.task_log_date >= period_start AND t.task_log_date < period_end),
+            completed_at = (
+                SELECT MAX(t.task_log_date) FROM Tasks t WHERE t.habit_id = HabitPeriodStatus.habit_id
+                  AND t.task_status = 'completed' AND t.task_log_date >= period_start AND t.task_log_date < period_end)
+        WHERE habit_id IN ({habit_ids});
+"""
+
+def create_period_status_tables(cursor):
+    """
+    Create HabitPeriodStatus: each habit's current period and whether it is done.
+    Triggers on Habits and Tasks keep the done flag current on every write; a new
+    or re-periodized habit opens the period of the writer's habit day (HABIT_DAY_SQL).
+    period_status.roll_over_period_status() moves all habits to a new period
+    in one statement when the day (or week) changes.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'HabitPeriodStatus'")
+    existed = cursor.fetchone() is not None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS HabitPeriodStatus (
+            habit_id INTEGER PRIMARY KEY,
+            period_start TEXT NOT NULL,
+            period_end TEXT NOT NULL,
+            done INTEGER NOT NULL DEFAULT 0,
+            completed_at TEXT,
+            FOREIGN KEY (habit_id) REFERENCES Habits(id) ON DELETE CASCADE
+        );
+    """)
+
+    # Older triggers opened periods on the database's local date instead of the habit day
+    for (name,) in cursor.execute("""
+            SELECT name FROM sqlite_master WHERE type = 'trigger'
+              AND name IN ('trg_habits_status_insert', 'trg_habits_status_period')
+              AND sql NOT LIKE '%''habit_day''%'""").fetchall():
+        cursor.execute(f"DROP TRIGGER {name}")
+    start_sql, end_sql = period_bounds_sql(HABIT_DAY_SQL, "NEW.habit_period")
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_habits_status_insert AFTER INSERT ON Habits
+        BEGIN
+            INSERT OR REPLACE INTO HabitPeriodStatus (habit_id, period_start, period_end, done)
+            VALUES (NEW.id, {start_sql}, {end_sql}, 0);
+            {_STATUS_REFRESH_SQL.format(habit_ids="NEW.id")}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_habits_status_period AFTER UPDATE OF habit_period ON Habits
+        BEGIN
+            UPDATE HabitPeriodStatus SET period_start = {start_sql}, period_end = {end_sql} WHERE habit_id = NEW.id;
+            {_STATUS_REFRESH_SQL.format(habit_ids="NEW.id")}
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_status_insert AFTER INSERT ON Tasks
+        WHEN NEW.task_status = 'completed'
+        BEGIN
+            UPDATE HabitPeriodStatus SET done = 1, completed_at = MAX(COALESCE(completed_at, ''), NEW.task_log_date)
+            WHERE habit_id = NEW.habit_id AND NEW.task_log_date >= period_start AND NEW.task_log_date < period_end;
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_status_delete AFTER DELETE ON Tasks
+        WHEN OLD.task_status = 'completed'
+        BEGIN
+            {_STATUS_REFRESH_SQL.format(habit_ids="OLD.habit_id")}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_status_update
+        AFTER UPDATE OF habit_id, task_log_date, task_status ON Tasks
+        BEGIN
+            {_STATUS_REFRESH_SQL.format(habit_ids="OLD.habit_id, NEW.habit_id")}
+        END;
+    """)
+
+    if not existed:
+        roll_over_period_status(cursor)
+
+def _category_delta_sql(category_sql, values_sql, source="WHERE 1"):
+    """UPSERT adding measure deltas (values_sql formats each measure name) to category days."""
+    columns = ", ".join(CATEGORY_MEASURES)
+    values = ", ".join(values_sql.format(m=name) for name in CATEGORY_MEASURES)
+    updates = ", ".join(f"{name} = {name} + excluded.{name}" for name in CATEGORY_MEASURES)
+    return f"""
+        INSERT INTO CategoryDailyRollup (category_id, day, {columns})
+        SELECT {category_sql}, {values} {source}
+        ON CONFLICT(category_id, day) DO UPDATE SET {updates};
+    """
+
+def create_category_rollup_tables(cursor):
+    """
+    Create CategoryDailyRollup (one row per category and day) and the triggers
+    that keep it in step with DailyRollup, so category analytics never touch Tasks.
+    A habit's rows move between categories when its category_id changes, and are
+    subtracted before the habit is deleted (its cascaded Task deletes are ignored).
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'CategoryDailyRollup'")
+    existed = cursor.fetchone() is not None
+    measures = ",\n            ".join(f"{name} INTEGER NOT NULL DEFAULT 0" for name in CATEGORY_MEASURES)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS CategoryDailyRollup (
+            category_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            {measures},
+            PRIMARY KEY (category_id, day)
+        ) WITHOUT ROWID;
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_habits_category ON Habits(category_id, habit_status)")
+
+    category_of = "(SELECT COALESCE(category_id, 0) FROM Habits WHERE id = {row}.habit_id)"
+    habit_exists = "WHEN EXISTS (SELECT 1 FROM Habits WHERE id = {row}.habit_id)"
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_category_insert AFTER INSERT ON DailyRollup
+        {habit_exists.format(row="NEW")}
+        BEGIN
+            {_category_delta_sql(category_of.format(row="NEW") + ", NEW.day", "NEW.{m}")}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_category_update AFTER UPDATE ON DailyRollup
+        {habit_exists.format(row="NEW")}
+        BEGIN
+            {_category_delta_sql(category_of.format(row="NEW") + ", NEW.day", "NEW.{m} - OLD.{m}")}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_category_delete AFTER DELETE ON DailyRollup
+        {habit_exists.format(row="OLD")}
+        BEGIN
+            {_category_delta_sql(category_of.format(row="OLD") + ", OLD.day", "-OLD.{m}")}
+        END;
+    """)
+    habit_days = "FROM DailyRollup WHERE habit_id = OLD.id"
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_habits_category_move AFTER UPDATE OF category_id ON Habits
+        WHEN COALESCE(OLD.category_id, 0) != COALESCE(NEW.category_id, 0)
+        BEGIN
+            {_category_delta_sql("COALESCE(OLD.category_id, 0), day", "-{m}", habit_days)}
+            {_category_delta_sql("COALESCE(NEW.category_id, 0), day", "{m}", habit_days)}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_habits_category_delete BEFORE DELETE ON Habits
+        BEGIN
+            {_category_delta_sql("COALESCE(OLD.category_id, 0), day", "-{m}", habit_days)}
+        END;
+    """)
+
+    if not existed:
+        rebuild_category_rollup(cursor)
+
+def create_history_tables(cursor):
+    """
+    Create HabitHistory, the temporal versions of Habits rows behind history.as_of().
+    A change to a tracked column closes the habit's open version at today's date and
+    opens one from today; further changes on the same day update that version.
+    Deleting a habit closes its version, so earlier dates still see it.
+    "Today" is the writer's habit day (HABIT_DAY_SQL, see habit_day).
+    """
+    # history reads Tasks through archive, which imports this module
+    from history import HISTORY_COLUMNS, OPEN, backfill_history
+
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'HabitHistory'")
+    existed = cursor.fetchone() is not None
+    # Older triggers stamped the local date or called a per-connection habit_today() function
+    for (name,) in cursor.execute("""
+            SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_habits_history_%'
+              AND sql NOT LIKE '%''habit_day''%'""").fetchall():
+        cursor.execute(f"DROP TRIGGER {name}")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS HabitHistory (
+            habit_id INTEGER NOT NULL,
+            valid_from TEXT NOT NULL,
+            valid_to TEXT NOT NULL,
+            habit_name TEXT NOT NULL,
+            habit_period TEXT NOT NULL,
+            habit_status TEXT NOT NULL,
+            streak INTEGER NOT NULL DEFAULT 0,
+            best_streak INTEGER NOT NULL DEFAULT 0,
+            last_completed TEXT,
+            points INTEGER DEFAULT 0,
+            category_id INTEGER,
+            difficulty TEXT,
+            PRIMARY KEY (habit_id, valid_from)
+        ) WITHOUT ROWID;
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_habit_history_valid ON HabitHistory(valid_to, valid_from)")
+
+    today = HABIT_DAY_SQL
+    columns = ", ".join(HISTORY_COLUMNS)
+    values = ", ".join(f"NEW.{name}" for name in HISTORY_COLUMNS)
+    updates = ", ".join(f"{name} = excluded.{name}" for name in HISTORY_COLUMNS)
+    open_version = f"""
+            UPDATE HabitHistory SET valid_to = {today} WHERE habit_id = NEW.id AND valid_to = '{OPEN}';
+            INSERT INTO HabitHistory (habit_id, valid_from, valid_to, {columns})
+            VALUES (NEW.id, {today}, '{OPEN}', {values})
+            ON CONFLICT(habit_id, valid_from) DO UPDATE SET valid_to = excluded.valid_to, {updates};
+    """
+    changed = " OR ".join(f"OLD.{name} IS NOT NEW.{name}" for name in HISTORY_COLUMNS)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_habits_history_insert AFTER INSERT ON Habits
+        BEGIN
+            {open_version}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_habits_history_update AFTER UPDATE OF {columns} ON Habits
+        WHEN {changed}
+        BEGIN
+            {open_version}
+        END;
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_habits_history_delete AFTER DELETE ON Habits
+        BEGIN
+            UPDATE HabitHistory SET valid_to = {today} WHERE habit_id = OLD.id AND valid_to = '{OPEN}';
+        END;
+    """)
+
+    if not existed:
+        backfill_history(cursor)
@@ -0,0 +1,233 @@
+"""
+Streak-break risk forecasting.
+Recent history is held as one habit x period boolean matrix (column -1 is each
+habit's current period, daily and weekly rows each in their own periods), so the
+risk of every active habit missing its next period is computed in a single set
+of NumPy reductions. The matrix is loaded with one query over Tasks and then
+kept current as a MyHabits listener.
+"""
+import heapq
+import logging
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from archive import history_source
+from clock import DateLike, get_clock, period_key, to_date
+
+logger = logging.getLogger(__name__)
+
+WINDOW = 56        # periods of history kept per habit
+HALF_LIFE = 14     # periods for a completion's weight in the cadence to halve
+PRIOR = 0.5        # completion probability assumed without history
+
+def _smoothed(hits: np.ndarray, total: np.ndarray) -> np.ndarray:
+    """hits / total with one pseudo-observation at PRIOR, so empty rows give PRIOR."""
+    return (hits + PRIOR) / (total + 1.0)
+
+def _shift(block: np.ndarray, periods: int) -> np.ndarray:
+    """Move columns `periods` to the left, filling the new periods with False."""
+    if periods <= 0:
+        return block
+    shifted = np.zeros_like(block)
+    if periods < block.shape[1]:
+        shifted[:, :-periods] = block[:, periods:]
+    return shifted
+
+class StreakRiskModel:
+    """
+    Probability that each active habit misses its next due period: the current one
+    if it is not done yet, otherwise the one after it.
+
+    The estimate averages three signals, each smoothed towards PRIOR:
+      - cadence: exponentially weighted completion rate over the window
+      - transition: how often a period was done after a done/missed one,
+        applied to the state of the period before the target
+      - gap: exp(-current gap / typical gap), so a lapse that already runs longer
+        than the habit's usual gaps counts against it
+    Daily habits add a fourth, the completion rate on the target's weekday.
+
+    Register it as a MyHabits listener so completions and habit changes keep it current.
+    """
+    def __init__(self, window: int = WINDOW, half_life: float = HALF_LIFE):
+        self.window = window
+        self.half_life = half_life
+        self.ids = np.empty(0, dtype=np.int64)
+        self.names: List[str] = []
+        self.weekly = np.empty(0, dtype=bool)
+        self.active = np.empty(0, dtype=bool)
+        self.created = np.empty(0, dtype=np.int64)  # creation period key, in each row's own periods
+        self.done = np.zeros((0, window), dtype=bool)
+        self.rows: Dict[int, int] = {}
+        self.today: Optional[date] = None
+        self._cursor = None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def load(self, cursor, today: Optional[DateLike] = None) -> "StreakRiskModel":
+        """(Re)build the matrix from Habits and the window's completed Tasks."""
+        self._cursor = cursor
+        self.today = to_date(today or get_clock().today())
+        habits = cursor.execute("SELECT id, habit_name, habit_period, creation_date, habit_status FROM Habits").fetchall()
+        self.rows = {}
+        self.names = []
+        self.ids = np.empty(len(habits), dtype=np.int64)
+        self.weekly = np.empty(len(habits), dtype=bool)
+        self.active = np.empty(len(habits), dtype=bool)
+        self.created = np.empty(len(habits), dtype=np.int64)
+        for row, (habit_id, name, period, created, status) in enumerate(habits):
+            self.rows[habit_id] = row
+            self.names.append(name)
+            self.ids[row] = habit_id
+            self.weekly[row] = period == "weekly"
+            self.active[row] = status == "active"
+            self.created[row] = period_key(created, period)
+        self.done = np.zeros((len(habits), self.window), dtype=bool)
+
+        # Weekly rows reach back `window` weeks; anything older is dropped below
+        since = date.fromordinal(self.today.toordinal() - 7 * self.window - 6).isoformat()
+        found = cursor.execute(f"""
+            SELECT habit_id, substr(task_log_date, 1, 10) FROM {history_source(cursor)}
+            WHERE task_status = 'completed' AND task_log_date >= ?
+        """, (since,)).fetchall()
+        if found:
+            habit_ids, days = zip(*found)
+            lookup = np.full(int(self.ids.max()) + 1 if len(self.ids) else 1, -1, dtype=np.int64)
+            lookup[self.ids] = np.arange(len(self.ids))
+            ids = np.array(habit_ids, dtype=np.int64)
+            row = np.where(ids < len(lookup), lookup[np.minimum(ids, len(lookup) - 1)], -1)
+            col = self._columns(row, np.array(days, dtype="datetime64[D]").astype(np.int64))
+            keep = (row >= 0) & (col >= 0) & (col < self.window)
+            self.done[row[keep], col[keep]] = True
+        logger.info(f"Streak risk model loaded: {len(self.rows)} habits, {len(found)} completions")
+        return self
+
+    def _columns(self, rows: np.ndarray, epoch_days: np.ndarray) -> np.ndarray:
+        """Matrix column of each (row, day since 1970-01-01); the current period is window - 1."""
+        today = np.int64((self.today - date(1970, 1, 1)).days)
+        def monday(days):
+            return days - (days + 3) % 7  # 1970-01-01 was a Thursday
+        weekly = self.weekly[np.maximum(rows, 0)]
+        ago = np.where(weekly, (monday(today) - monday(epoch_days)) // 7, today - epoch_days)
+        return self.window - 1 - ago
+
+    def _advance(self, today: date) -> None:
+        """Slide every row's window forward to the periods containing `today`."""
+        if self.today is None or today <= self.today:
+            return
+        days = today.toordinal() - self.today.toordinal()
+        weeks = period_key(today, "weekly") - period_key(self.today, "weekly")
+        self.done[~self.weekly] = _shift(self.done[~self.weekly], days)
+        self.done[self.weekly] = _shift(self.done[self.weekly], weeks)
+        self.today = today
+
+    # --- MyHabits listener hooks ---
+    def habit_added(self, habit_id, habit_name, habit_period, creation_date=None, **_):
+        today = self.today or get_clock().today()
+        self.rows[habit_id] = len(self.ids)
+        self.names.append(habit_name)
+        self.ids = np.append(self.ids, habit_id)
+        self.weekly = np.append(self.weekly, habit_period == "weekly")
+        self.active = np.append(self.active, True)
+        self.created = np.append(self.created, period_key(creation_date or today, habit_period))
+        self.done = np.vstack([self.done, np.zeros((1, self.window), dtype=bool)])
+        self.today = today
+
+    def habit_edited(self, habit_id, habit_name=None, habit_period=None, previous_period=None, **_):
+        row = self.rows.get(habit_id)
+        if row is None:
+            return
+        if habit_name:
+            self.names[row] = habit_name
+        if habit_period and habit_period != previous_period and self._cursor is not None:
+            self.reload_habit(habit_id)
+
+    def habit_deactivated(self, habit_id, **_):
+        row = self.rows.get(habit_id)
+        if row is not None:
+            self.active[row] = False
+
+    def task_completed(self, habit_id, log_date, **_):
+        self.mark(habit_id, log_date)
+
+    def mark(self, habit_id: int, day: DateLike) -> None:
+        row = self.rows.get(habit_id)
+        if row is None or self.today is None:
+            return
+        day = to_date(day)
+        self._advance(day)
+        period = "weekly" if self.weekly[row] else "daily"
+        col = self.window - 1 - (period_key(self.today, period) - period_key(day, period))
+        if 0 <= col < self.window:
+            self.done[row, col] = True
+
+    def reload_habit(self, habit_id: int) -> None:
+        """Re-read one habit's row, e.g. after its periodicity changed."""
+        row = self.rows[habit_id]
+        period, created = self._cursor.execute(
+            "SELECT habit_period, creation_date FROM Habits WHERE id = ?", (habit_id,)).fetchone()
+        self.weekly[row] = period == "weekly"
+        self.created[row] = period_key(created, period)
+        self.done[row] = False
+        since = date.fromordinal(self.today.toordinal() - 7 * self.window - 6).isoformat()
+        for (log_date,) in self._cursor.execute(f"""
+                SELECT task_log_date FROM {history_source(self._cursor)}
+                WHERE habit_id = ? AND task_status = 'completed' AND task_log_date >= ?""",
+                (habit_id, since)).fetchall():
+            self.mark(habit_id, log_date)
+
+    # --- Forecast ---
+    def risks(self, today: Optional[DateLike] = None) -> Dict[str, np.ndarray]:
+        """
+        Per-row miss probability and its components, for every habit in the model.
+
+        Returns:
+            dict: risk, cadence, transition, gap and weekday (NaN for weekly rows) arrays
+        """
+        self._advance(to_date(today or get_clock().today()))
+        n, w = self.done.shape
+        current_key = np.where(self.weekly, period_key(self.today, "weekly"), period_key(self.today, "daily"))
+        first = np.maximum(w - 1 - (current_key - self.created), 0)
+        valid = np.arange(w) >= first[:, None]
+        done = self.done & valid
+        hist, seen = done[:, :-1], valid[:, :-1]
+        current_done = done[:, -1]
+
+        weights = 0.5 ** (np.arange(w - 2, -1, -1) / self.half_life)
+        cadence = _smoothed((hist * weights).sum(1), (seen * weights).sum(1))
+
+        prev, nxt, pair = hist[:, :-1], hist[:, 1:], seen[:, :-1] & seen[:, 1:]
+        after_done = _smoothed((prev & nxt & pair).sum(1), (prev & pair).sum(1))
+        after_miss = _smoothed((~prev & nxt & pair).sum(1), (~prev & pair).sum(1))
+        # The period before the target is the current one when it is done, else the last elapsed one
+        prior_done = current_done | hist[:, -1]
+        transition = np.where(prior_done, after_done, after_miss)
+
+        # Gap: elapsed periods since the last completion vs. the mean length of past gaps
+        missed = seen & ~hist
+        last_done = np.where(hist.any(1), w - 2 - np.argmax(hist[:, ::-1], axis=1), first - 1)
+        gap = np.where(current_done, 0, w - 2 - last_done)
+        gap_starts = (missed[:, 1:] & ~missed[:, :-1]).sum(1) + missed[:, 0]
+        typical = np.maximum(missed.sum(1) / np.maximum(gap_starts, 1), 1.0)
+        recency = np.exp(-gap / typical)
+
+        # Weekday of each column for daily rows, and of the target day
+        target = (self.today.weekday() + current_done) % 7
+        weekday = (self.today.weekday() - np.arange(w - 2, -1, -1)) % 7
+        same_day = weekday[None, :] == target[:, None]
+        by_weekday = _smoothed((hist & same_day).sum(1), (seen & same_day).sum(1))
+        by_weekday = np.where(self.weekly, np.nan, by_weekday)
+
+        signals = np.vstack([cadence, transition, recency])
+        completion = np.where(self.weekly, signals.mean(0), (signals.sum(0) + by_weekday) / 4)
+        return {"risk": 1.0 - completion, "cadence": cadence, "transition": transition,
+                "gap": recency, "weekday": by_weekday}
+
+    def top_risks(self, k: int = 3, today: Optional[DateLike] = None) -> List[Tuple[int, str, float]]:
+        """The k active habits most likely to miss their next period, riskiest first."""
+        risk = self.risks(today)["risk"]
+        # Ties go to the older habit (lower row)
+        candidates = ((r, -row) for row, r in enumerate(risk.tolist()) if self.active[row])
+        return [(int(self.ids[-neg]), self.names[-neg], round(r, 3)) for r, neg in heapq.nlargest(k, candidates)]
@@ -2,33 +2,161 @@
 Core habit tracking module containing the MyHabits class.
 Handles habit creation, completion tracking, and streak calculations.
 """
+import functools
 import logging
-from datetime import datetime, timedelta
+import time
+from contextlib import contextmanager
 from models import Habit, Task, Difficulty, HabitStatus, TaskStatus
+from db import retry_on_busy
+from clock import get_clock, period_bounds, period_key
+from points import score_completion
+from storage import SQLiteBackend
+from metrics import COMMIT_SECONDS, COMPLETIONS, HABIT_OPERATIONS
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _mutating(method):
+    """
+    Mark a MyHabits write operation. While batching, the operation runs inside a
+    savepoint so a failure undoes only that operation, and its listener events
+    are dispatched once the savepoint is released.
+    """
+    operations = HABIT_OPERATIONS.labels(method.__name__)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        operations.inc()
+        if self._batch is None:
+            return method(self, *args, **kwargs)
+        self._begin_write()
+        self.backend.savepoint("habit_op")
+        try:
+            result = method(self, *args, **kwargs)
+        except Exception:
+            self.backend.rollback_to("habit_op")
+            self._deferred.clear()
+            raise
+        self.backend.release("habit_op")
+        events, self._deferred = self._deferred, []
+        for event, details in events:
+            self._dispatch(event, details)
+        self._batch["ops"] += 1
+        if (self._batch["ops"] >= self._batch["max_ops"]
+                or time.monotonic() - self._batch["started"] >= self._batch["max_delay"]):
+            self.flush()
+        return result
+    return wrapper
+
 class MyHabits:
     """
     Main class for managing habits and tracking completions.
     
     Attributes:
-        cursor: Database cursor for executing queries
-        connection: Database connection for committing changes
+        backend: StorageBackend holding habits and tasks (default: SQLite on cursor/connection)
+        cursor: Database cursor for executing queries (None for non-SQLite backends)
+        connection: Database connection for committing changes (None for non-SQLite backends)
+        listeners: Objects notified after each write (e.g. a CompletionIndex).
+            A listener implements any of habit_added, habit_edited,
+            habit_deactivated and task_completed; missing hooks are skipped.
+        clock: Source of "now" and of the habit day (default: the process clock)
     """
-    def __init__(self, db_cursor, db_connection):
-        self.cursor = db_cursor
-        self.connection = db_connection
+    def __init__(self, db_cursor=None, db_connection=None, listeners=None, clock=None, backend=None):
+        self.backend = backend or SQLiteBackend(db_cursor, db_connection, clock)
+        self.cursor = self.backend.cursor
+        self.connection = self.backend.connection
+        self.clock = clock or get_clock()
+        self.listeners = list(listeners or [])
+        self._batch = None
+        self._deferred = []
+        self.busy_retries = 0
+        self._status_day = None
+
+    @contextmanager
+    def batch(self, max_ops=100, max_delay=1.0):
+        """
+        Group write operations into shared transactions (write-behind).
+        
+        Inside the block, add/edit/deactivate/complete calls are committed together
+        once `max_ops` operations have accumulated or `max_delay` seconds have passed
+        since the last commit, and on exit. Reads on this MyHabits see the pending
+        writes immediately. An operation that raises is rolled back on its own;
+        operations that succeeded before it are still committed.
+        
+        Args:
+            max_ops (int): Operations per commit
+            max_delay (float): Seconds before a commit is forced on the next operation
+        """
+        if self._batch is not None:
+            yield self  # nested batches join the outer one
+            return
+        self._batch = {"ops": 0, "max_ops": max_ops, "max_delay": max_delay, "started": time.monotonic()}
+        try:
+            yield self
+        finally:
+            self.flush()
+            self._batch = None
+
+    def flush(self):
+        """Commit any batched writes now."""
+        with COMMIT_SECONDS.time():
+            self.backend.commit()
+        if self._batch is not None:
+            self._batch["ops"] = 0
+            self._batch["started"] = time.monotonic()
+
+    def _commit(self):
+        # While batching, commits are deferred to the batch's flush policy
+        if self._batch is None:
+            with COMMIT_SECONDS.time():
+                retry_on_busy(self.backend.commit, on_retry=self._count_retry)
+
+    def _begin_write(self):
+        """
+        Take the write lock up front (BEGIN IMMEDIATE) so read-check-write sequences
+        cannot interleave with other processes; retries with jitter while busy.
+        """
+        if not self.backend.in_transaction:
+            retry_on_busy(self.backend.begin, on_retry=self._count_retry)
+
+    def _refresh_period_status(self):
+        """Roll HabitPeriodStatus over to today's periods, at most once per day."""
+        today = self.clock.today()
+        if self._status_day != today:
+            if self.backend.roll_over(today):
+                self._commit()
+            self._status_day = today
+
+    def _count_retry(self):
+        self.busy_retries += 1
+
+    def add_listener(self, listener):
+        """Register an object to be notified of habit and task writes."""
+        self.listeners.append(listener)
+
+    def _notify(self, event, **details):
+        if self._batch is not None:
+            self._deferred.append((event, details))
+        else:
+            self._dispatch(event, details)
 
-    def add_habit(self, habit_name, habit_period):
+    def _dispatch(self, event, details):
+        for listener in self.listeners:
+            handler = getattr(listener, event, None)
+            if handler is not None:
+                handler(**details)
+
+    @_mutating
+    def add_habit(self, habit_name, habit_period, reminder_time=None, target_days=7):
         """
         Add a new habit to the database.
         
         Args:
             habit_name (str): Name of the habit
             habit_period (int): 1 for daily, 2 for weekly
+            reminder_time (str, optional): Daily reminder time (HH:MM); None for no reminder
+            target_days (int): Target completions per week for daily habits (1-7)
             
         Raises:
             ValueError: If habit_name is empty or habit_period is invalid
@@ -42,19 +170,22 @@ class MyHabits:
             
         habit_period = "daily" if habit_period == 1 else "weekly"
 
-        new_habit = Habit(habit_name, habit_period)
-        self.cursor.execute("""
-            INSERT INTO Habits (habit_name, habit_period, creation_date, last_completed, streak, habit_status)
-            VALUES (?, ?, ?, ?, ?, ?)""",
-            (new_habit.name, new_habit.period, new_habit.creation_date, None, 0, new_habit.status))
-        self.connection.commit()
-        new_habit.id = self.cursor.lastrowid
+        new_habit = Habit(habit_name, habit_period, target_days=target_days, reminder_time=reminder_time,
+                          creation_date=self.clock.now().strftime("%Y-%m-%d %H:%M:%S"))
+        new_habit.id = self.backend.insert_habit(new_habit)
+        self._commit()
+        self._notify("habit_added", habit_id=new_habit.id, habit_name=new_habit.name,
+                     habit_period=new_habit.period, creation_date=new_habit.creation_date,
+                     reminder_time=new_habit.reminder_time, target_days=new_habit.target_days)
         print(f"Habit '{new_habit.name}' added with ID {new_habit.id}.")
 
+    @_mutating
     def edit_habit(self, habit_id, new_name=None, new_period=None):
         """
         Edit an existing habit's name and/or periodicity.
-        Preserves all streak data and completion history.
+        Keeps the completion history; a periodicity change re-derives the habit's
+        streaks, Task periodicity/streak values and missed periods under the new
+        period in the same transaction.
         
         Args:
             habit_id (int): ID of the habit to edit
@@ -62,180 +193,282 @@ class MyHabits:
             new_period (int, optional): New periodicity (1 for daily, 2 for weekly)
         """
         # Fetch current habit data
-        self.cursor.execute("SELECT habit_name, habit_period FROM Habits WHERE id = ?", (habit_id,))
-        result = self.cursor.fetchone()
+        habit = self.backend.get_habit(habit_id)
         
-        if not result:
+        if not habit:
             print("Habit not found.")
             return
         
-        current_name, current_period = result
-        updates = []
-        params = []
+        current_name, current_period = habit.habit_name, habit.habit_period
+        updates = {}
         
         # Validate and prepare name update
         if new_name is not None:
             if not new_name or not str(new_name).strip():
                 raise ValueError("Habit name cannot be empty")
-            updates.append("habit_name = ?")
-            params.append(new_name.strip())
+            updates["habit_name"] = new_name.strip()
         
         # Validate and prepare period update
         if new_period is not None:
             if new_period not in [1, 2]:
                 raise ValueError("Invalid periodicity. Use 1 for daily, 2 for weekly.")
             period_str = "daily" if new_period == 1 else "weekly"
-            updates.append("habit_period = ?")
-            params.append(period_str)
+            updates["habit_period"] = period_str
         
         if not updates:
             print("No changes specified.")
             return
         
         # Update the habit
-        params.append(habit_id)
-        query = f"UPDATE Habits SET {', '.join(updates)} WHERE id = ?"
-        self.cursor.execute(query, params)
-        self.connection.commit()
+        rederived = None
+        self._begin_write()
+        try:
+            self.backend.update_habit(habit_id, **updates)
+            if new_period is not None and period_str != current_period:
+                rederived = self.backend.rederive_history(habit_id, self.clock.today())
+        except Exception:
+            if self._batch is None:
+                self.backend.rollback()
+            raise
+        self._commit()
+        self._notify("habit_edited", habit_id=habit_id,
+                     habit_name=new_name.strip() if new_name is not None else current_name,
+                     habit_period=period_str if new_period is not None else current_period,
+                     previous_period=current_period)
         
         print(f"Habit updated successfully!")
         print(f"  Previous: {current_name} ({current_period})")
-        print(f"  Current: {new_name or current_name} ({params[-2] if new_period else current_period})")
+        print(f"  Current: {new_name or current_name} ({period_str if new_period else current_period})")
+        if rederived:
+            print(f"  History re-derived: streak {rederived['streak']}, best {rederived['best_streak']}")
 
+    @_mutating
     def deactivate_habit(self, habit_id):
-        self.cursor.execute("SELECT habit_name FROM Habits WHERE id = ?", (habit_id,))
-        result = self.cursor.fetchone()
-        if result:
-            self.cursor.execute("UPDATE Habits SET habit_status = 'inactive' WHERE id = ?", (habit_id,))
-            self.connection.commit()
-            print(f"Habit '{result[0]}' has been deactivated.")
+        habit = self.backend.get_habit(habit_id)
+        if habit:
+            self.backend.update_habit(habit_id, habit_status="inactive")
+            self._commit()
+            self._notify("habit_deactivated", habit_id=habit_id)
+            print(f"Habit '{habit.habit_name}' has been deactivated.")
         else:
             print("Habit not found.")
 
+    def search_habits(self, query, limit=10):
+        """
+        Search habit names, descriptions and task notes (prefix matching, ranked).
+        
+        Returns:
+            list: (habit_id, habit_name, score, snippet) best match first
+        """
+        results = self.backend.search_habits(query, limit)
+        if results:
+            print(f"\nSearch results for '{query}':")
+            for habit_id, habit_name, _, snippet in results:
+                print(f"- {habit_name} (ID: {habit_id}) … {snippet}")
+        else:
+            print(f"No habits match '{query}'.")
+        return results
+
+    def find_habit_id(self, name):
+        """
+        Resolve a habit name (exact, prefix, substring or close spelling) to its ID.
+        
+        Returns:
+            int or None: The habit ID, or None if the name is unknown or ambiguous
+        """
+        candidates = self.backend.find_habits(name)
+        if not candidates:
+            print(f"No habit found matching '{name}'.")
+            return None
+        if len(candidates) == 1 or candidates[0][1].lower() == name.strip().lower():
+            return candidates[0][0]
+        print(f"'{name}' matches several habits:")
+        for habit_id, habit_name in candidates:
+            print(f"- {habit_name} (ID: {habit_id})")
+        return None
+
     def list_all_active_habits(self):
-        self.cursor.execute("""
-            SELECT id, habit_name, habit_period, creation_date, 
-                   COALESCE(streak, 0) as streak 
-            FROM Habits 
-            WHERE habit_status = 'active'
-        """)
-        habits = self.cursor.fetchall()
+        self._refresh_period_status()
+        habits = [(h.id, h.habit_name, h.habit_period, h.creation_date, h.streak or 0, done)
+                  for h, done in self.backend.due_status(self.clock.today())]
         if habits:
             print("\nActive Habits:")
-            print("-" * 50)
-            print(f"{'ID':<4} {'Habit Name':<20} {'Period':<8} {'Created':<12} {'Streak':<6}")
-            print("-" * 50)
+            print("-" * 58)
+            print(f"{'ID':<4} {'Habit Name':<20} {'Period':<8} {'Created':<12} {'Streak':<6} {'Due':<4}")
+            print("-" * 58)
             for h in habits:
                 # Format the creation date to show only the date part
                 created_date = h[3].split()[0] if h[3] else 'N/A'
-                print(f"{h[0]:<4} {h[1]:<20} {h[2]:<8} {created_date:<12} {h[4]}")
-            print("-" * 50)
+                print(f"{h[0]:<4} {h[1]:<20} {h[2]:<8} {created_date:<12} {h[4]:<6} {'done' if h[5] else 'due'}")
+            print("-" * 58)
         else:
             print("No active habits found.")
 
     def list_habits_by_periodicity(self, habit_period):
         period = "daily" if habit_period == 1 else "weekly"
-        self.cursor.execute("""
-            SELECT id, habit_name, creation_date, COALESCE(streak, 0) as streak 
-            FROM Habits 
-            WHERE habit_status = 'active' AND habit_period = ?
-        """, (period,))
-        habits = self.cursor.fetchall()
+        self._refresh_period_status()
+        habits = [(h.id, h.habit_name, h.creation_date, h.streak or 0, done)
+                  for h, done in self.backend.due_status(self.clock.today(), period)]
         if habits:
             print(f"\nActive {period.capitalize()} Habits:")
             print("-" * 50)
-            print(f"{'ID':<4} {'Habit Name':<20} {'Created':<12} {'Streak':<6}")
+            print(f"{'ID':<4} {'Habit Name':<20} {'Created':<12} {'Streak':<6} {'Due':<4}")
             print("-" * 50)
             for h in habits:
                 created_date = h[2].split()[0] if h[2] else 'N/A'
-                print(f"{h[0]:<4} {h[1]:<20} {created_date:<12} {h[3]}")
+                print(f"{h[0]:<4} {h[1]:<20} {created_date:<12} {h[3]:<6} {'done' if h[4] else 'due'}")
             print("-" * 50)
         else:
             print(f"No active {period} habits found.")
 
-    def mark_task_completed(self, habit_id):
+    @_mutating
+    def mark_task_completed(self, habit_id, idempotency_key=None):
         """
         Mark a habit as completed for the current period.
         Respects habit periodicity (daily/weekly) and updates streak accordingly.
+        Safe to call concurrently from several processes on the same database.
         
         Args:
             habit_id (int): ID of the habit to mark as completed
+            idempotency_key (str, optional): Client-chosen request key; retrying
+                with the same key never records a second completion
+        """
+        self._begin_write()
+        try:
+            status, event = self._record_completion(habit_id, self.clock.now(), idempotency_key)
+        except Exception:
+            if self._batch is None:
+                self.backend.rollback()
+            raise
+        self._commit()
+        COMPLETIONS.labels(status).inc()
+        if status != "completed":
+            print(self.COMPLETION_MESSAGES[status])
+            return
+
+        self._notify("task_completed", **event)
+        print(f"Habit '{event['habit_name']}' marked completed. Streak: {event['streak']} (+{event['points']} points)")
+
+    @_mutating
+    def mark_tasks_completed(self, completions, before_commit=None):
+        """
+        Record many completions in a single transaction.
+        Each completion goes through the same checks as mark_task_completed, in time order.
+        
+        Args:
+            completions: Iterable of (habit_id, completed_at) or
+                (habit_id, completed_at, idempotency_key) tuples; completed_at is a datetime
+            before_commit (callable, optional): Called with the cursor inside the transaction,
+                e.g. to advance a journal watermark atomically with the inserts
+        
+        Returns:
+            dict: Count of completions per outcome (completed, duplicate_day, ...)
         """
-        today = datetime.now().strftime("%Y-%m-%d")
-        self.cursor.execute("SELECT * FROM Habits WHERE id = ?", (habit_id,))
-        habit_data = self.cursor.fetchone()
+        outcomes = {}
+        events = []
+        self._begin_write()
+        try:
+            for completion in sorted(completions, key=lambda c: c[1]):
+                status, event = self._record_completion(*completion)
+                outcomes[status] = outcomes.get(status, 0) + 1
+                if event:
+                    events.append(event)
+            if before_commit is not None:
+                before_commit(self.cursor)
+        except Exception:
+            if self._batch is None:
+                self.backend.rollback()
+            raise
+        self._commit()
+        for status, count in outcomes.items():
+            COMPLETIONS.labels(status).inc(count)
+        for event in events:
+            self._notify("task_completed", **event)
+        return outcomes
+
+    COMPLETION_MESSAGES = {
+        "not_found": "Habit not found.",
+        "inactive": "This habit is inactive and cannot be marked completed.",
+        "duplicate_day": "Already marked as completed for today.",
+        "duplicate_week": "Already marked as completed this week.",
+        "duplicate_request": "This completion request was already recorded.",
+    }
+
+    def _record_completion(self, habit_id, completed_at, idempotency_key=None):
+        """
+        Write one completion (Task row, points, streak) without committing.
+        Must run inside a write transaction (see _begin_write).
+        
+        Returns:
+            tuple: (status, event) where event holds the task_completed details,
+                or None when status is not 'completed'
+        """
+        day = self.clock.day_of(completed_at)
+        today = day.isoformat()
+        habit_data = self.backend.get_habit(habit_id)
 
         if not habit_data:
-            print("Habit not found.")
-            return
+            return "not_found", None
 
-        habit_name = habit_data[1]
-        habit_period = habit_data[3]  # Index 3 for habit_period
-        # Index 6 for streak (0-based)
-        current_streak = int(habit_data[6]) if habit_data[6] is not None else 0
-        # Index 8 for habit_status (0-based)
-        habit_status = habit_data[8]
+        habit_name = habit_data.habit_name
+        current_streak = int(habit_data.streak) if habit_data.streak is not None else 0
 
-        if habit_status != 'active':
-            print("This habit is inactive and cannot be marked completed.")
-            return
+        if habit_data.habit_status != 'active':
+            return "inactive", None
+
+        if idempotency_key is not None and self.backend.has_request(idempotency_key):
+            return "duplicate_request", None
+
+        # Period bounds: the day itself, or Monday..Sunday for weekly habits
+        periodicity = 'weekly' if habit_data.habit_period == 'weekly' else 'daily'
+        start, end = period_bounds(day, periodicity)
+
+        # Score through the same rule as recompute_points: a missed period restarts the streak.
+        # A new Task has no completion_time yet, so it earns no time bonus in either path.
+        habit = Habit.from_row(habit_data)
+        habit.streak = current_streak
+        previous = period_key(habit_data.last_completed, periodicity) if habit_data.last_completed else None
+        earned = score_completion(habit, previous, period_key(day, periodicity), completion_time=None)
+
+        task_id = self.backend.insert_completion(habit_data, today, periodicity, habit.streak,
+                                                 start.isoformat(), end.isoformat())
+        if task_id is None:
+            return ("duplicate_week" if periodicity == 'weekly' else "duplicate_day"), None
+
+        self.backend.add_points(habit, earned, today, task_id)
+        self.backend.update_habit(habit_id, last_completed=today, streak=habit.streak, best_streak=habit.best_streak)
+
+        if idempotency_key is not None:
+            self.backend.save_request(idempotency_key, habit_id, task_id, completed_at.strftime("%Y-%m-%d %H:%M:%S"))
 
-        # Check if already completed for this period
-        if habit_period == 'daily':
-            self.cursor.execute("SELECT * FROM Tasks WHERE habit_id = ? AND task_log_date = ?", (habit_id, today))
-            if self.cursor.fetchone():
-                print("Already marked as completed for today.")
-                return
-
-        elif habit_period == 'weekly':
-            week_start = (datetime.now() - timedelta(days=datetime.now().weekday())).strftime("%Y-%m-%d")
-            week_end = (datetime.now() + timedelta(days=(6 - datetime.now().weekday()))).strftime("%Y-%m-%d")
-            self.cursor.execute("""
-                SELECT * FROM Tasks WHERE habit_id = ? AND task_log_date BETWEEN ? AND ?
-            """, (habit_id, week_start, week_end))
-            if self.cursor.fetchone():
-                print("Already marked as completed this week.")
-                return
-
-        new_task = Task(habit_id=habit_id, completion_date=today)
-        # Ensure periodicity is in correct format
-        periodicity = 'daily' if habit_period == 1 or habit_period == 'daily' else 'weekly'
-        # Ensure current_streak is an integer
-        current_streak = int(current_streak) if current_streak is not None else 0
-        
-        self.cursor.execute("""
-            INSERT INTO Tasks (habit_id, task_name, task_log_date, periodicity, streak, task_status)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (new_task.habit_id, habit_name, new_task.completion_date, periodicity, current_streak + 1, "completed"))
-
-        self.cursor.execute("""
-            UPDATE Habits SET last_completed = ?, streak = ? WHERE id = ?
-        """, (today, current_streak + 1, habit_id))
-
-        self.connection.commit()
-        print(f"Habit '{habit_name}' marked completed. Streak: {current_streak + 1}")
+        return "completed", {
+            "habit_id": habit_id,
+            "habit_name": habit_name,
+            "habit_period": periodicity,
+            "log_date": today,
+            "streak": habit.streak,
+            "points": earned,
+            "task_id": task_id,
+            "completed_at": completed_at.strftime("%Y-%m-%d %H:%M:%S"),
+        }
 
     def get_completed_tasks(self, log_date=None):
-        log_date = log_date or datetime.now().strftime("%Y-%m-%d")
-        self.cursor.execute("SELECT * FROM Tasks WHERE task_log_date = ?", (log_date,))
-        tasks = self.cursor.fetchall()
+        log_date = log_date or self.clock.today().isoformat()
+        tasks = self.backend.tasks(log_date)
         if tasks:
             print(f"Tasks completed on {log_date}:")
             for t in tasks:
-                self.cursor.execute("SELECT habit_name FROM Habits WHERE id = ?", (t[1],))
-                habit_name = self.cursor.fetchone()[0]
+                habit_name = self.backend.get_habit(t[1]).habit_name
                 print(f"- {habit_name} (ID: {t[0]}, Status: {t[6]}, Streak: {t[5]})")
         else:
             print(f"No tasks completed on {log_date}.")
 
     def list_all_tasks(self):
-        self.cursor.execute("SELECT * FROM Tasks")
-        tasks = self.cursor.fetchall()
+        tasks = self.backend.tasks()
         if tasks:
             print("All Tasks:")
             for t in tasks:
-                self.cursor.execute("SELECT habit_name FROM Habits WHERE id = ?", (t[1],))
-                habit_name = self.cursor.fetchone()[0]
+                habit_name = self.backend.get_habit(t[1]).habit_name
                 print(f"- {habit_name} (Task ID: {t[0]}, Date: {t[4]}, Periodicity: {t[3]}, Streak: {t[5]}, Status: {t[6]})")
         else:
             print("No tasks found.")
@@ -0,0 +1,118 @@
+"""
+Point-in-time (as-of) views of habit state.
+Triggers on Habits (see db.create_history_tables) keep HabitHistory: one version
+per habit and day on which its tracked columns changed, valid from valid_from up
+to but excluding valid_to (OPEN while current). Changes on the same day update
+that day's version, so a version is the habit's state at the end of its days.
+Lookups go through the (habit_id, valid_from) primary key or the
+(valid_to, valid_from) index instead of replaying Tasks.
+
+The app's writes stamp versions with the clock's habit day (see db.habit_day),
+so they agree with the dates Tasks are logged under; other connections (the
+sqlite3 shell, migration scripts) stamp their local date.
+Habits that existed before history was recorded get a version valid from the
+day it was enabled; earlier dates have no recorded state and return None.
+"""
+import logging
+from datetime import timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+from archive import history_source
+from clock import DateLike, get_clock, to_date
+
+logger = logging.getLogger(__name__)
+
+OPEN = "9999-12-31"   # valid_to of a habit's current version
+HISTORY_COLUMNS = ("habit_name", "habit_period", "habit_status", "streak", "best_streak",
+                   "last_completed", "points", "category_id", "difficulty")
+
+class HabitVersion(NamedTuple):
+    """A HabitHistory row, read with `SELECT {VERSION_COLUMNS} FROM HabitHistory`."""
+    habit_id: int
+    valid_from: str
+    valid_to: str
+    habit_name: str
+    habit_period: str
+    habit_status: str
+    streak: int
+    best_streak: int
+    last_completed: Optional[str]
+    points: int
+    category_id: Optional[int]
+    difficulty: Optional[str]
+
+VERSION_COLUMNS = ", ".join(HabitVersion._fields)
+
+def backfill_history(cursor, today: Optional[DateLike] = None) -> int:
+    """
+    Open a version for every habit without one, valid from `today` (the day history
+    starts): its current state says nothing about earlier days.
+    """
+    today = to_date(today or get_clock().today()).isoformat()
+    columns = ", ".join(HISTORY_COLUMNS)
+    cursor.execute(f"""
+        INSERT OR IGNORE INTO HabitHistory (habit_id, valid_from, valid_to, {columns})
+        SELECT id, ?, ?, {columns} FROM Habits
+        WHERE id NOT IN (SELECT habit_id FROM HabitHistory WHERE valid_to = ?)
+    """, (today, OPEN, OPEN))
+    return cursor.rowcount
+
+def habit_as_of(cursor, habit_id: int, day: DateLike) -> Optional[HabitVersion]:
+    """The habit's state at the end of `day`, or None if it did not exist then."""
+    day = to_date(day).isoformat()
+    row = cursor.execute(f"""
+        SELECT {VERSION_COLUMNS} FROM HabitHistory WHERE habit_id = ? AND valid_from <= ?
+        ORDER BY valid_from DESC LIMIT 1
+    """, (habit_id, day)).fetchone()
+    return HabitVersion(*row) if row and row[2] > day else None
+
+def habits_as_of(cursor, day: DateLike, status: Optional[str] = "active",
+                 period: Optional[str] = None) -> List[HabitVersion]:
+    """Every habit's state at the end of `day`, optionally filtered by status and period."""
+    day = to_date(day).isoformat()
+    query = f"SELECT {VERSION_COLUMNS} FROM HabitHistory WHERE valid_to > ? AND valid_from <= ?"
+    params = [day, day]
+    if status is not None:
+        query += " AND habit_status = ?"
+        params.append(status)
+    if period is not None:
+        query += " AND habit_period = ?"
+        params.append(period)
+    return [HabitVersion(*row) for row in cursor.execute(query + " ORDER BY habit_id", params)]
+
+def habit_versions(cursor, habit_id: int) -> List[HabitVersion]:
+    """All recorded versions of a habit, oldest first."""
+    rows = cursor.execute(f"SELECT {VERSION_COLUMNS} FROM HabitHistory WHERE habit_id = ? ORDER BY valid_from",
+                          (habit_id,))
+    return [HabitVersion(*row) for row in rows]
+
+class HistoryView:
+    """Habits and analytics as they stood at the end of `day`."""
+    def __init__(self, cursor, day: DateLike):
+        self.cursor = cursor
+        self.day = to_date(day)
+
+    def habits(self, status: Optional[str] = "active", period: Optional[str] = None) -> List[HabitVersion]:
+        return habits_as_of(self.cursor, self.day, status, period)
+
+    def habit(self, habit_id: int) -> Optional[HabitVersion]:
+        return habit_as_of(self.cursor, habit_id, self.day)
+
+    def longest_streak(self) -> Optional[Dict]:
+        best = max(self.habits(), key=lambda h: h.streak, default=None)
+        return {"habit_name": best.habit_name, "streak": best.streak} if best else None
+
+    def points(self) -> Dict[int, int]:
+        """Points per habit, including inactive ones."""
+        return {h.habit_id: h.points or 0 for h in self.habits(status=None)}
+
+    def completions(self, habit_id: int) -> int:
+        """Completed Tasks of the habit logged up to `day` (a range on the (habit_id, task_log_date) key)."""
+        return self.cursor.execute(f"""
+            SELECT COUNT(*) FROM {history_source(self.cursor)}
+            WHERE habit_id = ? AND task_log_date < ? AND task_status = 'completed'
+        """, (habit_id, (self.day + timedelta(days=1)).isoformat())).fetchone()[0]
+
+def as_of(cursor, day: DateLike) -> HistoryView:
+    """View of the database behind `cursor` as of the end of `day`."""
+    return HistoryView(cursor, day)
@@ -0,0 +1,183 @@
+"""
+Append-only completion journal for high write throughput.
+Completions are appended to a separate WAL-mode SQLite file with group commit,
+so peak-time logging never waits on the tracker DB's write lock. A compactor
+later folds journal entries into Tasks/Habits in batches through
+MyHabits.mark_tasks_completed, advancing a watermark in the same transaction.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from typing import List, Optional, Set, Tuple
+
+from clock import Clock, get_clock, parse_date, period_bounds
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILE = "my_habits.journal.db"
+
+class CompletionJournal:
+    """
+    Durable, append-only log of (habit_id, completed_at) events.
+
+    Appends are buffered and written in groups: a group is committed when it
+    reaches `group_size` entries or when the oldest buffered entry is older than
+    `max_delay` seconds (checked on append and by the optional flusher thread).
+    Entries count for the habit day `clock` assigns them, as in MyHabits.
+    """
+    def __init__(self, path: str = JOURNAL_FILE, group_size: int = 256, max_delay: float = 0.05,
+                 clock: Optional[Clock] = None):
+        self.path = path
+        self.key = os.path.abspath(path)  # JournalWatermark key, independent of the working directory
+        self.clock = clock or get_clock()
+        self.group_size = group_size
+        self.max_delay = max_delay
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS CompletionJournal (
+                seq INTEGER PRIMARY KEY,
+                habit_id INTEGER NOT NULL,
+                completed_at TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._buffer: List[Tuple[int, str]] = []
+        self._oldest = 0.0
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def append(self, habit_id: int, completed_at: Optional[datetime] = None) -> None:
+        """Queue a completion; it becomes durable with the next group commit."""
+        stamp = (completed_at or self.clock.now()).strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.append((habit_id, stamp))
+            if len(self._buffer) >= self.group_size or time.monotonic() - self._oldest >= self.max_delay:
+                self._flush_locked()
+
+    def flush(self) -> int:
+        """Commit all buffered entries as one group. Returns the number written."""
+        with self._lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> int:
+        if not self._buffer:
+            return 0
+        batch, self._buffer = self._buffer, []
+        self._conn.executemany("INSERT INTO CompletionJournal (habit_id, completed_at) VALUES (?, ?)", batch)
+        self._conn.commit()
+        return len(batch)
+
+    def start(self) -> None:
+        """Run a background thread that flushes every max_delay seconds."""
+        if self._flusher is None:
+            self._stop.clear()
+            self._flusher = threading.Thread(target=self._flush_loop, name="journal-flusher", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.max_delay):
+            self.flush()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+        self._conn.close()
+
+    # --- Compaction ---
+    def applied_seq(self, cursor) -> int:
+        # Watermarks written before keys were absolute are stored under the path as given
+        row = cursor.execute("SELECT MAX(applied_seq) FROM JournalWatermark WHERE journal IN (?, ?)",
+                             (self.key, self.path)).fetchone()
+        return row[0] or 0
+
+    def compact(self, my_habits, batch_size: int = 1000) -> int:
+        """
+        Fold durable journal entries into Tasks/Habits in batches.
+
+        The watermark lives in the tracker DB and advances in the same transaction
+        as each batch's inserts, so a crash mid-compaction never applies an entry
+        twice. Applied entries are then trimmed from the journal.
+
+        Returns:
+            int: Number of journal entries processed
+        """
+        processed = 0
+        with self._lock:
+            self._flush_locked()
+        watermark = self.applied_seq(my_habits.cursor)
+        my_habits.connection.commit()
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT seq, habit_id, completed_at FROM CompletionJournal WHERE seq > ? ORDER BY seq LIMIT ?",
+                    (watermark, batch_size)).fetchall()
+            if not rows:
+                break
+            last_seq = rows[-1][0]
+
+            def advance(cursor, seq=last_seq):
+                cursor.execute("""
+                    INSERT INTO JournalWatermark (journal, applied_seq) VALUES (?, ?)
+                    ON CONFLICT(journal) DO UPDATE SET applied_seq = excluded.applied_seq
+                """, (self.key, seq))
+
+            outcomes = my_habits.mark_tasks_completed(
+                ((habit_id, datetime.fromisoformat(stamp)) for _, habit_id, stamp in rows),
+                before_commit=advance)
+            logger.info(f"Journal compaction batch up to seq {last_seq}: {outcomes}")
+            watermark = last_seq
+            processed += len(rows)
+            with self._lock:
+                self._conn.execute("DELETE FROM CompletionJournal WHERE seq <= ?", (watermark,))
+                self._conn.commit()
+        return processed
+
+    # --- Read merging ---
+    def pending(self, cursor, habit_id: Optional[int] = None) -> List[Tuple[int, str]]:
+        """Entries not yet folded into Tasks: durable rows past the watermark plus the buffer."""
+        watermark = self.applied_seq(cursor)
+        query = "SELECT habit_id, completed_at FROM CompletionJournal WHERE seq > ?"
+        params: list = [watermark]
+        if habit_id is not None:
+            query += " AND habit_id = ?"
+            params.append(habit_id)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY seq", params).fetchall()
+            rows += [entry for entry in self._buffer if habit_id is None or entry[0] == habit_id]
+        return rows
+
+    def _day_of(self, stamp: str) -> date:
+        return self.clock.day_of(datetime.fromisoformat(stamp))
+
+    def completed_habits_on(self, cursor, log_date: str) -> Set[int]:
+        """Habits with a completion on habit day `log_date`, whether compacted or still pending."""
+        done = {row[0] for row in cursor.execute(
+            "SELECT habit_id FROM Tasks WHERE task_log_date = ? AND task_status = 'completed'", (log_date,))}
+        day = parse_date(log_date)
+        done.update(hid for hid, stamp in self.pending(cursor) if self._day_of(stamp) == day)
+        return done
+
+    def is_completed(self, cursor, habit_id: int, day: Optional[date] = None) -> bool:
+        """Whether the habit's current period (daily or weekly) has a completion, pending or not."""
+        day = day or self.clock.today()
+        row = cursor.execute("SELECT habit_period FROM Habits WHERE id = ?", (habit_id,)).fetchone()
+        if not row:
+            return False
+        start, end = period_bounds(day, row[0])
+        start_s, end_s = start.isoformat(), end.isoformat()
+        if cursor.execute("""
+                SELECT 1 FROM Tasks WHERE habit_id = ? AND task_status = 'completed'
+                AND task_log_date BETWEEN ? AND ?""", (habit_id, start_s, end_s)).fetchone():
+            return True
+        return any(start <= self._day_of(stamp) <= end for _, stamp in self.pending(cursor, habit_id))
@@ -0,0 +1,221 @@
+"""
+Multi-process load test for the SQLite write path.
+Spawns writer processes (MyHabits.mark_tasks_completed) and reader processes
+(analytics.py functions) against one database file for a fixed duration, then
+reports throughput, latency percentiles/histograms, busy retries and file growth.
+
+Usage:
+    python load_test.py --db load_test.db --writers 4 --readers 2 --duration 10
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from db import create_connection, create_tables
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in milliseconds
+BUCKETS_MS = [0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float("inf")]
+
+READ_FUNCTIONS = [
+    "get_longest_streak",
+    "get_missed_habits",
+    "get_struggled_habits",
+    "get_most_missed_habits",
+    "get_habit_completion_correlation",
+]
+
+def _open(db_file: str, journal_mode: Optional[str], synchronous: Optional[str], busy_timeout_ms: int):
+    conn = create_connection(db_file)
+    conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+    if journal_mode:
+        conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+    if synchronous:
+        conn.execute(f"PRAGMA synchronous = {synchronous}")
+    return conn
+
+def _file_size(db_file: str) -> int:
+    return sum(os.path.getsize(p) for p in (db_file, db_file + "-wal") if os.path.exists(p))
+
+def _prepare(db_file: str, habits: int, journal_mode: Optional[str]) -> List[int]:
+    conn = _open(db_file, journal_mode, None, 5000)
+    cursor = conn.cursor()
+    create_tables(cursor)
+    for i in range(habits):
+        cursor.execute("""
+            INSERT OR IGNORE INTO Habits (habit_name, habit_period, creation_date, streak, habit_status)
+            VALUES (?, ?, ?, 0, 'active')
+        """, (f"Load Habit {i}", "daily" if i % 3 else "weekly", "2020-01-01"))
+    conn.commit()
+    habit_ids = [row[0] for row in cursor.execute("SELECT id FROM Habits WHERE habit_name LIKE 'Load Habit %'")]
+    conn.close()
+    return habit_ids
+
+def _writer(db_file, habit_ids, deadline, bulk_size, settings, seed, results):
+    from habit_tracker import MyHabits
+    logging.disable(logging.INFO)
+    rng = random.Random(seed)
+    conn = _open(db_file, *settings)
+    tracker = MyHabits(conn.cursor(), conn)
+    origin = datetime(2020, 1, 1, 7, 0)
+    latencies, outcomes, errors = [], {}, 0
+    while time.time() < deadline:
+        # Random historical timestamps so most completions land on a fresh period
+        batch = [(rng.choice(habit_ids), origin + timedelta(days=rng.randrange(3650), minutes=rng.randrange(900)))
+                 for _ in range(bulk_size)]
+        started = time.perf_counter()
+        try:
+            for status, count in tracker.mark_tasks_completed(batch).items():
+                outcomes[status] = outcomes.get(status, 0) + count
+        except Exception as e:
+            errors += 1
+            logger.warning(f"Writer error: {e}")
+        latencies.append((time.perf_counter() - started) * 1000)
+    conn.close()
+    results.put({"role": "writer", "latencies": latencies, "outcomes": outcomes,
+                 "busy_retries": tracker.busy_retries, "errors": errors})
+
+def _reader(db_file, deadline, settings, seed, results):
+    import analytics
+    logging.disable(logging.INFO)
+    rng = random.Random(seed)
+    conn = _open(db_file, *settings)
+    analytics.use_connection(conn)
+    latencies, calls, errors = [], {}, 0
+    while time.time() < deadline:
+        name = rng.choice(READ_FUNCTIONS)
+        func = getattr(analytics, name)
+        started = time.perf_counter()
+        try:
+            func(analytics.cursor) if name in ("get_most_missed_habits", "get_habit_completion_correlation") else func()
+        except Exception as e:
+            errors += 1
+            logger.warning(f"Reader error in {name}: {e}")
+        latencies.append((time.perf_counter() - started) * 1000)
+        calls[name] = calls.get(name, 0) + 1
+    conn.close()
+    results.put({"role": "reader", "latencies": latencies, "calls": calls, "busy_retries": 0, "errors": errors})
+
+def _summarize(latencies: List[float], duration: float) -> Dict:
+    if not latencies:
+        return {"ops": 0, "ops_per_sec": 0.0, "histogram_ms": {}}
+    ordered = sorted(latencies)
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+    histogram = [0] * len(BUCKETS_MS)
+    for value in ordered:
+        histogram[bisect_left(BUCKETS_MS, value)] += 1
+    return {
+        "ops": len(ordered),
+        "ops_per_sec": round(len(ordered) / duration, 1),
+        "p50_ms": pct(0.50),
+        "p90_ms": pct(0.90),
+        "p99_ms": pct(0.99),
+        "max_ms": round(ordered[-1], 3),
+        "histogram_ms": {f"<={b}": n for b, n in zip(BUCKETS_MS, histogram) if n},
+    }
+
+def run_load_test(db_file: str, writers: int = 4, readers: int = 2, duration: float = 10.0,
+                  habits: int = 50, bulk_size: int = 1, journal_mode: Optional[str] = None,
+                  synchronous: Optional[str] = None, busy_timeout_ms: int = 5000) -> Dict:
+    """
+    Run writers and readers against `db_file` for `duration` seconds.
+
+    Args:
+        bulk_size: Completions per write transaction (1 = one completion per commit)
+        journal_mode / synchronous: Optional PRAGMA settings to compare (e.g. 'wal', 'normal')
+
+    Returns:
+        dict: Settings, per-role throughput and latency summaries, busy retries,
+            errors and database file growth
+    """
+    habit_ids = _prepare(db_file, habits, journal_mode)
+    size_before = _file_size(db_file)
+    settings = (journal_mode, synchronous, busy_timeout_ms)
+    results = multiprocessing.Queue()
+    deadline = time.time() + duration
+
+    procs = [multiprocessing.Process(target=_writer, args=(db_file, habit_ids, deadline, bulk_size, settings, i, results))
+             for i in range(writers)]
+    procs += [multiprocessing.Process(target=_reader, args=(db_file, deadline, settings, 1000 + i, results))
+              for i in range(readers)]
+    started = time.time()
+    for p in procs:
+        p.start()
+    reports = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = max(time.time() - started, 1e-9)
+
+    write_reports = [r for r in reports if r["role"] == "writer"]
+    read_reports = [r for r in reports if r["role"] == "reader"]
+    outcomes: Dict[str, int] = {}
+    for r in write_reports:
+        for status, count in r["outcomes"].items():
+            outcomes[status] = outcomes.get(status, 0) + count
+    calls: Dict[str, int] = {}
+    for r in read_reports:
+        for name, count in r["calls"].items():
+            calls[name] = calls.get(name, 0) + count
+
+    writes = _summarize([x for r in write_reports for x in r["latencies"]], elapsed)
+    writes["completions_per_sec"] = round(outcomes.get("completed", 0) / elapsed, 1)
+    writes["outcomes"] = outcomes
+    reads = _summarize([x for r in read_reports for x in r["latencies"]], elapsed)
+    reads["calls"] = calls
+    size_after = _file_size(db_file)
+    return {
+        "settings": {"writers": writers, "readers": readers, "duration": duration, "habits": habits,
+                     "bulk_size": bulk_size, "journal_mode": journal_mode, "synchronous": synchronous,
+                     "busy_timeout_ms": busy_timeout_ms},
+        "elapsed_sec": round(elapsed, 2),
+        "writes": writes,
+        "reads": reads,
+        "busy_retries": sum(r["busy_retries"] for r in reports),
+        "errors": sum(r["errors"] for r in reports),
+        "db_bytes_before": size_before,
+        "db_bytes_after": size_after,
+        "db_bytes_growth": size_after - size_before,
+    }
+
+def format_report(report: Dict) -> str:
+    lines = [f"Load test ({report['elapsed_sec']}s): {report['settings']}"]
+    for role in ("writes", "reads"):
+        r = report[role]
+        lines.append(f"{role.capitalize()}: {r['ops']} ops, {r['ops_per_sec']}/s"
+                     + (f", p50 {r['p50_ms']}ms p90 {r['p90_ms']}ms p99 {r['p99_ms']}ms max {r['max_ms']}ms" if r["ops"] else ""))
+        if r.get("histogram_ms"):
+            lines.append("  histogram: " + ", ".join(f"{k}ms: {v}" for k, v in r["histogram_ms"].items()))
+    lines.append(f"Completions/s: {report['writes']['completions_per_sec']}  outcomes: {report['writes']['outcomes']}")
+    lines.append(f"Busy retries: {report['busy_retries']}  errors: {report['errors']}")
+    lines.append(f"DB growth: {report['db_bytes_growth']} bytes ({report['db_bytes_before']} -> {report['db_bytes_after']})")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the habit tracker's SQLite write path.")
+    parser.add_argument("--db", default="load_test.db", help="Database file to load (created if missing)")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    parser.add_argument("--habits", type=int, default=50)
+    parser.add_argument("--bulk-size", type=int, default=1, help="Completions per write transaction")
+    parser.add_argument("--journal-mode", choices=["delete", "truncate", "persist", "wal"])
+    parser.add_argument("--synchronous", choices=["off", "normal", "full", "extra"])
+    parser.add_argument("--busy-timeout", type=int, default=5000, help="busy_timeout in ms")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run_load_test(args.db, args.writers, args.readers, args.duration, args.habits,
+                           args.bulk_size, args.journal_mode, args.synchronous, args.busy_timeout)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+if __name__ == "__main__":
+    main()
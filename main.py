@@ -1,6 +1,9 @@
 from habit_tracker import MyHabits
+from achievements import AchievementEngine
+from sweeper import sweep_missed_periods
 from analytics import display_analytics_summary, get_longest_streak_for_habit
 from database import create_connection, create_tables
+from metrics import configure_from_env
 
 def get_valid_integer(prompt, valid_range=None):
     while True:
@@ -34,13 +37,17 @@ def display_menu():
     print("0️⃣  Exit")
 
 def main():
+    configure_from_env()
     db_file = "my_habits.db"
     connection = create_connection(db_file)
     cursor = connection.cursor()
     from db import create_tables
     create_tables(cursor)
     connection.commit()
-    my_habits = MyHabits(cursor, connection)
+    sweep_missed_periods(connection)
+    achievements = AchievementEngine(cursor, connection)
+    achievements.resume()
+    my_habits = MyHabits(cursor, connection, listeners=[achievements])
     print(f"Connected to database: {db_file}")
 
     while True:
@@ -107,6 +114,7 @@ def main():
             break
 
     if 'connection' in locals():
+        achievements.save()
         connection.commit()
         connection.close()
 
@@ -0,0 +1,253 @@
+"""
+Process metrics in the OpenMetrics text format.
+Counters and histograms live in one registry; hot paths hold a pre-bound child
+(e.g. COMPLETIONS.labels("completed")) so recording is a lock and an add.
+Cache statistics are read from functools.lru_cache at scrape time, costing the
+cached functions nothing. The exposition can be written to a file (for the
+node_exporter textfile collector, or a final dump at exit) or served over HTTP.
+"""
+import atexit
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PREFIX = "habit_tracker_"
+# Seconds; covers sub-millisecond SQLite commits up to multi-second reports
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self) -> "_Timer":
+        """Context manager observing the elapsed seconds."""
+        return _Timer(self)
+
+class _Timer:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.child.observe(time.perf_counter() - self.started)
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Child for one label combination; bind it once and reuse it on hot paths."""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _header(self) -> List[str]:
+        return [f"# TYPE {self.name} {self.kind}", f"# HELP {self.name} {_escape(self.documentation)}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self._children[()].inc(amount)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for key, child in sorted(self._children.items()):
+            lines.append(f"{self.name}_total{_labels(self.labelnames, key)} {_number(child.value)}")
+        return lines
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float) -> None:
+        self._children[()].observe(value)
+
+    def time(self) -> _Timer:
+        return self._children[()].time()
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for key, child in sorted(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(float(bound))
+                labels = _labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+        self.caches: Dict[str, Callable] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def watch_cache(self, name: str, cached: Callable) -> None:
+        """Export hits/misses of an functools.lru_cache-wrapped function, read at scrape time."""
+        self.caches[name] = cached
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        if self.caches:
+            name = PREFIX + "cache_lookups"
+            lines += [f"# TYPE {name} counter", f"# HELP {name} Lookups of in-process caches by result"]
+            for cache, cached in sorted(self.caches.items()):
+                info = cached.cache_info()
+                lines.append(f'{name}_total{{cache="{cache}",result="hit"}} {info.hits}')
+                lines.append(f'{name}_total{{cache="{cache}",result="miss"}} {info.misses}')
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+COMPLETIONS = REGISTRY.counter("completions", "Completion attempts by outcome", ["status"])
+HABIT_OPERATIONS = REGISTRY.counter("habit_operations", "MyHabits write operations", ["operation"])
+COMMIT_SECONDS = REGISTRY.histogram("commit_seconds", "Latency of tracker transaction commits")
+ANALYTICS_SECONDS = REGISTRY.histogram("analytics_seconds", "Latency of analytics calls", ["function"])
+ROWS = REGISTRY.counter("rows", "Rows written or read by bulk jobs", ["job"])
+CACHE_EVENTS = REGISTRY.counter("cache_events", "Refresh decisions of data caches", ["cache", "result"])
+
+def timed(histogram: Histogram, *labels: str):
+    """Decorator observing a function's wall time in `histogram` (labels default to the function name)."""
+    def decorate(func):
+        child = histogram.labels(*(labels or (func.__name__,)))
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+def write_textfile(path: str, registry: Registry = REGISTRY) -> None:
+    """Write the exposition atomically, so a collector never reads a partial file."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as handle:
+        handle.write(registry.render())
+    os.replace(tmp, path)
+
+def serve(port: int = 9464, address: str = "127.0.0.1", registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """Serve the exposition at http://address:port/metrics from a daemon thread; returns the server."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_):
+            pass
+
+    server = ThreadingHTTPServer((address, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Serving metrics on http://{address}:{server.server_port}/metrics")
+    return server
+
+def configure_from_env() -> Optional[ThreadingHTTPServer]:
+    """
+    Export according to HABIT_METRICS_PORT (serve over HTTP) and/or
+    HABIT_METRICS_FILE (write the exposition when the process exits).
+    """
+    path = os.environ.get("HABIT_METRICS_FILE")
+    if path:
+        atexit.register(write_textfile, path)
+    port = os.environ.get("HABIT_METRICS_PORT")
+    return serve(int(port)) if port else None
@@ -1,10 +1,44 @@
-from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, NamedTuple
 from enum import Enum
 import logging
+from clock import get_clock
 
 logger = logging.getLogger(__name__)
 
+class HabitRow(NamedTuple):
+    """A Habits row, read with `SELECT {HABIT_COLUMNS} FROM Habits`."""
+    id: int
+    habit_name: str
+    description: Optional[str]
+    habit_period: str
+    creation_date: str
+    last_completed: Optional[str]
+    streak: int
+    best_streak: int
+    habit_status: str
+    difficulty: Optional[str]
+    category_id: Optional[int]
+    target_days: int
+    reminder_time: Optional[str]
+    points: int
+
+class TaskRow(NamedTuple):
+    """A Tasks row, read with `SELECT {TASK_COLUMNS} FROM Tasks`."""
+    task_id: int
+    habit_id: int
+    task_name: str
+    periodicity: str
+    task_log_date: str
+    streak: int
+    task_status: str
+    mood: Optional[int]
+    notes: Optional[str]
+    completion_time: Optional[int]
+
+# Explicit column lists, so rows keep their shape when columns are added to the tables
+HABIT_COLUMNS = ", ".join(HabitRow._fields)
+TASK_COLUMNS = ", ".join(TaskRow._fields)
+
 class Difficulty(Enum):
     EASY = "easy"
     MEDIUM = "medium"
@@ -43,7 +77,7 @@ class Habit:
         self.category_id = category_id
         self.target_days = min(max(1, target_days), 7)
         self.reminder_time = reminder_time
-        self.creation_date = creation_date or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.creation_date = creation_date or get_clock().now().strftime("%Y-%m-%d %H:%M:%S")
         self.status = status.lower()
         self.streak = streak
         self.best_streak = best_streak
@@ -71,14 +105,17 @@ class Habit:
         streak_bonus = min(self.streak // 7, 5)
         return base_points + time_bonus + streak_bonus
 
-    def update_streak(self, completed: bool = True) -> None:
+    def update_streak(self, completed: bool = True, completion_time: Optional[int] = None) -> int:
         if completed:
             self.streak += 1
             if self.streak > self.best_streak:
                 self.best_streak = self.streak
-            self.points += self.calculate_points()
+            earned = self.calculate_points(completion_time)
+            self.points += earned
+            return earned
         else:
             self.streak = 0
+            return 0
 
     def get_streak_emoji(self) -> str:
         if self.streak == 0:
@@ -127,6 +164,25 @@ class Habit:
             points=data.get('points', 0)
         )
 
+    @classmethod
+    def from_row(cls, row: HabitRow) -> 'Habit':
+        """Build a Habit from a HabitRow (columns are read by name)."""
+        return cls(
+            name=row.habit_name,
+            period=row.habit_period,
+            description=row.description or '',
+            difficulty=row.difficulty or 'medium',
+            category_id=row.category_id,
+            target_days=row.target_days or 7,
+            reminder_time=row.reminder_time,
+            creation_date=row.creation_date,
+            status=row.habit_status,
+            habit_id=row.id,
+            streak=row.streak or 0,
+            best_streak=row.best_streak or 0,
+            points=row.points or 0
+        )
+
     def __str__(self) -> str:
         status_icon = "✅" if self.status == "active" else "⏸️" if self.status == "inactive" else "🗄️"
         period_icon = "📅" if self.period == "daily" else "📆"
@@ -155,7 +211,7 @@ class Task:
                  task_id: Optional[int] = None):
         self.id = task_id
         self.habit_id = habit_id
-        self.completion_date = completion_date or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.completion_date = completion_date or get_clock().now().strftime("%Y-%m-%d %H:%M:%S")
         self.status = status.lower()
         self.notes = notes
         self.mood = mood
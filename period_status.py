@@ -0,0 +1,71 @@
+"""
+"Due now" status per habit, read from the HabitPeriodStatus table.
+Triggers keep each habit's done flag current as Tasks are written (see
+db.create_period_status_tables); roll_over_period_status() moves every habit
+whose day or week has ended to its new period in a single statement.
+"""
+import logging
+from datetime import date
+from typing import List, Optional, Tuple
+
+from clock import get_clock
+
+logger = logging.getLogger(__name__)
+
+def period_bounds_sql(day_sql: str, period_sql: str) -> Tuple[str, str]:
+    """SQL for the first day and the exclusive end of the period containing `day_sql` (weeks start Monday)."""
+    start = (f"CASE {period_sql} WHEN 'weekly' THEN date({day_sql}, 'weekday 0', '-6 days') "
+             f"ELSE date({day_sql}) END")
+    end = (f"CASE {period_sql} WHEN 'weekly' THEN date({day_sql}, 'weekday 0', '+1 day') "
+           f"ELSE date({day_sql}, '+1 day') END")
+    return start, end
+
+def roll_over_period_status(cursor, today: Optional[date] = None) -> int:
+    """
+    Move every habit whose current period has ended to the period containing `today`,
+    recomputing its done flag from Tasks in the same statement.
+
+    Returns:
+        int: Number of habits rolled over
+    """
+    today = (today or get_clock().today()).isoformat()
+    start_sql, end_sql = period_bounds_sql(":today", "habit_period")
+    cursor.execute(f"""
+        INSERT INTO HabitPeriodStatus (habit_id, period_start, period_end, done, completed_at)
+        SELECT b.id, b.period_start, b.period_end, COUNT(t.task_id) > 0, MAX(t.task_log_date)
+        FROM (SELECT id, {start_sql} AS period_start, {end_sql} AS period_end FROM Habits) b
+        LEFT JOIN Tasks t ON t.habit_id = b.id AND t.task_status = 'completed'
+             AND t.task_log_date >= b.period_start AND t.task_log_date < b.period_end
+        WHERE 1
+        GROUP BY b.id
+        ON CONFLICT(habit_id) DO UPDATE SET
+            period_start = excluded.period_start,
+            period_end = excluded.period_end,
+            done = excluded.done,
+            completed_at = excluded.completed_at
+        WHERE HabitPeriodStatus.period_start != excluded.period_start
+    """, {"today": today})
+    rolled = cursor.rowcount
+    logger.info(f"Period status rolled over to {today}: {rolled} habits")
+    return rolled
+
+def get_due_status(cursor, habit_period: Optional[str] = None,
+                   only_due: bool = False) -> List[Tuple[int, str, str, str, bool]]:
+    """
+    Active habits with their current period and whether it is already done.
+
+    Returns:
+        list: (habit_id, habit_name, habit_period, period_start, done)
+    """
+    query = """
+        SELECT h.id, h.habit_name, h.habit_period, s.period_start, COALESCE(s.done, 0)
+        FROM Habits h LEFT JOIN HabitPeriodStatus s ON s.habit_id = h.id
+        WHERE h.habit_status = 'active'
+    """
+    params: list = []
+    if habit_period is not None:
+        query += " AND h.habit_period = ?"
+        params.append(habit_period)
+    if only_due:
+        query += " AND COALESCE(s.done, 0) = 0"
+    return [(hid, name, period, start, bool(done)) for hid, name, period, start, done in cursor.execute(query, params)]
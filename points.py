@@ -0,0 +1,147 @@
+"""
+Points ledger: append-only point events plus the leaderboards served from it.
+Per-habit (Habits.points) and global (PointsTotals) totals are maintained by the
+ledger insert trigger, so writers only ever append.
+"""
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+from models import HABIT_COLUMNS, Habit, HabitRow
+from archive import history_source
+from clock import period_key
+
+logger = logging.getLogger(__name__)
+
+def record_points(cursor, habit: Habit, points: int, event_date: str,
+                  task_id: Optional[int] = None, reason: str = "completion") -> None:
+    """Append one point event for a habit; totals follow via trigger."""
+    cursor.execute("""
+        INSERT INTO PointsLedger (habit_id, task_id, category_id, event_date, points, streak, reason)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (habit.id, task_id, habit.category_id, event_date, points, habit.streak, reason))
+
+def score_completion(habit: Habit, previous_key: Optional[int], key: int,
+                     completion_time: Optional[int] = None) -> int:
+    """
+    Extend the habit's streak with a completion in period `key` and return the points earned.
+    The streak restarts unless the previous completion fell in the period before,
+    the rule rederive.replay_streaks applies to Habits.streak.
+    """
+    if previous_key is not None and previous_key != key - 1:
+        habit.update_streak(False)
+    return habit.update_streak(True, completion_time)
+
+def get_total_points(cursor) -> int:
+    row = cursor.execute("SELECT total_points FROM PointsTotals WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+def _range_filter(start_date: Optional[str], end_date: Optional[str]) -> Tuple[str, list]:
+    clauses, params = [], []
+    if start_date:
+        clauses.append("l.event_date >= ?")
+        params.append(start_date)
+    if end_date:
+        clauses.append("l.event_date <= ?")
+        params.append(end_date)
+    return " AND ".join(clauses), params
+
+def get_leaderboard(cursor, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                    category_id: Optional[int] = None, limit: int = 10) -> List[Tuple[int, str, int]]:
+    """
+    Top habits by points earned in a date range, optionally within one category.
+
+    Returns:
+        list: (habit_id, habit_name, points) ordered by points descending
+    """
+    where, params = _range_filter(start_date, end_date)
+    if category_id is not None:
+        where = " AND ".join(filter(None, ["l.category_id = ?", where]))
+        params.insert(0, category_id)
+    cursor.execute(f"""
+        SELECT l.habit_id, h.habit_name, SUM(l.points) AS total
+        FROM PointsLedger l
+        JOIN Habits h ON h.id = l.habit_id
+        {"WHERE " + where if where else ""}
+        GROUP BY l.habit_id
+        ORDER BY total DESC
+        LIMIT ?
+    """, params + [limit])
+    return cursor.fetchall()
+
+def get_category_leaderboard(cursor, start_date: Optional[str] = None,
+                             end_date: Optional[str] = None) -> List[Tuple[Optional[int], str, int]]:
+    """
+    Points per category in a date range.
+
+    Returns:
+        list: (category_id, category_name, points) ordered by points descending
+    """
+    where, params = _range_filter(start_date, end_date)
+    cursor.execute(f"""
+        SELECT l.category_id, COALESCE(c.name, 'Uncategorized'), SUM(l.points) AS total
+        FROM PointsLedger l
+        LEFT JOIN Categories c ON c.id = l.category_id
+        {"WHERE " + where if where else ""}
+        GROUP BY l.category_id
+        ORDER BY total DESC
+    """, params)
+    return cursor.fetchall()
+
+def recompute_points(cursor, habit_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Rebuild the ledger and all totals from Tasks history in one ordered pass,
+    replaying each habit's streak through score_completion, as completions are scored live.
+
+    Args:
+        habit_ids: Rebuild only these habits' ledger rows and points (default: all)
+
+    Returns:
+        int: Total points after recomputation
+    """
+    selected, params = "1", []   # SQL condition on a habit id column, as a template
+    if habit_ids is not None:
+        params = sorted(set(habit_ids))
+        if not params:
+            return get_total_points(cursor)
+        selected = f"{{column}} IN ({', '.join('?' * len(params))})"
+
+    habits: Dict[int, Habit] = {}
+    for row in cursor.execute(f"SELECT {HABIT_COLUMNS} FROM Habits WHERE {selected.format(column='id')}",
+                              params).fetchall():
+        habit = Habit.from_row(HabitRow(*row))
+        habit.streak = habit.best_streak = habit.points = 0
+        habits[habit.id] = habit
+
+    events = []
+    last_key: Dict[int, int] = {}
+    for task_id, habit_id, log_date, completion_time in cursor.execute(f"""
+            SELECT task_id, habit_id, task_log_date, completion_time FROM {history_source(cursor)}
+            WHERE task_status = 'completed' AND {selected.format(column='habit_id')}
+            ORDER BY habit_id, task_log_date, task_id""", params).fetchall():
+        habit = habits.get(habit_id)
+        if habit is None:
+            continue
+        key = period_key(log_date, habit.period)
+        previous = last_key.get(habit_id)
+        if previous == key:
+            continue  # one scoring completion per period, as in mark_task_completed
+        last_key[habit_id] = key
+        earned = score_completion(habit, previous, key, completion_time)
+        events.append((habit_id, task_id, habit.category_id, log_date[:10], earned, habit.streak))
+
+    if habit_ids is None:
+        cursor.execute("UPDATE PointsTotals SET total_points = 0 WHERE id = 1")
+    else:
+        cursor.execute(f"""
+            UPDATE PointsTotals SET total_points = total_points - (
+                SELECT COALESCE(SUM(points), 0) FROM PointsLedger WHERE {selected.format(column='habit_id')})
+            WHERE id = 1
+        """, params)
+    cursor.execute(f"DELETE FROM PointsLedger WHERE {selected.format(column='habit_id')}", params)
+    cursor.execute(f"UPDATE Habits SET points = 0 WHERE {selected.format(column='id')}", params)
+    cursor.executemany("""
+        INSERT INTO PointsLedger (habit_id, task_id, category_id, event_date, points, streak, reason)
+        VALUES (?, ?, ?, ?, ?, ?, 'recompute')
+    """, events)
+    total = get_total_points(cursor)
+    logger.info(f"Points recomputed: {len(events)} events, {total} points")
+    return total
@@ -0,0 +1,126 @@
+"""
+Re-derivation of a habit's history after its periodicity changed.
+Streaks, Task.periodicity/Task.streak and the sweeper's 'missed' placeholders are
+all laid out in the habit's periods, so switching between daily and weekly
+replays the habit's Tasks once in date order under the new period and rewrites
+what changed in the caller's transaction. Triggers keep DailyRollup,
+HabitPeriodStatus and ChangeLog in step with the rewritten rows; in-memory
+indexes reload on the habit_edited event.
+"""
+import logging
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from archive import ARCHIVE_SCHEMA, history_source, is_attached
+from clock import get_clock, period_bounds, period_key, to_date
+from metrics import ROWS
+from sweeper import sweep_habits
+
+logger = logging.getLogger(__name__)
+
+def _reset_missed(cursor, habit_id: int, period: str) -> int:
+    """
+    Drop the habit's hot 'missed' placeholders and rewind its sweep watermark, so the
+    next sweep lays them out again in the new period. Archived periods stay swept.
+
+    Returns:
+        int: Number of placeholders removed
+    """
+    archived = cursor.execute("SELECT last_date FROM ArchivedHabitSummary WHERE habit_id = ?", (habit_id,)).fetchone()
+    resume = period_bounds(archived[0], period)[1].isoformat() if archived and archived[0] else None
+    cursor.execute("DELETE FROM main.Tasks WHERE habit_id = ? AND task_status = 'missed' AND task_log_date > ?",
+                   (habit_id, resume or ""))
+    removed = cursor.rowcount
+    if resume:
+        cursor.execute("""
+            INSERT INTO SweepWatermark (habit_id, swept_through) VALUES (?, ?)
+            ON CONFLICT(habit_id) DO UPDATE SET swept_through = excluded.swept_through
+        """, (habit_id, resume))
+    else:
+        cursor.execute("DELETE FROM SweepWatermark WHERE habit_id = ?", (habit_id,))
+    return removed
+
+def replay_streaks(rows: Iterable[Tuple[int, str, str]],
+                   period: str) -> Tuple[List[Tuple[int, int]], int, int, Optional[int], Optional[str]]:
+    """
+    One pass over (task_id, task_log_date, task_status) rows in date order:
+    consecutive period keys extend the streak, a gap restarts it, and further
+    completions in the same period repeat it. Non-completed Tasks get 0.
+
+    Returns:
+        tuple: ([(task_id, streak)], final streak, best streak, last period key, last completion date)
+    """
+    streak = best = 0
+    last_key = last_completed = None
+    streaks = []
+    for task_id, log_date, status in rows:
+        if status != "completed":
+            streaks.append((task_id, 0))
+            continue
+        key = period_key(log_date, period)
+        if key != last_key:
+            streak = streak + 1 if last_key == key - 1 else 1
+            best = max(best, streak)
+            last_key = key
+        last_completed = log_date[:10]
+        streaks.append((task_id, streak))
+    return streaks, streak, best, last_key, last_completed
+
+def current_streak(streak: int, last_key: Optional[int], period: str, today: date) -> int:
+    """The replayed streak, or 0 if its last completion is older than the previous period."""
+    if last_key is None or last_key < period_key(today, period) - 1:
+        return 0
+    return streak
+
+def rederive_habit_history(cursor, habit_id: int, today: Optional[date] = None) -> Dict[str, int]:
+    """
+    Recompute a habit's period keys, streaks and missed placeholders from its Task
+    history under its current habit_period. Runs inside the caller's transaction.
+
+    Without the archive attached only hot Tasks are replayed; best_streak then
+    keeps the archived best from ArchivedHabitSummary.
+
+    Returns:
+        dict: tasks_rewritten, missed_removed, missed_inserted, streak, best_streak
+    """
+    row = cursor.execute("SELECT habit_period FROM Habits WHERE id = ?", (habit_id,)).fetchone()
+    if not row:
+        raise ValueError(f"Habit {habit_id} not found")
+    period = row[0]
+    today = to_date(today or get_clock().today())
+
+    missed_removed = _reset_missed(cursor, habit_id, period)
+    missed_inserted = sweep_habits(cursor, today, habit_id)
+
+    rows = cursor.execute(f"""
+        SELECT task_id, task_log_date, task_status FROM {history_source(cursor)}
+        WHERE habit_id = ? ORDER BY task_log_date, task_id""", (habit_id,)).fetchall()
+    streaks, streak, best, last_key, last_completed = replay_streaks(rows, period)
+    updates = [(period, streak, task_id, period, streak) for task_id, streak in streaks]
+
+    # Only rows whose values change are written, so unchanged rows fire no triggers
+    rewrite = "UPDATE {table} SET periodicity = ?, streak = ? WHERE task_id = ? AND (periodicity != ? OR streak != ?)"
+    cursor.executemany(rewrite.format(table="main.Tasks"), updates)
+    rewritten = cursor.rowcount if updates else 0
+    if is_attached(cursor):
+        cursor.executemany(rewrite.format(table=f"{ARCHIVE_SCHEMA}.Tasks"), updates)
+        rewritten += cursor.rowcount if updates else 0
+        cursor.execute(f"""
+            UPDATE ArchivedHabitSummary SET best_streak = (
+                SELECT COALESCE(MAX(streak), 0) FROM {ARCHIVE_SCHEMA}.Tasks WHERE habit_id = ?)
+            WHERE habit_id = ?
+        """, (habit_id, habit_id))
+    else:
+        archived = cursor.execute("SELECT best_streak FROM ArchivedHabitSummary WHERE habit_id = ?", (habit_id,)).fetchone()
+        if archived:
+            best = max(best, archived[0] or 0)
+
+    ROWS.labels("rederive").inc(rewritten)
+    current = current_streak(streak, last_key, period, today)
+    cursor.execute("UPDATE Habits SET streak = ?, best_streak = ?, last_completed = ? WHERE id = ?",
+                   (current, best, last_completed, habit_id))
+
+    result = {"tasks_rewritten": rewritten, "missed_removed": missed_removed, "missed_inserted": missed_inserted,
+              "streak": current, "best_streak": best}
+    logger.info(f"Habit {habit_id} history re-derived as {period}: {result}")
+    return result
@@ -0,0 +1,204 @@
+"""
+Heap-based reminder scheduler over Habits.reminder_time / target_days.
+Active habits are loaded once; afterwards the scheduler only reacts to MyHabits
+events and to the earliest entry of a min-heap, so idle cost is a single timer
+regardless of how many reminders are scheduled.
+"""
+import asyncio
+import heapq
+import logging
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from clock import Clock, get_clock, parse_date, period_start
+
+logger = logging.getLogger(__name__)
+
+class Reminder(NamedTuple):
+    habit_id: int
+    habit_name: str
+    habit_period: str
+    due_at: datetime
+
+class QueueSink:
+    """Deliver reminders to an in-process queue (asyncio.Queue or queue.Queue)."""
+    def __init__(self, queue):
+        self.queue = queue
+
+    def send(self, reminders: List[Reminder]) -> None:
+        for reminder in reminders:
+            self.queue.put_nowait(reminder)
+
+class FileSink:
+    """Append reminders to a local text file, one tab-separated line each."""
+    def __init__(self, path: str):
+        self.path = path
+
+    def send(self, reminders: List[Reminder]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(
+                f"{r.due_at:%Y-%m-%d %H:%M}\t{r.habit_id}\t{r.habit_name}\t{r.habit_period}\n"
+                for r in reminders
+            )
+
+class _Entry:
+    __slots__ = ("version", "name", "period", "hour", "minute", "target_days",
+                 "last_done", "week", "week_done")
+
+    def __init__(self, name, period, reminder_time, target_days):
+        hour, minute = reminder_time.split(":")[:2]
+        self.version = 0
+        self.name = name
+        self.period = period
+        self.hour = int(hour)
+        self.minute = int(minute)
+        self.target_days = target_days or 7
+        self.last_done: Optional[date] = None
+        self.week: Optional[date] = None
+        self.week_done = 0
+
+    def record(self, day: date) -> None:
+        week = period_start(day, "weekly")
+        if week != self.week:
+            self.week, self.week_done = week, 0
+        self.week_done += 1
+        if self.last_done is None or day > self.last_done:
+            self.last_done = day
+
+    def satisfied(self, today: date) -> bool:
+        """Whether the period containing habit day `today` needs no reminder."""
+        week = period_start(today, "weekly")
+        done_this_week = self.week_done if self.week == week else 0
+        if self.period == "weekly":
+            return done_this_week > 0
+        return self.last_done == today or done_this_week >= self.target_days
+
+class ReminderScheduler:
+    """
+    Fires one reminder per habit per day at its reminder_time, unless the habit is
+    already done for the current period (daily: today or target_days reached this
+    week; weekly: this week).
+
+    Reminder times are wall-clock times in the clock's zone (HABIT_TZ) and a reminder
+    belongs to the habit day of its fire time (HABIT_DAY_ROLLOVER_HOUR). Heap entries
+    are invalidated lazily by version, so edits and deactivations are O(log n) and
+    never scan the heap. Register it as a MyHabits listener to keep it current.
+    Not thread-safe: drive it from the event loop's thread.
+    """
+    def __init__(self, sink, now: Optional[Callable[[], datetime]] = None, clock: Optional[Clock] = None):
+        self.sink = sink
+        self.clock = clock or get_clock()
+        self.now = now or self.clock.now
+        self._heap: List[tuple] = []
+        self._entries: Dict[int, _Entry] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._running = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self, cursor) -> "ReminderScheduler":
+        """Schedule every active habit with a reminder_time, plus this week's completions."""
+        now = self.now()
+        for habit_id, name, period, reminder_time, target_days in cursor.execute("""
+                SELECT id, habit_name, habit_period, reminder_time, target_days
+                FROM Habits WHERE habit_status = 'active' AND reminder_time IS NOT NULL"""):
+            self._entries[habit_id] = _Entry(name, period, reminder_time, target_days)
+
+        week_start = period_start(self.clock.day_of(now), "weekly").isoformat()
+        for habit_id, log_date in cursor.execute("""
+                SELECT habit_id, task_log_date FROM Tasks
+                WHERE task_status = 'completed' AND task_log_date >= ?""", (week_start,)):
+            entry = self._entries.get(habit_id)
+            if entry is not None:
+                entry.record(parse_date(log_date))
+
+        self._heap = [(self._next_fire(entry, now), habit_id, 0) for habit_id, entry in self._entries.items()]
+        heapq.heapify(self._heap)
+        logger.info(f"Reminder scheduler loaded {len(self._entries)} reminders")
+        return self
+
+    def schedule(self, habit_id: int, habit_name: str, habit_period: str,
+                 reminder_time: str, target_days: int = 7) -> None:
+        """Add or replace a habit's reminder."""
+        old = self._entries.get(habit_id)
+        entry = _Entry(habit_name, habit_period, reminder_time, target_days)
+        if old is not None:
+            entry.version = old.version + 1
+            entry.last_done, entry.week, entry.week_done = old.last_done, old.week, old.week_done
+        self._entries[habit_id] = entry
+        self._push(habit_id, entry, self.now())
+
+    def unschedule(self, habit_id: int) -> None:
+        # Stale heap entries are dropped when they surface
+        self._entries.pop(habit_id, None)
+
+    # --- MyHabits listener hooks ---
+    def habit_added(self, habit_id, habit_name, habit_period, reminder_time=None, target_days=7, **_):
+        if reminder_time:
+            self.schedule(habit_id, habit_name, habit_period, reminder_time, target_days)
+
+    def habit_edited(self, habit_id, habit_name, habit_period, **_):
+        entry = self._entries.get(habit_id)
+        if entry is not None:
+            self.schedule(habit_id, habit_name, habit_period,
+                          f"{entry.hour:02d}:{entry.minute:02d}", entry.target_days)
+
+    def habit_deactivated(self, habit_id, **_):
+        self.unschedule(habit_id)
+
+    def task_completed(self, habit_id, log_date, **_):
+        entry = self._entries.get(habit_id)
+        if entry is not None:
+            entry.record(parse_date(log_date))
+
+    # --- Firing ---
+    def _next_fire(self, entry: _Entry, after: datetime) -> float:
+        fire = after.replace(hour=entry.hour, minute=entry.minute, second=0, microsecond=0)
+        if fire <= after:
+            fire += timedelta(days=1)
+        return self.clock.timestamp(fire)
+
+    def _push(self, habit_id: int, entry: _Entry, after: datetime) -> None:
+        fire_at = self._next_fire(entry, after)
+        if self._wakeup is not None and (not self._heap or fire_at < self._heap[0][0]):
+            self._wakeup.set()
+        heapq.heappush(self._heap, (fire_at, habit_id, entry.version))
+
+    def pop_due(self, now: Optional[datetime] = None) -> List[Reminder]:
+        """Pop every entry due at `now`, reschedule it, and return the reminders to send."""
+        now = now or self.now()
+        cutoff = self.clock.timestamp(now)
+        due = []
+        while self._heap and self._heap[0][0] <= cutoff:
+            fire_at, habit_id, version = heapq.heappop(self._heap)
+            entry = self._entries.get(habit_id)
+            if entry is None or entry.version != version:
+                continue
+            fired = self.clock.from_timestamp(fire_at)
+            if not entry.satisfied(self.clock.day_of(fired)):
+                due.append(Reminder(habit_id, entry.name, entry.period, fired))
+            heapq.heappush(self._heap, (self._next_fire(entry, max(fired, now)), habit_id, version))
+        return due
+
+    async def run(self) -> None:
+        """Deliver reminders until stop() is called, sleeping until the next one is due."""
+        self._wakeup = asyncio.Event()
+        self._running = True
+        while self._running:
+            due = self.pop_due()
+            if due:
+                self.sink.send(due)
+                logger.info(f"Delivered {len(due)} reminders")
+            timeout = max(self._heap[0][0] - self.clock.timestamp(self.now()), 0) if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._wakeup = None
+
+    def stop(self) -> None:
+        self._running = False
+        if self._wakeup is not None:
+            self._wakeup.set()
@@ -0,0 +1,98 @@
+"""
+In-memory read replica of the habit database for analytics sessions.
+The replica is a private :memory: connection filled from the primary with the
+backup API (or serialize/deserialize). It is only re-copied when the primary has
+changed (PRAGMA data_version, plus total_changes for writes on the primary's own
+connection) and the copy is older than the staleness bound, so long reports and
+dashboards read at memory speed without holding read locks on the primary.
+"""
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+from metrics import CACHE_EVENTS
+
+logger = logging.getLogger(__name__)
+
+MODES = ("backup", "deserialize")
+
+class ReadReplica:
+    def __init__(self, primary, max_staleness: float = 5.0, mode: str = "backup", pages: int = -1):
+        """
+        Args:
+            primary: Connection to the on-disk database
+            max_staleness: Seconds a replica may lag behind the primary before refresh_if_stale re-copies it
+            mode: 'backup' (Connection.backup) or 'deserialize' (serialize the primary into the replica)
+            pages: Pages per backup step (-1 copies everything in one step)
+        """
+        if mode not in MODES:
+            raise ValueError(f"Mode must be one of: {', '.join(MODES)}")
+        if mode == "deserialize" and not hasattr(primary, "serialize"):
+            raise ValueError("Connection.serialize requires Python 3.11 or newer")
+        self.primary = primary
+        self.max_staleness = max_staleness
+        self.mode = mode
+        self.pages = pages
+        self.connection = sqlite3.connect(":memory:", check_same_thread=False)
+        self.refreshed_at = 0.0
+        self.refreshes = 0
+        self._pinned = False
+        self._version: Optional[Tuple[int, int]] = None
+        self.refresh()
+
+    def _primary_version(self) -> Tuple[int, int]:
+        data_version = self.primary.execute("PRAGMA data_version").fetchone()[0]
+        return data_version, self.primary.total_changes
+
+    def refresh(self) -> None:
+        """Re-copy the primary into the replica now."""
+        version = self._primary_version()
+        self.connection.execute("PRAGMA query_only = OFF")
+        if self.mode == "deserialize":
+            self.connection.deserialize(self.primary.serialize())
+        else:
+            self.primary.backup(self.connection, pages=self.pages)
+        self.connection.execute("PRAGMA query_only = ON")
+        self._version = version
+        self.refreshed_at = time.monotonic()
+        self.refreshes += 1
+        logger.debug(f"Replica refreshed ({self.mode}), version {version}")
+
+    def is_stale(self) -> bool:
+        """True when the copy is past the staleness bound and the primary has changed since."""
+        if time.monotonic() - self.refreshed_at < self.max_staleness:
+            return False
+        return self._primary_version() != self._version
+
+    def refresh_if_stale(self) -> bool:
+        """Refresh when stale (never inside a pinned session); returns whether it refreshed."""
+        if self._pinned or not self.is_stale():
+            CACHE_EVENTS.labels("replica", "hit").inc()
+            return False
+        CACHE_EVENTS.labels("replica", "refresh").inc()
+        self.refresh()
+        return True
+
+    def cursor(self):
+        """A cursor on the replica, refreshed first if stale."""
+        self.refresh_if_stale()
+        return self.connection.cursor()
+
+    @contextmanager
+    def session(self, refresh: bool = True):
+        """
+        Pin the replica for a multi-query run so every query sees the same snapshot.
+        With refresh=True the replica is brought up to date on entry, regardless of staleness.
+        """
+        if refresh and self._primary_version() != self._version:
+            self.refresh()
+        self._pinned = True
+        try:
+            yield self.connection.cursor()
+        finally:
+            self._pinned = False
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,209 @@
+"""
+Weekly and monthly summary reports.
+All reports in a range are built from one date-ordered pass over Tasks and
+PointsLedger, so producing a year of weekly reports costs the same single scan
+as producing one. Reports render to text, Markdown or JSON.
+"""
+import json
+import logging
+import os
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from archive import history_source
+from clock import DateLike, get_clock, period_bounds, period_key, to_date, last_elapsed_day
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ("weekly", "monthly")
+FORMATS = {"text": "txt", "markdown": "md", "json": "json"}
+TOP_N = 3
+
+def recent_periods(period: str, count: int, today: Optional[DateLike] = None) -> Tuple[date, date]:
+    """Date range covering the last `count` periods, the current one included."""
+    if period not in PERIODS:
+        raise ValueError(f"Period must be one of: {', '.join(PERIODS)}")
+    start, end = period_bounds(today or get_clock().today(), period)
+    for _ in range(count - 1):
+        start, _ = period_bounds(start - timedelta(days=1), period)
+    return start, end
+
+def _units_between(lo: date, hi: date, habit_period: str) -> int:
+    return period_key(hi, habit_period) - period_key(lo, habit_period) + 1 if lo <= hi else 0
+
+class _PeriodStats:
+    """Per-habit counters for the period currently being scanned."""
+    __slots__ = ("completed", "completed_elapsed", "points")
+
+    def __init__(self):
+        self.completed = 0
+        self.completed_elapsed = 0
+        self.points = 0
+
+def build_reports(cursor, period: str = "weekly", start_date: Optional[DateLike] = None,
+                  end_date: Optional[DateLike] = None, today: Optional[DateLike] = None) -> List[Dict]:
+    """
+    Build one summary per period between start_date and end_date (default: the current period).
+
+    Returns:
+        list: One dict per period, oldest first, with per-habit completions,
+            expected/missed units, points and streak change, overall totals and
+            the top/bottom habits by completion rate
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Period must be one of: {', '.join(PERIODS)}")
+    today = to_date(today or get_clock().today())
+    first_start, _ = period_bounds(start_date or today, period)
+    _, last_end = period_bounds(end_date or today, period)
+    source = history_source(cursor)
+
+    habits = {
+        row[0]: {"habit_name": row[1], "habit_period": row[2], "created": to_date(row[3]), "active": row[4] == "active"}
+        for row in cursor.execute("SELECT id, habit_name, habit_period, creation_date, habit_status FROM Habits")
+    }
+    # Streak state carried into the first period: (unit of last completion, streak then)
+    carried = {
+        habit_id: (period_key(to_date(day), habits[habit_id]["habit_period"]), streak)
+        for habit_id, day, streak in cursor.execute(f"""
+            SELECT habit_id, MAX(task_log_date), streak FROM {source}
+            WHERE task_status = 'completed' AND task_log_date < ?
+            GROUP BY habit_id
+        """, (first_start.isoformat(),))
+        if habit_id in habits
+    }
+
+    def effective_streak(habit_id: int, day: date) -> int:
+        """Streak as of `day`: still alive if the last completion was this unit or the one before."""
+        last_unit, streak = carried.get(habit_id, (None, 0))
+        if last_unit is None or last_unit < period_key(day, habits[habit_id]["habit_period"]) - 1:
+            return 0
+        return streak
+
+    # Last day whose unit is over; the current unit cannot be missed yet
+    elapsed_through = {p: last_elapsed_day(p, today) for p in ("daily", "weekly")}
+
+    reports: List[Dict] = []
+    current: Dict[int, _PeriodStats] = {}
+    period_start, period_end = first_start, period_bounds(first_start, period)[1]
+    streak_start = {habit_id: effective_streak(habit_id, period_start - timedelta(days=1)) for habit_id in habits}
+
+    def close_period():
+        nonlocal current, period_start, period_end, streak_start
+        reports.append(_summarize(period, period_start, period_end, today, habits, current,
+                                  streak_start, effective_streak, elapsed_through))
+        period_start = period_end + timedelta(days=1)
+        period_end = period_bounds(period_start, period)[1]
+        streak_start = {habit_id: effective_streak(habit_id, period_start - timedelta(days=1)) for habit_id in habits}
+        current = {}
+
+    rows = cursor.execute(f"""
+        SELECT substr(task_log_date, 1, 10) AS day, 0 AS kind, habit_id, task_status = 'completed', streak
+        FROM {source} WHERE task_log_date >= ? AND task_log_date < ?
+        UNION ALL
+        SELECT substr(event_date, 1, 10), 1, habit_id, points, 0
+        FROM PointsLedger WHERE event_date >= ? AND event_date < ?
+        ORDER BY day, kind
+    """, (first_start.isoformat(), (last_end + timedelta(days=1)).isoformat()) * 2)
+
+    for day_text, kind, habit_id, value, streak in rows:
+        if habit_id not in habits:
+            continue
+        day = to_date(day_text)
+        while day > period_end:
+            close_period()
+        stats = current.get(habit_id)
+        if stats is None:
+            stats = current[habit_id] = _PeriodStats()
+        if kind == 1:
+            stats.points += value
+        elif value:
+            stats.completed += 1
+            if day <= elapsed_through[habits[habit_id]["habit_period"]]:
+                stats.completed_elapsed += 1
+            carried[habit_id] = (period_key(day, habits[habit_id]["habit_period"]), streak)
+
+    while period_start <= last_end:
+        close_period()
+    logger.info(f"Built {len(reports)} {period} reports from {first_start} to {last_end}")
+    return reports
+
+def _summarize(period, start, end, today, habits, current, streak_start, effective_streak, elapsed_through) -> Dict:
+    rows = []
+    as_of = min(end, today)
+    for habit_id, habit in habits.items():
+        stats = current.get(habit_id) or _PeriodStats()
+        if habit["created"] > end or (not habit["active"] and not stats.completed and not stats.points):
+            continue
+        lo = max(start, habit["created"])
+        expected = max(_units_between(lo, as_of, habit["habit_period"]), stats.completed)
+        elapsed = _units_between(lo, min(end, elapsed_through[habit["habit_period"]]), habit["habit_period"])
+        streak_end = effective_streak(habit_id, as_of)
+        rows.append({
+            "habit_id": habit_id,
+            "habit_name": habit["habit_name"],
+            "habit_period": habit["habit_period"],
+            "completed": stats.completed,
+            "expected": expected,
+            "missed": max(0, elapsed - stats.completed_elapsed),
+            "completion_rate": round(stats.completed / expected, 3) if expected else None,
+            "points": stats.points,
+            "streak_start": streak_start.get(habit_id, 0),
+            "streak_end": streak_end,
+            "streak_change": streak_end - streak_start.get(habit_id, 0),
+        })
+    rated = sorted((r for r in rows if r["completion_rate"] is not None),
+                   key=lambda r: (-r["completion_rate"], -r["points"], r["habit_name"]))
+    return {
+        "period": period,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "habits": rows,
+        "totals": {
+            "completed": sum(r["completed"] for r in rows),
+            "missed": sum(r["missed"] for r in rows),
+            "points": sum(r["points"] for r in rows),
+        },
+        "top": [r["habit_name"] for r in rated[:TOP_N]],
+        "bottom": [r["habit_name"] for r in reversed(rated[-TOP_N:])] if len(rated) > TOP_N else [],
+    }
+
+def _rate(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.0%}"
+
+def render_report(report: Dict, fmt: str = "text") -> str:
+    """Render one report as 'text', 'markdown' or 'json'."""
+    if fmt == "json":
+        return json.dumps(report, indent=2)
+    title = f"{report['period'].capitalize()} report {report['start']} to {report['end']}"
+    totals = report["totals"]
+    summary = f"Completed: {totals['completed']}  Missed: {totals['missed']}  Points: {totals['points']}"
+    if fmt == "markdown":
+        lines = [f"# {title}", "", summary, "",
+                 "| Habit | Completed | Missed | Rate | Points | Streak |",
+                 "|---|---:|---:|---:|---:|---:|"]
+        lines += [f"| {r['habit_name']} | {r['completed']}/{r['expected']} | {r['missed']} | {_rate(r['completion_rate'])} "
+                  f"| {r['points']} | {r['streak_end']} ({r['streak_change']:+d}) |" for r in report["habits"]]
+        lines += ["", f"**Top:** {', '.join(report['top']) or '-'}", "",
+                  f"**Needs attention:** {', '.join(report['bottom']) or '-'}"]
+        return "\n".join(lines) + "\n"
+    if fmt != "text":
+        raise ValueError(f"Format must be one of: {', '.join(FORMATS)}")
+    lines = [title, "=" * len(title), summary, ""]
+    lines += [f"{r['habit_name']:<20} {r['completed']:>3}/{r['expected']:<3} missed {r['missed']:<3} "
+              f"{_rate(r['completion_rate']):>5}  {r['points']:>4} pts  streak {r['streak_end']} ({r['streak_change']:+d})"
+              for r in report["habits"]]
+    lines += ["", f"Top: {', '.join(report['top']) or '-'}", f"Needs attention: {', '.join(report['bottom']) or '-'}"]
+    return "\n".join(lines) + "\n"
+
+def write_reports(reports: List[Dict], directory: str, fmt: str = "markdown") -> List[str]:
+    """Write each report to `<directory>/<period>-<start>.<ext>`; returns the paths written."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Format must be one of: {', '.join(FORMATS)}")
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for report in reports:
+        path = os.path.join(directory, f"{report['period']}-{report['start']}.{FORMATS[fmt]}")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(render_report(report, fmt))
+        paths.append(path)
+    return paths
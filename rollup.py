@@ -0,0 +1,181 @@
+"""
+Daily rollup maintenance and the heatmap/calendar readers built on top of it.
+DailyRollup is kept current by triggers on Tasks (see db.create_rollup_tables),
+so every reader here touches at most one row per (day, habit).
+"""
+import calendar
+import logging
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from clock import DateLike, to_date
+
+logger = logging.getLogger(__name__)
+
+# DailyRollup measure columns and the per-Task expression each one sums.
+# {row} is NEW/OLD inside triggers and Tasks in rebuild_daily_rollup.
+ROLLUP_MEASURES = [
+    ("completed", "({row}.task_status = 'completed')"),
+    ("skipped", "({row}.task_status = 'skipped')"),
+    ("missed", "({row}.task_status = 'missed')"),
+    ("mood_total", "COALESCE({row}.mood, 0)"),
+    ("mood_count", "({row}.mood IS NOT NULL)"),
+    ("mood_sq_total", "COALESCE({row}.mood * {row}.mood, 0)"),
+    ("completion_time_total", "COALESCE({row}.completion_time, 0)"),
+    ("completion_time_count", "({row}.completion_time IS NOT NULL)"),
+    ("completion_time_sq_total", "COALESCE({row}.completion_time * {row}.completion_time, 0)"),
+]
+
+# DailyRollup measures also summed per category and day in CategoryDailyRollup
+CATEGORY_MEASURES = ["completed", "skipped", "missed", "mood_total", "mood_count"]
+
+def _day_offsets(start: date, end: date) -> Dict[str, int]:
+    """Map every ISO day string in [start, end] to its offset from start."""
+    return {(start + timedelta(days=i)).isoformat(): i for i in range((end - start).days + 1)}
+
+def rebuild_daily_rollup(cursor, source: str = "Tasks") -> int:
+    """
+    Recompute DailyRollup from scratch with a single pass over Tasks.
+    Use after bulk imports or if the rollup is suspected to have drifted.
+    Pass source="AllTasks" with the archive attached to keep archived days.
+
+    Returns:
+        int: Number of rollup rows written
+    """
+    cursor.execute("DELETE FROM DailyRollup")
+    columns = ", ".join(name for name, _ in ROLLUP_MEASURES)
+    sums = ", ".join(f"SUM({expr.format(row=source)})" for _, expr in ROLLUP_MEASURES)
+    cursor.execute(f"""
+        INSERT INTO DailyRollup (day, habit_id, {columns})
+        SELECT COALESCE(date(task_log_date), substr(task_log_date, 1, 10)) AS day, habit_id, {sums}
+        FROM {source}
+        GROUP BY day, habit_id
+    """)
+    written = cursor.rowcount
+    logger.info(f"Daily rollup rebuilt: {written} rows")
+    return written
+
+def rebuild_category_rollup(cursor) -> int:
+    """Recompute CategoryDailyRollup from DailyRollup (habits without a category count as 0)."""
+    cursor.execute("DELETE FROM CategoryDailyRollup")
+    columns = ", ".join(CATEGORY_MEASURES)
+    sums = ", ".join(f"SUM(r.{name})" for name in CATEGORY_MEASURES)
+    cursor.execute(f"""
+        INSERT INTO CategoryDailyRollup (category_id, day, {columns})
+        SELECT COALESCE(h.category_id, 0), r.day, {sums}
+        FROM DailyRollup r JOIN Habits h ON h.id = r.habit_id
+        GROUP BY 1, 2
+    """)
+    return cursor.rowcount
+
+def get_daily_heatmap(cursor, start_date: DateLike, end_date: DateLike,
+                      habit_ids: Optional[Iterable[int]] = None,
+                      status: str = "completed") -> Dict[int, List[int]]:
+    """
+    Return a habit -> per-day count grid for the given date range.
+
+    Args:
+        start_date: First day of the grid (inclusive)
+        end_date: Last day of the grid (inclusive)
+        habit_ids: Restrict to these habits; they appear even with no activity
+        status: Which counter to read: completed, skipped or missed
+
+    Returns:
+        dict: habit_id -> list of counts, one entry per day from start_date
+    """
+    if status not in ("completed", "skipped", "missed"):
+        raise ValueError("Status must be one of: completed, skipped, missed")
+    start, end = to_date(start_date), to_date(end_date)
+    offsets = _day_offsets(start, end)
+    width = len(offsets)
+
+    query = f"SELECT habit_id, day, {status} FROM DailyRollup WHERE day BETWEEN ? AND ?"
+    params: list = [start.isoformat(), end.isoformat()]
+    grid: Dict[int, List[int]] = {}
+    if habit_ids is not None:
+        habit_ids = list(habit_ids)
+        grid = {hid: [0] * width for hid in habit_ids}
+        query += f" AND habit_id IN ({', '.join('?' * len(habit_ids))})"
+        params.extend(habit_ids)
+
+    for habit_id, day, count in cursor.execute(query, params):
+        row = grid.get(habit_id)
+        if row is None:
+            row = grid[habit_id] = [0] * width
+        row[offsets[day]] = count
+    return grid
+
+def get_weekly_heatmap(cursor, start_date: DateLike, end_date: DateLike,
+                       habit_id: Optional[int] = None) -> Dict[str, List[int]]:
+    """
+    Return a week x weekday grid of completions (Monday first).
+
+    Returns:
+        dict: ISO date of each week's Monday -> list of 7 completion counts
+    """
+    start, end = to_date(start_date), to_date(end_date)
+    start -= timedelta(days=start.weekday())
+    grid = {}
+    week = start
+    while week <= end:
+        grid[week.isoformat()] = [0] * 7
+        week += timedelta(days=7)
+
+    offsets = _day_offsets(start, end)
+    query = "SELECT day, SUM(completed) FROM DailyRollup WHERE day BETWEEN ? AND ?"
+    params: list = [start.isoformat(), end.isoformat()]
+    if habit_id is not None:
+        query += " AND habit_id = ?"
+        params.append(habit_id)
+    query += " GROUP BY day"
+
+    for day, completed in cursor.execute(query, params):
+        offset = offsets[day]
+        monday = (start + timedelta(days=offset - offset % 7)).isoformat()
+        grid[monday][offset % 7] = completed
+    return grid
+
+def get_month_calendar(cursor, year: int, month: int,
+                       habit_id: Optional[int] = None) -> Dict[str, Dict[str, Optional[float]]]:
+    """
+    Return per-day totals for a calendar month.
+
+    Returns:
+        dict: ISO day -> completed, skipped, missed, avg_mood and completion_time
+    """
+    first = date(year, month, 1)
+    last = date(year, month, calendar.monthrange(year, month)[1])
+    days = {
+        day: {"completed": 0, "skipped": 0, "missed": 0, "avg_mood": None, "completion_time": 0}
+        for day in _day_offsets(first, last)
+    }
+
+    query = """
+        SELECT day, SUM(completed), SUM(skipped), SUM(missed),
+               SUM(mood_total), SUM(mood_count), SUM(completion_time_total)
+        FROM DailyRollup WHERE day BETWEEN ? AND ?
+    """
+    params: list = [first.isoformat(), last.isoformat()]
+    if habit_id is not None:
+        query += " AND habit_id = ?"
+        params.append(habit_id)
+    query += " GROUP BY day"
+
+    for day, completed, skipped, missed, mood_total, mood_count, completion_time in cursor.execute(query, params):
+        days[day] = {
+            "completed": completed,
+            "skipped": skipped,
+            "missed": missed,
+            "avg_mood": round(mood_total / mood_count, 2) if mood_count else None,
+            "completion_time": completion_time,
+        }
+    return days
+
+def render_heatmap(grid: Dict[int, List[int]], labels: Dict[int, str]) -> str:
+    """Render a daily heatmap grid as one text row per habit."""
+    shades = " ░▒▓█"
+    lines = []
+    for habit_id, counts in grid.items():
+        cells = "".join(shades[min(c, len(shades) - 1)] if c > 0 else "·" for c in counts)
+        lines.append(f"{labels.get(habit_id, str(habit_id)):<20} {cells}")
+    return "\n".join(lines)
@@ -0,0 +1,142 @@
+"""
+Habit search backed by the FTS5 HabitSearch index (see db.create_search_tables).
+Matches habit names, descriptions and task notes with prefix matching and bm25
+ranking, then falls back to trigram substring and close-spelling matches on names.
+"""
+import difflib
+import logging
+import re
+import sqlite3
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+def _fts_available(cursor) -> bool:
+    return cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'HabitSearch'").fetchone() is not None
+
+def _has_table(cursor, name: str) -> bool:
+    return cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+def _prefix_query(text: str, column: Optional[str] = None) -> str:
+    """Turn free text into an FTS5 query where every word must match as a prefix."""
+    terms = " ".join(f'"{token}"*' for token in _TOKEN.findall(text))
+    if not terms:
+        return ""
+    return f"{column} : ({terms})" if column else terms
+
+def rebuild_search_index(cursor) -> int:
+    """
+    Repopulate HabitSearch (and HabitNameTrigrams) from Habits and Tasks,
+    including archived Tasks while the archive is attached.
+
+    Returns:
+        int: Number of index rows written
+    """
+    # archive imports db, which imports this module
+    from archive import history_source
+
+    if not _fts_available(cursor):
+        return 0
+    cursor.execute("DELETE FROM HabitSearch")
+    cursor.execute("""
+        INSERT INTO HabitSearch (rowid, habit_name, description, notes, habit_id)
+        SELECT -id, habit_name, COALESCE(description, ''), '', id FROM Habits
+    """)
+    written = cursor.rowcount
+    cursor.execute(f"""
+        INSERT INTO HabitSearch (rowid, habit_name, description, notes, habit_id)
+        SELECT task_id, '', '', notes, habit_id FROM {history_source(cursor)} WHERE COALESCE(notes, '') != ''
+    """)
+    written += cursor.rowcount
+    if _has_table(cursor, "HabitNameTrigrams"):
+        cursor.execute("DELETE FROM HabitNameTrigrams")
+        cursor.execute("INSERT INTO HabitNameTrigrams (rowid, habit_name) SELECT id, habit_name FROM Habits")
+    logger.info(f"Search index rebuilt: {written} rows")
+    return written
+
+def search_habits(cursor, query: str, limit: int = 20) -> List[Tuple[int, str, float, str]]:
+    """
+    Full-text search over habit names, descriptions and task notes.
+
+    Returns:
+        list: (habit_id, habit_name, score, snippet) best match first; lower
+            scores rank higher (bm25, names weighted above descriptions and notes)
+    """
+    match = _prefix_query(query)
+    if not match:
+        return []
+    if not _fts_available(cursor):
+        pattern = f"%{query.strip()}%"
+        return [(hid, name, 0.0, name) for hid, name in cursor.execute("""
+            SELECT id, habit_name FROM Habits
+            WHERE habit_name LIKE ? OR description LIKE ?
+               OR id IN (SELECT habit_id FROM Tasks WHERE notes LIKE ?)
+            LIMIT ?""", (pattern, pattern, pattern, limit))]
+    try:
+        rows = cursor.execute("""
+            SELECT s.habit_id, h.habit_name, bm25(HabitSearch, 10.0, 3.0, 1.0) AS score,
+                   snippet(HabitSearch, -1, '[', ']', '…', 8)
+            FROM HabitSearch s JOIN Habits h ON h.id = s.habit_id
+            WHERE HabitSearch MATCH ?
+            ORDER BY score
+            LIMIT ?
+        """, (match, limit * 5)).fetchall()
+    except sqlite3.OperationalError as e:
+        logger.warning(f"Search query failed for {query!r}: {e}")
+        return []
+    # Keep each habit's best-ranked hit (names and notes share one index)
+    results, seen = [], set()
+    for row in rows:
+        if row[0] not in seen:
+            seen.add(row[0])
+            results.append(row)
+    return results[:limit]
+
+def find_habits(cursor, name: str, limit: int = 5) -> List[Tuple[int, str]]:
+    """
+    Candidate habits for a user-typed name, best first: exact (case-insensitive)
+    match, then name-prefix matches, then substring matches, then close spellings.
+
+    Returns:
+        list: (habit_id, habit_name)
+    """
+    name = name.strip()
+    if not name:
+        return []
+    exact = cursor.execute(
+        "SELECT id, habit_name FROM Habits WHERE habit_name = ? COLLATE NOCASE", (name,)).fetchall()
+    if exact:
+        return exact
+
+    if _fts_available(cursor):
+        match = _prefix_query(name, "habit_name")
+        candidates = cursor.execute("""
+            SELECT h.id, h.habit_name FROM HabitSearch s JOIN Habits h ON h.id = s.habit_id
+            WHERE HabitSearch MATCH ? AND s.rowid < 0
+            ORDER BY bm25(HabitSearch) LIMIT ?
+        """, (match, limit)).fetchall() if match else []
+        if not candidates and len(name) >= 3 and _has_table(cursor, "HabitNameTrigrams"):
+            candidates = cursor.execute("""
+                SELECT h.id, h.habit_name FROM HabitNameTrigrams t JOIN Habits h ON h.id = t.rowid
+                WHERE HabitNameTrigrams MATCH ? ORDER BY rank LIMIT ?
+            """, ('"' + name.replace('"', '""') + '"', limit)).fetchall()
+    else:
+        candidates = cursor.execute(
+            "SELECT id, habit_name FROM Habits WHERE habit_name LIKE ? LIMIT ?", (f"%{name}%", limit)).fetchall()
+    if candidates:
+        return candidates
+
+    # Typo tolerance: compare against the (small) set of habit names
+    names = dict(cursor.execute("SELECT habit_name, id FROM Habits").fetchall())
+    lowered = {n.lower(): n for n in names}
+    close = difflib.get_close_matches(name.lower(), lowered, n=limit, cutoff=0.6)
+    return [(names[lowered[n]], lowered[n]) for n in close]
+
+def resolve_habit_id(cursor, name: str) -> Optional[int]:
+    """Habit id for a name if it resolves to exactly one habit (or an exact match), else None."""
+    candidates = find_habits(cursor, name)
+    if len(candidates) == 1 or (candidates and candidates[0][1].lower() == name.strip().lower()):
+        return candidates[0][0]
+    return None
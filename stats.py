@@ -0,0 +1,175 @@
+"""
+Mood and completion-time statistics per habit and per category.
+The relevant Task columns are loaded once into NumPy arrays and aggregated with
+group-by primitives (np.bincount over sorted group keys), never a query per habit.
+Means and variances over any date range can also be read straight from the
+DailyRollup sums (rollup_moments), which the Task triggers keep current.
+"""
+import logging
+from typing import Dict, Optional
+
+import numpy as np
+
+from archive import history_source
+
+logger = logging.getLogger(__name__)
+
+def load_task_arrays(cursor, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """
+    Load habit, category, status, mood, completion_time and weekday for Tasks in range.
+    Missing mood/completion_time are NaN; weekday is 0 = Monday.
+    """
+    query = f"""
+        SELECT t.habit_id, COALESCE(h.category_id, 0), t.task_status = 'completed',
+               t.mood, t.completion_time, substr(t.task_log_date, 1, 10)
+        FROM {history_source(cursor)} t JOIN Habits h ON h.id = t.habit_id
+    """
+    clauses, params = [], []
+    if start_date:
+        clauses.append("t.task_log_date >= ?")
+        params.append(start_date)
+    if end_date:
+        clauses.append("t.task_log_date <= ?")
+        params.append(end_date + " 99")  # include timestamped rows on end_date
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    rows = cursor.execute(query, params).fetchall()
+
+    if not rows:
+        empty = np.empty(0)
+        return {"habit_id": empty.astype(np.int64), "category_id": empty.astype(np.int64),
+                "completed": empty.astype(bool), "mood": empty, "completion_time": empty,
+                "weekday": empty.astype(np.int64)}
+    habit_id, category_id, completed, mood, completion_time, day = zip(*rows)
+    days = np.array(day, dtype="datetime64[D]").astype(np.int64)
+    return {
+        "habit_id": np.array(habit_id, dtype=np.int64),
+        "category_id": np.array(category_id, dtype=np.int64),
+        "completed": np.array(completed, dtype=bool),
+        "mood": np.array(mood, dtype=float),                       # None -> nan
+        "completion_time": np.array(completion_time, dtype=float),
+        "weekday": (days + 3) % 7,                                 # 1970-01-01 was a Thursday
+    }
+
+def _quantiles(groups: np.ndarray, values: np.ndarray, n_groups: int, qs) -> Dict[float, np.ndarray]:
+    """Per-group linear-interpolated quantiles (same definition as np.percentile)."""
+    order = np.lexsort((values, groups))
+    sorted_values = values[order]
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    result = {}
+    for q in qs:
+        out = np.full(n_groups, np.nan)
+        has = counts > 0
+        pos = starts[has] + (counts[has] - 1) * q
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.ceil(pos).astype(np.int64)
+        out[has] = sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+        result[q] = out
+    return result
+
+def _describe(groups: np.ndarray, values: np.ndarray, n_groups: int) -> Dict[str, np.ndarray]:
+    """count/mean/variance/median/p90 per group, ignoring NaN values."""
+    present = ~np.isnan(values)
+    g, v = groups[present], values[present]
+    count = np.bincount(g, minlength=n_groups)
+    total = np.bincount(g, weights=v, minlength=n_groups)
+    total_sq = np.bincount(g, weights=v * v, minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(count > 0, total / count, np.nan)
+        variance = np.where(count > 0, total_sq / count - mean * mean, np.nan)
+    quantiles = _quantiles(g, v, n_groups, (0.5, 0.9))
+    return {"count": count, "mean": mean, "variance": np.maximum(variance, 0, where=count > 0, out=variance),
+            "median": quantiles[0.5], "p90": quantiles[0.9]}
+
+def _correlation(groups: np.ndarray, x: np.ndarray, y: np.ndarray, n_groups: int) -> np.ndarray:
+    """Per-group Pearson correlation of x and y over rows where both are present."""
+    both = ~np.isnan(x) & ~np.isnan(y)
+    g, x, y = groups[both], x[both], y[both]
+    n = np.bincount(g, minlength=n_groups).astype(float)
+    sx, sy = np.bincount(g, x, n_groups), np.bincount(g, y, n_groups)
+    sxx, syy, sxy = np.bincount(g, x * x, n_groups), np.bincount(g, y * y, n_groups), np.bincount(g, x * y, n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = n * sxy - sx * sy
+        denom = np.sqrt((n * sxx - sx * sx) * (n * syy - sy * sy))
+        return np.where((n > 1) & (denom > 0), cov / denom, np.nan)
+
+def _grouped_stats(arrays: Dict[str, np.ndarray], key: str) -> Dict[int, Dict]:
+    labels, groups = np.unique(arrays[key], return_inverse=True)
+    n = len(labels)
+    if n == 0:
+        return {}
+    mood = _describe(groups, arrays["mood"], n)
+    duration = _describe(groups, arrays["completion_time"], n)
+    corr = _correlation(groups, arrays["mood"], arrays["completion_time"], n)
+
+    cell = groups * 7 + arrays["weekday"]
+    dow_completed = np.bincount(cell[arrays["completed"]], minlength=n * 7).reshape(n, 7)
+    has_mood = ~np.isnan(arrays["mood"])
+    dow_mood_n = np.bincount(cell[has_mood], minlength=n * 7).reshape(n, 7)
+    dow_mood_sum = np.bincount(cell[has_mood], weights=arrays["mood"][has_mood], minlength=n * 7).reshape(n, 7)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dow_mood = np.where(dow_mood_n > 0, dow_mood_sum / dow_mood_n, np.nan)
+
+    def clean(value):
+        return None if np.isnan(value) else round(float(value), 3)
+
+    result = {}
+    for i, label in enumerate(labels.tolist()):
+        result[label] = {
+            "mood": {name: clean(values[i]) if name != "count" else int(values[i]) for name, values in mood.items()},
+            "completion_time": {name: clean(values[i]) if name != "count" else int(values[i]) for name, values in duration.items()},
+            "mood_time_correlation": clean(corr[i]),
+            "weekday_completions": dow_completed[i].tolist(),
+            "weekday_mood": [clean(v) for v in dow_mood[i]],
+        }
+    return result
+
+def compute_habit_stats(cursor, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[int, Dict]:
+    """
+    Mood/completion-time statistics per habit.
+
+    Returns:
+        dict: habit_id -> mood and completion_time {count, mean, variance, median, p90},
+            mood_time_correlation, weekday_completions[7] and weekday_mood[7] (Monday first)
+    """
+    return _grouped_stats(load_task_arrays(cursor, start_date, end_date), "habit_id")
+
+def compute_category_stats(cursor, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[int, Dict]:
+    """Same as compute_habit_stats, keyed by category_id (0 = uncategorized)."""
+    return _grouped_stats(load_task_arrays(cursor, start_date, end_date), "category_id")
+
+def rollup_moments(cursor, start_date: str, end_date: str, by: str = "habit") -> Dict[int, Dict]:
+    """
+    Mean and variance of mood and completion_time from DailyRollup sums alone.
+    Cheap enough to call after every write, since the rollup is maintained incrementally.
+
+    Args:
+        by: 'habit' or 'category'
+    """
+    if by not in ("habit", "category"):
+        raise ValueError("by must be 'habit' or 'category'")
+    key = "r.habit_id" if by == "habit" else "COALESCE(h.category_id, 0)"
+    rows = cursor.execute(f"""
+        SELECT {key}, SUM(r.mood_count), SUM(r.mood_total), SUM(r.mood_sq_total),
+               SUM(r.completion_time_count), SUM(r.completion_time_total), SUM(r.completion_time_sq_total)
+        FROM DailyRollup r JOIN Habits h ON h.id = r.habit_id
+        WHERE r.day BETWEEN ? AND ?
+        GROUP BY 1
+    """, (start_date, end_date)).fetchall()
+    if not rows:
+        return {}
+    data = np.array(rows, dtype=float)
+    result = {}
+    for name, col in (("mood", 1), ("completion_time", 4)):
+        n, total, total_sq = data[:, col], data[:, col + 1], data[:, col + 2]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(n > 0, total / n, np.nan)
+            variance = np.where(n > 0, np.maximum(total_sq / n - mean * mean, 0), np.nan)
+        for i, label in enumerate(data[:, 0].astype(np.int64).tolist()):
+            result.setdefault(label, {})[name] = {
+                "count": int(n[i]),
+                "mean": None if np.isnan(mean[i]) else round(float(mean[i]), 3),
+                "variance": None if np.isnan(variance[i]) else round(float(variance[i]), 3),
+            }
+    return result
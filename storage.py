@@ -0,0 +1,505 @@
+"""
+Storage backends behind MyHabits and the analytics readers.
+SQLiteBackend runs the existing SQL against a connection (triggers keep rollups,
+search, sync and period status current). MemoryBackend keeps habits and tasks in
+dicts with a sorted array of completion dates per habit, for ephemeral sessions
+and fast tests; it has no triggers, ledger readers or sync. Both pass the same
+conformance tests.
+"""
+import bisect
+import difflib
+import logging
+import sqlite3
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Tuple
+
+from clock import get_clock, period_bounds
+from db import habit_day
+from models import HABIT_COLUMNS, TASK_COLUMNS, Habit, HabitRow, TaskRow
+from period_status import roll_over_period_status
+from points import record_points
+from rederive import current_streak, rederive_habit_history, replay_streaks
+from search import find_habits, search_habits
+
+logger = logging.getLogger(__name__)
+
+class DuplicateHabitError(sqlite3.IntegrityError):
+    """A habit with that name already exists (an IntegrityError, as SQLite raises)."""
+
+# Habits columns update_habit may set
+HABIT_FIELDS = ("habit_name", "habit_period", "habit_status", "streak", "best_streak", "last_completed")
+
+class StorageBackend(ABC):
+    """Data operations used by MyHabits and the analytics readers."""
+    cursor = None
+    connection = None
+
+    # --- Transactions ---
+    @property
+    @abstractmethod
+    def in_transaction(self) -> bool: ...
+
+    @abstractmethod
+    def begin(self) -> None:
+        """Start a write transaction (SQLite: BEGIN IMMEDIATE)."""
+
+    @abstractmethod
+    def commit(self) -> None: ...
+
+    @abstractmethod
+    def rollback(self) -> None: ...
+
+    @abstractmethod
+    def savepoint(self, name: str) -> None: ...
+
+    @abstractmethod
+    def release(self, name: str) -> None: ...
+
+    @abstractmethod
+    def rollback_to(self, name: str) -> None:
+        """Undo everything since the savepoint and release it."""
+
+    # --- Habits ---
+    @abstractmethod
+    def insert_habit(self, habit: Habit) -> int:
+        """Insert a new habit and return its id; DuplicateHabitError if the name is taken."""
+
+    @abstractmethod
+    def get_habit(self, habit_id: int) -> Optional[HabitRow]: ...
+
+    @abstractmethod
+    def habit_by_name(self, name: str) -> Optional[HabitRow]:
+        """The habit with exactly this name (names are unique), or None."""
+
+    @abstractmethod
+    def update_habit(self, habit_id: int, **fields) -> None:
+        """Set any of HABIT_FIELDS on one habit."""
+
+    @abstractmethod
+    def habits(self, status: Optional[str] = "active", period: Optional[str] = None) -> List[HabitRow]:
+        """Habits by status and period (None = any), in id order."""
+
+    @abstractmethod
+    def due_status(self, today, period: Optional[str] = None) -> List[Tuple[HabitRow, bool]]:
+        """Active habits with whether their period containing `today` is already done."""
+
+    @abstractmethod
+    def roll_over(self, today) -> int:
+        """Move stored period status to `today`; returns the number of habits moved."""
+
+    @abstractmethod
+    def find_habits(self, name: str, limit: int = 5) -> List[Tuple[int, str]]:
+        """Candidates for a typed name: exact, prefix, substring, then close spellings."""
+
+    @abstractmethod
+    def search_habits(self, query: str, limit: int = 20) -> List[Tuple[int, str, float, str]]:
+        """(habit_id, habit_name, score, snippet), best match first."""
+
+    # --- Tasks ---
+    @abstractmethod
+    def insert_completion(self, habit: HabitRow, log_date: str, periodicity: str, streak: int,
+                          period_start: str, period_end: str) -> Optional[int]:
+        """
+        Insert a completed Task unless the habit already has one in [period_start, period_end];
+        'missed' placeholders in the period are replaced. Returns the task id, or None.
+        """
+
+    @abstractmethod
+    def tasks(self, log_date: Optional[str] = None) -> List[TaskRow]:
+        """All Tasks, or those logged on one date, in task id order."""
+
+    @abstractmethod
+    def completion_dates(self, habit_id: int, start: Optional[str] = None, end: Optional[str] = None) -> List[str]:
+        """Sorted log dates of the habit's completed Tasks within [start, end]."""
+
+    # --- Bookkeeping ---
+    @abstractmethod
+    def add_points(self, habit: Habit, points: int, event_date: str, task_id: Optional[int]) -> None: ...
+
+    @abstractmethod
+    def has_request(self, idempotency_key: str) -> bool: ...
+
+    @abstractmethod
+    def save_request(self, idempotency_key: str, habit_id: int, task_id: int, created_at: str) -> None: ...
+
+    @abstractmethod
+    def rederive_history(self, habit_id: int, today) -> Dict[str, int]:
+        """Recompute streaks and Task periodicity/streak after a periodicity change."""
+
+class SQLiteBackend(StorageBackend):
+    def __init__(self, cursor, connection, clock=None):
+        self.cursor = cursor
+        self.connection = connection
+        self.clock = clock  # habit day stamped by the Habits triggers (default: the process clock)
+
+    def _habit_day(self):
+        return habit_day(self.cursor, (self.clock or get_clock()).today())
+
+    @property
+    def in_transaction(self) -> bool:
+        return self.connection.in_transaction
+
+    def begin(self) -> None:
+        self.cursor.execute("BEGIN IMMEDIATE")
+
+    def commit(self) -> None:
+        self.connection.commit()
+
+    def rollback(self) -> None:
+        self.connection.rollback()
+
+    def savepoint(self, name: str) -> None:
+        self.cursor.execute(f"SAVEPOINT {name}")
+
+    def release(self, name: str) -> None:
+        self.cursor.execute(f"RELEASE {name}")
+
+    def rollback_to(self, name: str) -> None:
+        self.cursor.execute(f"ROLLBACK TO {name}")
+        self.cursor.execute(f"RELEASE {name}")
+
+    def insert_habit(self, habit: Habit) -> int:
+        try:
+            with self._habit_day():
+                self.cursor.execute("""
+                    INSERT INTO Habits (habit_name, habit_period, creation_date, last_completed, streak, habit_status,
+                                        target_days, reminder_time)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (habit.name, habit.period, habit.creation_date, None, 0, habit.status,
+                     habit.target_days, habit.reminder_time))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateHabitError(str(e)) from e
+        return self.cursor.lastrowid
+
+    def get_habit(self, habit_id: int) -> Optional[HabitRow]:
+        row = self.cursor.execute(f"SELECT {HABIT_COLUMNS} FROM Habits WHERE id = ?", (habit_id,)).fetchone()
+        return HabitRow(*row) if row else None
+
+    def habit_by_name(self, name: str) -> Optional[HabitRow]:
+        row = self.cursor.execute(f"SELECT {HABIT_COLUMNS} FROM Habits WHERE habit_name = ?", (name,)).fetchone()
+        return HabitRow(*row) if row else None
+
+    def update_habit(self, habit_id: int, **fields) -> None:
+        unknown = set(fields) - set(HABIT_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot update Habits columns: {', '.join(sorted(unknown))}")
+        if fields:
+            assignments = ", ".join(f"{name} = ?" for name in fields)
+            try:
+                with self._habit_day():
+                    self.cursor.execute(f"UPDATE Habits SET {assignments} WHERE id = ?", (*fields.values(), habit_id))
+            except sqlite3.IntegrityError as e:
+                raise DuplicateHabitError(str(e)) from e
+
+    def habits(self, status: Optional[str] = "active", period: Optional[str] = None) -> List[HabitRow]:
+        query, params = f"SELECT {HABIT_COLUMNS} FROM Habits WHERE 1", []
+        if status is not None:
+            query += " AND habit_status = ?"
+            params.append(status)
+        if period is not None:
+            query += " AND habit_period = ?"
+            params.append(period)
+        return [HabitRow(*row) for row in self.cursor.execute(query + " ORDER BY id", params)]
+
+    def due_status(self, today, period: Optional[str] = None) -> List[Tuple[HabitRow, bool]]:
+        # HabitPeriodStatus is trigger-maintained; roll_over moves it to a new day
+        columns = ", ".join(f"h.{name}" for name in HabitRow._fields)
+        query = f"""
+            SELECT {columns}, COALESCE(s.done, 0) FROM Habits h LEFT JOIN HabitPeriodStatus s ON s.habit_id = h.id
+            WHERE h.habit_status = 'active'
+        """
+        params = []
+        if period is not None:
+            query += " AND h.habit_period = ?"
+            params.append(period)
+        return [(HabitRow(*row[:-1]), bool(row[-1])) for row in self.cursor.execute(query + " ORDER BY h.id", params)]
+
+    def roll_over(self, today) -> int:
+        return roll_over_period_status(self.cursor, today)
+
+    def find_habits(self, name: str, limit: int = 5) -> List[Tuple[int, str]]:
+        return find_habits(self.cursor, name, limit)
+
+    def search_habits(self, query: str, limit: int = 20) -> List[Tuple[int, str, float, str]]:
+        return search_habits(self.cursor, query, limit)
+
+    def insert_completion(self, habit: HabitRow, log_date: str, periodicity: str, streak: int,
+                          period_start: str, period_end: str) -> Optional[int]:
+        # A late completion replaces the sweeper's 'missed' placeholder for its period
+        self.cursor.execute("""
+            DELETE FROM Tasks WHERE habit_id = ? AND task_log_date BETWEEN ? AND ? AND task_status = 'missed'
+        """, (habit.id, period_start, period_end))
+
+        # Check-and-insert in one statement so the period check cannot go stale
+        self.cursor.execute("""
+            INSERT INTO Tasks (habit_id, task_name, task_log_date, periodicity, streak, task_status)
+            SELECT ?, ?, ?, ?, ?, 'completed'
+            WHERE NOT EXISTS (
+                SELECT 1 FROM Tasks WHERE habit_id = ? AND task_log_date BETWEEN ? AND ?
+            )
+        """, (habit.id, habit.habit_name, log_date, periodicity, streak, habit.id, period_start, period_end))
+        return self.cursor.lastrowid if self.cursor.rowcount else None
+
+    def tasks(self, log_date: Optional[str] = None) -> List[TaskRow]:
+        if log_date is None:
+            rows = self.cursor.execute(f"SELECT {TASK_COLUMNS} FROM Tasks ORDER BY task_id")
+        else:
+            rows = self.cursor.execute(f"SELECT {TASK_COLUMNS} FROM Tasks WHERE task_log_date = ? ORDER BY task_id",
+                                       (log_date,))
+        return [TaskRow(*row) for row in rows]
+
+    def completion_dates(self, habit_id: int, start: Optional[str] = None, end: Optional[str] = None) -> List[str]:
+        return [row[0] for row in self.cursor.execute("""
+            SELECT task_log_date FROM Tasks
+            WHERE habit_id = ? AND task_status = 'completed' AND task_log_date BETWEEN ? AND ?
+            ORDER BY task_log_date
+        """, (habit_id, start or "", end or "9999"))]
+
+    def add_points(self, habit: Habit, points: int, event_date: str, task_id: Optional[int]) -> None:
+        with self._habit_day():  # the ledger trigger updates Habits.points
+            record_points(self.cursor, habit, points, event_date, task_id=task_id)
+
+    def has_request(self, idempotency_key: str) -> bool:
+        return self.cursor.execute(
+            "SELECT 1 FROM CompletionRequests WHERE idempotency_key = ?", (idempotency_key,)).fetchone() is not None
+
+    def save_request(self, idempotency_key: str, habit_id: int, task_id: int, created_at: str) -> None:
+        self.cursor.execute("""
+            INSERT INTO CompletionRequests (idempotency_key, habit_id, task_id, created_at)
+            VALUES (?, ?, ?, ?)
+        """, (idempotency_key, habit_id, task_id, created_at))
+
+    def rederive_history(self, habit_id: int, today) -> Dict[str, int]:
+        with self._habit_day():
+            return rederive_habit_history(self.cursor, habit_id, today)
+
+class MemoryBackend(StorageBackend):
+    """
+    Dict-based engine: habits and tasks by id, plus per habit a sorted array of
+    (log date, task id) for all its Tasks and one of completed log dates, so
+    period checks and range counts are binary searches. Writes inside a transaction record their inverse
+    in an undo log, which rollback and rollback_to replay.
+    """
+    def __init__(self):
+        self._habits: Dict[int, HabitRow] = {}
+        self._names: Dict[str, int] = {}
+        self._tasks: Dict[int, TaskRow] = {}
+        self._days: Dict[int, List[Tuple[str, int]]] = {}
+        self._completed: Dict[int, List[str]] = {}
+        self._requests: Dict[str, Tuple[int, int, str]] = {}
+        self.ledger: List[Tuple[int, Optional[int], str, int, int]] = []
+        self._next_habit = self._next_task = 1
+        self._undo: Optional[List[Callable[[], None]]] = None
+        self._savepoints: Dict[str, int] = {}
+
+    # --- Transactions ---
+    @property
+    def in_transaction(self) -> bool:
+        return self._undo is not None
+
+    def begin(self) -> None:
+        if self._undo is not None:
+            raise RuntimeError("A transaction is already open")
+        self._undo = []
+
+    def commit(self) -> None:
+        self._undo = None
+        self._savepoints.clear()
+
+    def rollback(self) -> None:
+        self._unwind(0)
+        self.commit()
+
+    def savepoint(self, name: str) -> None:
+        if self._undo is None:
+            self.begin()
+        self._savepoints[name] = len(self._undo)
+
+    def release(self, name: str) -> None:
+        self._savepoints.pop(name)
+
+    def rollback_to(self, name: str) -> None:
+        self._unwind(self._savepoints.pop(name))
+
+    def _unwind(self, mark: int) -> None:
+        while self._undo and len(self._undo) > mark:
+            self._undo.pop()()
+
+    def _log(self, undo: Callable[[], None]) -> None:
+        if self._undo is not None:
+            self._undo.append(undo)
+
+    def _write_habit(self, habit_id: int, row: Optional[HabitRow]) -> None:
+        old = self._habits.pop(habit_id, None)
+        if old is not None:
+            del self._names[old.habit_name]
+        if row is not None:
+            self._habits[habit_id] = row
+            self._names[row.habit_name] = habit_id
+
+    def _put_habit(self, row: HabitRow) -> None:
+        old = self._habits.get(row.id)
+        self._write_habit(row.id, row)
+        self._log(lambda: self._write_habit(row.id, old))
+
+    def _write_task(self, task_id: int, row: Optional[TaskRow]) -> None:
+        old = self._tasks.pop(task_id, None)
+        if old is not None:
+            days = self._days[old.habit_id]
+            del days[bisect.bisect_left(days, (old.task_log_date, task_id))]
+            if old.task_status == "completed":
+                dates = self._completed[old.habit_id]
+                del dates[bisect.bisect_left(dates, old.task_log_date)]
+        if row is not None:
+            self._tasks[task_id] = row
+            bisect.insort(self._days.setdefault(row.habit_id, []), (row.task_log_date, task_id))
+            if row.task_status == "completed":
+                bisect.insort(self._completed.setdefault(row.habit_id, []), row.task_log_date)
+
+    def _put_task(self, task_id: int, row: Optional[TaskRow]) -> None:
+        old = self._tasks.get(task_id)
+        self._write_task(task_id, row)
+        self._log(lambda: self._write_task(task_id, old))
+
+    # --- Habits ---
+    def insert_habit(self, habit: Habit) -> int:
+        if habit.name in self._names:
+            raise DuplicateHabitError("UNIQUE constraint failed: Habits.habit_name")
+        habit_id, self._next_habit = self._next_habit, self._next_habit + 1
+        # Same column values the SQLite insert leaves to the table defaults
+        self._put_habit(HabitRow(habit_id, habit.name, None, habit.period, habit.creation_date,
+                                 None, 0, 0, habit.status, None, None, habit.target_days, habit.reminder_time, 0))
+        return habit_id
+
+    def get_habit(self, habit_id: int) -> Optional[HabitRow]:
+        return self._habits.get(habit_id)
+
+    def habit_by_name(self, name: str) -> Optional[HabitRow]:
+        habit_id = self._names.get(name)
+        return self._habits[habit_id] if habit_id is not None else None
+
+    def update_habit(self, habit_id: int, **fields) -> None:
+        unknown = set(fields) - set(HABIT_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot update Habits columns: {', '.join(sorted(unknown))}")
+        row = self._habits.get(habit_id)
+        if row is None:
+            return
+        name = fields.get("habit_name")
+        if name is not None and self._names.get(name, habit_id) != habit_id:
+            raise DuplicateHabitError("UNIQUE constraint failed: Habits.habit_name")
+        self._put_habit(row._replace(**fields))
+
+    def habits(self, status: Optional[str] = "active", period: Optional[str] = None) -> List[HabitRow]:
+        return [row for _, row in sorted(self._habits.items())
+                if (status is None or row.habit_status == status) and (period is None or row.habit_period == period)]
+
+    def _done_between(self, habit_id: int, start: str, end: str) -> bool:
+        dates = self._completed.get(habit_id, [])
+        i = bisect.bisect_left(dates, start)
+        return i < len(dates) and dates[i] <= end
+
+    def due_status(self, today, period: Optional[str] = None) -> List[Tuple[HabitRow, bool]]:
+        result = []
+        for row in self.habits("active", period):
+            start, end = period_bounds(today, row.habit_period)
+            result.append((row, self._done_between(row.id, start.isoformat(), end.isoformat() + "~")))
+        return result
+
+    def roll_over(self, today) -> int:
+        return 0  # due_status is computed on read
+
+    def find_habits(self, name: str, limit: int = 5) -> List[Tuple[int, str]]:
+        name = name.strip().lower()
+        if not name:
+            return []
+        rows = self.habits(status=None)
+        exact = [(r.id, r.habit_name) for r in rows if r.habit_name.lower() == name]
+        if exact:
+            return exact
+        candidates = [(r.id, r.habit_name) for r in rows if r.habit_name.lower().startswith(name)]
+        candidates += [(r.id, r.habit_name) for r in rows
+                       if name in r.habit_name.lower() and not r.habit_name.lower().startswith(name)]
+        if candidates:
+            return candidates[:limit]
+        lowered = {r.habit_name.lower(): r for r in rows}
+        close = difflib.get_close_matches(name, lowered, n=limit, cutoff=0.6)
+        return [(lowered[n].id, lowered[n].habit_name) for n in close]
+
+    def search_habits(self, query: str, limit: int = 20) -> List[Tuple[int, str, float, str]]:
+        words = query.lower().split()
+        if not words:
+            return []
+        notes: Dict[int, List[str]] = {}
+        for task in self._tasks.values():
+            if task.notes:
+                notes.setdefault(task.habit_id, []).append(task.notes)
+        results = []
+        for row in self.habits(status=None):
+            fields = [row.habit_name, row.description or ""] + notes.get(row.id, [])
+            text = " ".join(fields).lower()
+            if all(word in text for word in words):
+                hits = sum(text.count(word) for word in words)
+                snippet = next((f for f in fields if any(word in f.lower() for word in words)), row.habit_name)
+                results.append((row.id, row.habit_name, float(hits), snippet))
+        results.sort(key=lambda r: (-r[2], r[0]))
+        return results[:limit]
+
+    # --- Tasks ---
+    def insert_completion(self, habit: HabitRow, log_date: str, periodicity: str, streak: int,
+                          period_start: str, period_end: str) -> Optional[int]:
+        # Log dates may carry a time, so the end bound covers every suffix of its day
+        days = self._days.get(habit.id, [])
+        lo = bisect.bisect_left(days, (period_start,))
+        hi = bisect.bisect_right(days, (period_end + "~",))
+        in_period = [task_id for _, task_id in days[lo:hi]]
+        for task_id in in_period:
+            if self._tasks[task_id].task_status == "missed":
+                self._put_task(task_id, None)
+            else:
+                return None
+        task_id, self._next_task = self._next_task, self._next_task + 1
+        self._put_task(task_id, TaskRow(task_id, habit.id, habit.habit_name, periodicity, log_date, streak,
+                                        "completed", None, None, None))
+        return task_id
+
+    def tasks(self, log_date: Optional[str] = None) -> List[TaskRow]:
+        return [row for _, row in sorted(self._tasks.items()) if log_date is None or row.task_log_date == log_date]
+
+    def completion_dates(self, habit_id: int, start: Optional[str] = None, end: Optional[str] = None) -> List[str]:
+        dates = self._completed.get(habit_id, [])
+        lo = bisect.bisect_left(dates, start) if start else 0
+        hi = bisect.bisect_right(dates, end) if end else len(dates)
+        return dates[lo:hi]
+
+    # --- Bookkeeping ---
+    def add_points(self, habit: Habit, points: int, event_date: str, task_id: Optional[int]) -> None:
+        self.ledger.append((habit.id, task_id, event_date, points, habit.streak))
+        self._log(self.ledger.pop)
+        row = self._habits[habit.id]
+        self._put_habit(row._replace(points=(row.points or 0) + points))
+
+    def has_request(self, idempotency_key: str) -> bool:
+        return idempotency_key in self._requests
+
+    def save_request(self, idempotency_key: str, habit_id: int, task_id: int, created_at: str) -> None:
+        self._requests[idempotency_key] = (habit_id, task_id, created_at)
+        self._log(lambda: self._requests.pop(idempotency_key, None))
+
+    def rederive_history(self, habit_id: int, today) -> Dict[str, int]:
+        row = self._habits[habit_id]
+        period = row.habit_period
+        ordered = sorted((t for t in self._tasks.values() if t.habit_id == habit_id),
+                         key=lambda t: (t.task_log_date, t.task_id))
+        streaks, streak, best, last_key, last_completed = replay_streaks(
+            ((t.task_id, t.task_log_date, t.task_status) for t in ordered), period)
+        rewritten = 0
+        for task_id, value in streaks:
+            task = self._tasks[task_id]
+            if task.periodicity != period or task.streak != value:
+                self._put_task(task_id, task._replace(periodicity=period, streak=value))
+                rewritten += 1
+        current = current_streak(streak, last_key, period, today)
+        self._put_habit(row._replace(streak=current, best_streak=best, last_completed=last_completed))
+        return {"tasks_rewritten": rewritten, "missed_removed": 0, "missed_inserted": 0,
+                "streak": current, "best_streak": best}
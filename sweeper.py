@@ -0,0 +1,100 @@
+"""
+Missed-period sweeper.
+For every active habit, finds the periods that have fully elapsed since the
+habit's sweep watermark and have no Task, and inserts a 'missed' Task for each
+in one transaction together with the advanced watermarks. Re-running is safe
+(already-swept periods are behind the watermark) and cheap (only periods since
+the last sweep are examined). Missed counts then become indexed counts of
+'missed' rows (analytics.get_missed_period_counts).
+"""
+import logging
+from datetime import date, timedelta
+from typing import Optional
+
+from clock import get_clock, last_elapsed_day, period_start, to_date
+from db import retry_on_busy
+from metrics import ROWS
+
+logger = logging.getLogger(__name__)
+
+def sweep_habits(cursor, today: date, habit_id: Optional[int] = None) -> int:
+    """
+    Sweep inside the caller's transaction, optionally for a single habit.
+
+    Returns:
+        int: Number of 'missed' Tasks inserted
+    """
+    query = """
+        SELECT h.id, h.habit_name, h.habit_period, h.creation_date, w.swept_through
+        FROM Habits h LEFT JOIN SweepWatermark w ON w.habit_id = h.id
+        WHERE h.habit_status = 'active'"""
+    params = []
+    if habit_id is not None:
+        query += " AND h.id = ?"
+        params.append(habit_id)
+    plans = []
+    for hid, name, habit_period, creation_date, swept_through in cursor.execute(query, params).fetchall():
+        start = to_date(swept_through) + timedelta(days=1) if swept_through else to_date(creation_date)
+        start = period_start(start, habit_period)
+        through = last_elapsed_day(habit_period, today)
+        if start <= through:
+            plans.append((hid, name, habit_period, start, through))
+    if not plans:
+        return 0
+
+    # One range scan for every habit's Tasks since the oldest unswept period
+    first = min(plan[3] for plan in plans)
+    last = max(plan[4] for plan in plans)
+    periods = {hid: habit_period for hid, _, habit_period, _, _ in plans}
+    occupied = set()
+    for hid, log_date in cursor.execute(
+            "SELECT habit_id, task_log_date FROM Tasks WHERE task_log_date >= ? AND task_log_date < ?",
+            (first.isoformat(), (last + timedelta(days=1)).isoformat())):
+        if hid in periods:
+            occupied.add((hid, period_start(to_date(log_date), periods[hid])))
+
+    missed, watermarks = [], []
+    for hid, name, habit_period, start, through in plans:
+        step = timedelta(days=7 if habit_period == "weekly" else 1)
+        period = start
+        while period <= through:
+            if (hid, period) not in occupied:
+                missed.append((hid, name, habit_period, period.isoformat()))
+            period += step
+        watermarks.append((hid, through.isoformat()))
+
+    cursor.executemany("""
+        INSERT OR IGNORE INTO Tasks (habit_id, task_name, periodicity, task_log_date, streak, task_status)
+        VALUES (?, ?, ?, ?, 0, 'missed')
+    """, missed)
+    inserted = cursor.rowcount if missed else 0
+    cursor.executemany("""
+        INSERT INTO SweepWatermark (habit_id, swept_through) VALUES (?, ?)
+        ON CONFLICT(habit_id) DO UPDATE SET swept_through = excluded.swept_through
+    """, watermarks)
+    return inserted
+
+def sweep_missed_periods(connection, today: Optional[date] = None) -> int:
+    """
+    Materialize 'missed' Tasks for elapsed, empty periods of active habits.
+
+    Returns:
+        int: Number of 'missed' Tasks inserted
+    """
+    today = to_date(today or get_clock().today())
+    cursor = connection.cursor()
+
+    def sweep():
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            inserted = sweep_habits(cursor, today)
+            connection.commit()
+            return inserted
+        except Exception:
+            connection.rollback()
+            raise
+
+    inserted = retry_on_busy(sweep)
+    ROWS.labels("sweeper").inc(inserted)
+    logger.info(f"Missed-period sweep through {today}: {inserted} periods marked missed")
+    return inserted
@@ -0,0 +1,199 @@
+"""
+Delta sync between habit tracker databases.
+Each database logs changed Habits and Tasks in ChangeLog (see db.create_sync_tables).
+A sync pulls the peer's log entries past the last sequence seen from that peer,
+together with the current row payloads, and applies them. Conflicts are settled
+last-writer-wins on (changed_at, origin device), which every peer evaluates the
+same way, so all peers converge. Two different habits that end up with the same
+name (created or renamed independently on two devices) keep the name on the one
+with the lower global id; the other is renamed to "<name> (<global id>)", which
+every peer also derives identically. Habits.points is not replicated: each peer
+derives it from its own PointsLedger, which apply_changes rebuilds for the habits
+a batch touched. Cost is proportional to the number of changed rows, not the
+size of the database.
+"""
+import logging
+from typing import Dict, List, Optional, Set
+
+from points import recompute_points
+
+logger = logging.getLogger(__name__)
+
+# Habits columns derived locally from PointsLedger rather than replicated
+DERIVED_HABIT_COLUMNS = ("points",)
+
+def device_id(cursor) -> str:
+    return cursor.execute("SELECT value FROM SyncState WHERE key = 'device_id'").fetchone()[0]
+
+def _columns(cursor, table: str, skip) -> List[str]:
+    return [row[1] for row in cursor.execute(f"PRAGMA main.table_info({table})") if row[1] not in skip]
+
+def _split_task_gid(global_id: str):
+    habit_gid, _, log_date = global_id.rpartition("/")
+    return habit_gid, log_date
+
+def export_changes(cursor, since_seq: int = 0, exclude_origin: Optional[str] = None) -> Dict:
+    """
+    Changes logged after `since_seq`, with the current row for each upsert.
+
+    Args:
+        exclude_origin: Skip changes that came from this device (the requesting peer)
+
+    Returns:
+        dict: device_id, last_seq (highest sequence covered) and a JSON-serializable
+            list of changes {seq, entity, global_id, op, changed_at, origin, row}
+    """
+    habit_columns = _columns(cursor, "Habits", ("id",) + DERIVED_HABIT_COLUMNS)
+    task_columns = _columns(cursor, "Tasks", ("task_id", "habit_id"))
+    last_seq = cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM ChangeLog").fetchone()[0]
+    changes = []
+    for seq, entity, global_id, op, changed_at, origin in cursor.execute("""
+            SELECT seq, entity, global_id, op, changed_at, origin FROM ChangeLog
+            WHERE seq > ? AND seq <= ? AND origin != COALESCE(?, '')
+            ORDER BY seq""", (since_seq, last_seq, exclude_origin)).fetchall():
+        row = None
+        if op == "upsert":
+            if entity == "habit":
+                found = cursor.execute(f"""
+                    SELECT {', '.join('h.' + c for c in habit_columns)}
+                    FROM Habits h JOIN HabitGlobalIds g ON g.habit_id = h.id WHERE g.global_id = ?
+                """, (global_id,)).fetchone()
+                row = dict(zip(habit_columns, found)) if found else None
+            else:
+                habit_gid, log_date = _split_task_gid(global_id)
+                found = cursor.execute(f"""
+                    SELECT {', '.join('t.' + c for c in task_columns)}
+                    FROM Tasks t JOIN HabitGlobalIds g ON g.habit_id = t.habit_id
+                    WHERE g.global_id = ? AND t.task_log_date = ?
+                """, (habit_gid, log_date)).fetchone()
+                row = dict(zip(task_columns, found)) if found else None
+            if row is None:
+                continue  # row left the hot tables (e.g. archived) since it was logged
+        changes.append({"seq": seq, "entity": entity, "global_id": global_id, "op": op,
+                        "changed_at": changed_at, "origin": origin, "row": row})
+    return {"device_id": device_id(cursor), "last_seq": last_seq, "changes": changes}
+
+def _local_habit_id(cursor, global_id: str) -> Optional[int]:
+    found = cursor.execute("SELECT habit_id FROM HabitGlobalIds WHERE global_id = ?", (global_id,)).fetchone()
+    return found[0] if found else None
+
+def _settle_name(cursor, row: Dict, global_id: str, habit_id: Optional[int]) -> Dict:
+    """
+    Resolve a clash of the incoming habit's name with a different local habit
+    (Habits.habit_name is UNIQUE): the higher global id is renamed, here or locally.
+    """
+    name = row.get("habit_name")
+    clash = cursor.execute("""
+        SELECT h.id, COALESCE(g.global_id, '') FROM Habits h LEFT JOIN HabitGlobalIds g ON g.habit_id = h.id
+        WHERE h.habit_name = ? AND h.id IS NOT ?
+    """, (name, habit_id)).fetchone()
+    if clash is None:
+        return row
+    local_id, local_gid = clash
+    if global_id > local_gid:
+        return dict(row, habit_name=f"{name} ({global_id})")
+    cursor.execute("UPDATE Habits SET habit_name = ? WHERE id = ?", (f"{name} ({local_gid})", local_id))
+    return row
+
+def _apply_habit(cursor, change, touched: Set[int]) -> None:
+    habit_id = _local_habit_id(cursor, change["global_id"])
+    if change["op"] == "delete":
+        if habit_id is not None:
+            cursor.execute("DELETE FROM Habits WHERE id = ?", (habit_id,))  # cascades to its Tasks
+            touched.add(habit_id)
+        return
+    # Peers from before points were derived locally still send them
+    row = {c: v for c, v in change["row"].items() if c not in DERIVED_HABIT_COLUMNS}
+    row = _settle_name(cursor, row, change["global_id"], habit_id)
+    if habit_id is None:
+        columns = list(row)
+        cursor.execute(f"INSERT INTO Habits ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                       [row[c] for c in columns])
+        habit_id = cursor.lastrowid
+        cursor.execute("INSERT INTO HabitGlobalIds (habit_id, global_id) VALUES (?, ?)",
+                       (habit_id, change["global_id"]))
+    else:
+        cursor.execute(f"UPDATE Habits SET {', '.join(c + ' = ?' for c in row)} WHERE id = ?",
+                       [*row.values(), habit_id])
+    touched.add(habit_id)
+
+def _apply_task(cursor, change, touched: Set[int]) -> bool:
+    habit_gid, log_date = _split_task_gid(change["global_id"])
+    habit_id = _local_habit_id(cursor, habit_gid)
+    if habit_id is None or not cursor.execute("SELECT 1 FROM Habits WHERE id = ?", (habit_id,)).fetchone():
+        return False  # the habit was deleted here; its tombstone wins
+    touched.add(habit_id)
+    if change["op"] == "delete":
+        cursor.execute("DELETE FROM Tasks WHERE habit_id = ? AND task_log_date = ?", (habit_id, log_date))
+        return True
+    row = dict(change["row"], habit_id=habit_id)
+    columns = list(row)
+    cursor.execute(f"""
+        INSERT INTO Tasks ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})
+        ON CONFLICT(habit_id, task_log_date) DO UPDATE SET
+            {', '.join(f'{c} = excluded.{c}' for c in columns)}
+    """, [row[c] for c in columns])
+    return True
+
+def apply_changes(connection, batch: Dict) -> Dict[str, int]:
+    """
+    Apply a peer's export_changes() batch in one transaction and advance its watermark.
+    Points of the habits it touched are then rebuilt from their Tasks (recompute_points).
+
+    Returns:
+        dict: Counts of applied and skipped (older than the local version) changes
+    """
+    cursor = connection.cursor()
+    stats = {"applied": 0, "skipped": 0}
+    touched: Set[int] = set()
+    # Habits first, so Tasks can resolve a habit created later in the peer's log
+    ordered = sorted(batch["changes"], key=lambda c: (c["entity"] == "task", c["seq"]))
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute("INSERT OR REPLACE INTO MaintenanceFlags (name) VALUES ('sync_apply')")
+        for change in ordered:
+            local = cursor.execute("SELECT changed_at, origin FROM ChangeLog WHERE entity = ? AND global_id = ?",
+                                   (change["entity"], change["global_id"])).fetchone()
+            if local is not None and tuple(local) >= (change["changed_at"], change["origin"]):
+                stats["skipped"] += 1
+                continue
+            if change["entity"] == "habit":
+                applied = _apply_habit(cursor, change, touched)
+            else:
+                applied = _apply_task(cursor, change, touched)
+            if applied is False:
+                stats["skipped"] += 1
+                continue
+            cursor.execute("""
+                INSERT OR REPLACE INTO ChangeLog (entity, global_id, op, changed_at, origin)
+                VALUES (?, ?, ?, ?, ?)
+            """, (change["entity"], change["global_id"], change["op"], change["changed_at"], change["origin"]))
+            stats["applied"] += 1
+        # Still under 'sync_apply': derived points are not logged as local changes
+        recompute_points(cursor, touched)
+        cursor.execute("DELETE FROM MaintenanceFlags WHERE name = 'sync_apply'")
+        cursor.execute("""
+            INSERT INTO SyncPeers (peer_id, last_seq, synced_at) VALUES (?, ?, datetime('now'))
+            ON CONFLICT(peer_id) DO UPDATE SET last_seq = excluded.last_seq, synced_at = excluded.synced_at
+        """, (batch["device_id"], batch["last_seq"]))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return stats
+
+def pull(local, remote) -> Dict[str, int]:
+    """Apply `remote`'s changes not yet seen by `local`."""
+    cursor = local.cursor()
+    peer = device_id(remote.cursor())
+    found = cursor.execute("SELECT last_seq FROM SyncPeers WHERE peer_id = ?", (peer,)).fetchone()
+    batch = export_changes(remote.cursor(), found[0] if found else 0, exclude_origin=device_id(cursor))
+    stats = apply_changes(local, batch)
+    stats["received"] = len(batch["changes"])
+    return stats
+
+def sync(local, remote) -> Dict[str, Dict[str, int]]:
+    """Two-way sync: pull remote into local, then local into remote."""
+    stats = {"pulled": pull(local, remote), "pushed": pull(remote, local)}
+    logger.info(f"Sync finished: {stats}")
+    return stats
@@ -197,3 +197,986 @@ def test_edit_nonexistent_habit(my_habits, test_db):
     # Try to edit a non-existent habit (should handle gracefully)
     my_habits.edit_habit(99999, new_name="Test")
     # Should not raise an error, just print a message
+
+# --- Rollup Tests ---
+from rollup import rebuild_daily_rollup, get_daily_heatmap, get_month_calendar
+
+@pytest.fixture
+def fresh_db():
+    conn = create_connection(":memory:")
+    create_tables(conn.cursor())
+    conn.commit()
+    yield conn
+    conn.close()
+
+def test_daily_rollup_tracks_task_writes(fresh_db):
+    cur = fresh_db.cursor()
+    seed_analytics_data(cur)
+    id_a = cur.execute("SELECT id FROM Habits WHERE habit_name = 'A'").fetchone()[0]
+    cur.execute("UPDATE Tasks SET task_status = 'completed', mood = 4 WHERE habit_id = ? AND task_log_date = '2025-08-02'", (id_a,))
+    cur.execute("DELETE FROM Tasks WHERE habit_id = ? AND task_log_date = '2025-08-03'", (id_a,))
+
+    rows = cur.execute("SELECT day, completed, missed, mood_total, mood_count FROM DailyRollup WHERE habit_id = ? ORDER BY day", (id_a,)).fetchall()
+    assert rows == [("2025-08-02", 1, 0, 4, 1), ("2025-08-05", 1, 0, 0, 0), ("2025-08-06", 1, 0, 0, 0)]
+
+    before = cur.execute("SELECT * FROM DailyRollup ORDER BY day, habit_id").fetchall()
+    rebuild_daily_rollup(cur)
+    assert cur.execute("SELECT * FROM DailyRollup ORDER BY day, habit_id").fetchall() == before
+
+def test_heatmap_and_calendar_read_rollup(fresh_db):
+    cur = fresh_db.cursor()
+    seed_analytics_data(cur)
+    id_a = cur.execute("SELECT id FROM Habits WHERE habit_name = 'A'").fetchone()[0]
+    grid = get_daily_heatmap(cur, "2025-08-01", "2025-08-07", habit_ids=[id_a])
+    assert grid[id_a] == [0, 0, 0, 0, 1, 1, 0]
+    month = get_month_calendar(cur, 2025, 8)
+    assert len(month) == 31
+    assert month["2025-08-02"]["missed"] == 3
+    assert month["2025-08-05"]["completed"] == 2
+
+# --- Completion Index Tests ---
+from completion_index import CompletionIndex
+
+def test_completion_index_queries(fresh_db):
+    cur = fresh_db.cursor()
+    seed_analytics_data(cur)
+    id_a = cur.execute("SELECT id FROM Habits WHERE habit_name = 'A'").fetchone()[0]
+    index = CompletionIndex().load(cur)
+    assert index.is_done(id_a, "2025-08-05")
+    assert not index.is_done(id_a, "2025-08-04")
+    assert index.completed_count(id_a, end="2025-08-10") == 2
+    assert index.missed_count(id_a, through="2025-08-10") == 7   # 9 elapsed days, 2 done
+    assert index.longest_gap(id_a, through="2025-08-10") == 4    # 08-01..08-04
+    assert index.current_streak(id_a, through="2025-08-06") == 2
+    assert index.current_streak(id_a, through="2025-08-08") == 0
+    assert index.longest_streak(id_a) == 2
+    assert index.daily_heatmap("2025-08-04", "2025-08-07", [id_a]) == {id_a: [0, 1, 1, 0]}
+
+def test_completion_index_follows_my_habits(fresh_db):
+    index = CompletionIndex().load(fresh_db.cursor())
+    tracker = MyHabits(fresh_db.cursor(), fresh_db, listeners=[index])
+    tracker.add_habit("Indexed", 2)
+    habit_id = fresh_db.execute("SELECT id FROM Habits WHERE habit_name = 'Indexed'").fetchone()[0]
+    assert not index.is_done(habit_id, datetime.now())
+    tracker.mark_task_completed(habit_id)
+    assert index.is_done(habit_id, datetime.now())
+    assert index.current_streak(habit_id) == 1
+
+# --- Achievement Tests ---
+from achievements import AchievementEngine
+
+def test_achievement_backfill_is_idempotent(fresh_db):
+    cur = fresh_db.cursor()
+    seed_analytics_data(cur)
+    engine = AchievementEngine(cur, fresh_db)
+    awarded = {name for _, name in engine.backfill()}
+    assert awarded == {"First Habit"}
+    assert AchievementEngine(cur, fresh_db).backfill() == []
+    assert cur.execute("SELECT COUNT(*) FROM User_Achievements").fetchone()[0] == 1
+
+def test_achievement_awarded_from_completion_events(fresh_db):
+    cur = fresh_db.cursor()
+    engine = AchievementEngine(cur, fresh_db)
+    engine.backfill()
+    tracker = MyHabits(cur, fresh_db, listeners=[engine])
+    tracker.add_habit("Stretch", 1)
+    habit_id = cur.execute("SELECT id FROM Habits WHERE habit_name = 'Stretch'").fetchone()[0]
+    for day in range(1, 8):
+        engine.task_completed(habit_id, f"2025-09-0{day}", streak=day)
+    earned = {row[0] for row in cur.execute(
+        "SELECT a.name FROM User_Achievements ua JOIN Achievements a ON a.id = ua.achievement_id")}
+    assert earned == {"First Habit", "One Week Streak"}
+
+def test_achievement_listener_leaves_batch_transaction_open(fresh_db):
+    cur = fresh_db.cursor()
+    engine = AchievementEngine(cur, fresh_db)
+    tracker = MyHabits(cur, fresh_db, listeners=[engine])
+    with tracker.batch(max_ops=10):
+        tracker.add_habit("Batched", 1)                                 # awards "First Habit"
+        assert fresh_db.in_transaction
+        fresh_db.rollback()                                              # nothing was committed early
+    assert cur.execute("SELECT COUNT(*) FROM User_Achievements").fetchone()[0] == 0
+    assert cur.execute("SELECT COUNT(*) FROM Habits WHERE habit_name = 'Batched'").fetchone()[0] == 0
+
+def test_achievement_counters_resume_from_saved_state(fresh_db):
+    cur = fresh_db.cursor()
+    cur.execute("INSERT INTO Achievements (name, description, condition_type, condition_value) "
+                "VALUES ('Two Habits', 'Create two habits', 'create_habit', 2), "
+                "('Five Done', 'Complete five tasks', 'total_completions', 5)")
+    seed_analytics_data(cur)
+    cur.execute("UPDATE Habits SET creation_date = '2025-08-02' WHERE habit_name = 'B'")
+    cur.execute("UPDATE Habits SET creation_date = '2025-08-03' WHERE habit_name = 'C'")
+    AchievementEngine(cur, fresh_db).backfill()
+    dates = dict(cur.execute("SELECT a.name, ua.earned_date FROM User_Achievements ua "
+                             "JOIN Achievements a ON a.id = ua.achievement_id"))
+    assert dates["First Habit"] == "2025-08-01" and dates["Two Habits"] == "2025-08-02"
+
+    # A restart picks up the saved counters and replays only the newer Task
+    id_a = cur.execute("SELECT id FROM Habits WHERE habit_name = 'A'").fetchone()[0]
+    cur.execute("INSERT INTO Tasks (habit_id, task_name, periodicity, task_log_date, streak, task_status) "
+                "VALUES (?, 'A', 'daily', '2025-08-07', 3, 'completed')", (id_a,))
+    engine = AchievementEngine(cur, fresh_db)
+    assert [name for _, name in engine.resume()] == ["Five Done"]
+    assert engine.counters["total_completions"] == 5 and engine.counters["streak"] == 3
+    assert engine.resume() == []
+
+# --- Points Tests ---
+from points import recompute_points, get_leaderboard, get_category_leaderboard, get_total_points
+
+def test_completion_writes_points_ledger(fresh_db):
+    cur = fresh_db.cursor()
+    tracker = MyHabits(cur, fresh_db)
+    tracker.add_habit("Read", 1)
+    habit_id = cur.execute("SELECT id FROM Habits WHERE habit_name = 'Read'").fetchone()[0]
+    tracker.mark_task_completed(habit_id)
+    assert cur.execute("SELECT points, best_streak FROM Habits WHERE id = ?", (habit_id,)).fetchone() == (10, 1)
+    assert cur.execute("SELECT COUNT(*), SUM(points) FROM PointsLedger").fetchone() == (1, 10)
+    assert get_total_points(cur) == 10
+
+def test_recompute_points_and_leaderboards(fresh_db):
+    cur = fresh_db.cursor()
+    seed_analytics_data(cur)
+    cur.execute("UPDATE Habits SET category_id = 1, difficulty = 'hard' WHERE habit_name = 'A'")
+    total = recompute_points(cur)
+    # A: two consecutive days (hard, 15 each); B and C: one completion each (medium, 10)
+    assert total == 50
+    assert get_leaderboard(cur, limit=1)[0][1:] == ("A", 30)
+    assert get_leaderboard(cur, start_date="2025-08-06", category_id=1) == [(get_leaderboard(cur, limit=1)[0][0], "A", 15)]
+    assert get_category_leaderboard(cur)[0][1:] == ("Health", 30)
+    assert recompute_points(cur) == 50
+
+def test_live_scoring_matches_recompute_after_a_gap(fresh_db):
+    cur = fresh_db.cursor()
+    clock = FrozenClock(datetime(2025, 9, 1, 8))
+    tracker = MyHabits(cur, fresh_db, clock=clock)
+    tracker.add_habit("Gappy", 1)
+    habit_id = tracker.find_habit_id("Gappy")
+    for day in range(1, 10):
+        if day != 8:                                            # miss the 8th
+            tracker.mark_task_completed(habit_id)
+        clock.advance(days=1)
+    assert cur.execute("SELECT streak, best_streak FROM Habits WHERE id = ?", (habit_id,)).fetchone() == (1, 7)
+    live = cur.execute("SELECT task_id, points, streak FROM PointsLedger ORDER BY task_id").fetchall()
+    assert live[-1][1:] == (10, 1)                              # the streak bonus restarts with the streak
+    recompute_points(cur)
+    assert cur.execute("SELECT task_id, points, streak FROM PointsLedger ORDER BY task_id").fetchall() == live
+
+# --- Reminder Tests ---
+import queue
+from datetime import timedelta
+from reminders import ReminderScheduler, QueueSink
+
+def test_reminder_scheduler_fires_and_skips_done(fresh_db):
+    cur = fresh_db.cursor()
+    cur.executemany("INSERT INTO Habits (habit_name, habit_period, creation_date, habit_status, reminder_time) VALUES (?, ?, ?, 'active', ?)", [
+        ("Walk", "daily", "2025-09-01", "08:00"),
+        ("Review", "weekly", "2025-09-01", "09:30"),
+        ("Silent", "daily", "2025-09-01", None),
+    ])
+    walk, review = (cur.execute("SELECT id FROM Habits WHERE habit_name = ?", (n,)).fetchone()[0] for n in ("Walk", "Review"))
+    cur.execute("INSERT INTO Tasks (habit_id, task_name, periodicity, task_log_date, task_status) VALUES (?, 'Review', 'weekly', '2025-09-01', 'completed')", (review,))
+
+    start = datetime(2025, 9, 2, 7, 0)   # Tuesday
+    scheduler = ReminderScheduler(QueueSink(queue.Queue()), now=lambda: start).load(cur)
+    assert len(scheduler) == 2
+    assert scheduler.pop_due(start) == []
+
+    due = scheduler.pop_due(start + timedelta(hours=3))
+    assert [(r.habit_id, r.due_at.hour) for r in due] == [(walk, 8)]   # weekly one already done
+
+    scheduler.task_completed(walk, "2025-09-03")
+    scheduler.habit_deactivated(review)
+    assert scheduler.pop_due(datetime(2025, 9, 3, 23, 0)) == []
+    assert [r.habit_id for r in scheduler.pop_due(datetime(2025, 9, 4, 8, 0))] == [walk]
+
+def test_reminders_follow_added_habits_in_the_clock_zone(fresh_db):
+    from zoneinfo import ZoneInfo
+    clock = FrozenClock(datetime(2025, 9, 2, 12), tz="America/New_York", rollover_hour=4)
+    scheduler = ReminderScheduler(QueueSink(queue.Queue()), clock=clock)
+    tracker = MyHabits(fresh_db.cursor(), fresh_db, listeners=[scheduler], clock=clock)
+    tracker.add_habit("Night Pill", 1, reminder_time="01:00")
+    habit_id = tracker.find_habit_id("Night Pill")
+    assert len(scheduler) == 1
+    assert scheduler._heap[0][0] == datetime(2025, 9, 3, 1, tzinfo=ZoneInfo("America/New_York")).timestamp()
+
+    tracker.mark_task_completed(habit_id)                               # habit day 2025-09-02
+    assert scheduler.pop_due(datetime(2025, 9, 3, 1, 30)) == []         # 01:00 on the 3rd is still the 2nd
+    due = scheduler.pop_due(datetime(2025, 9, 4, 1, 30))
+    assert [(r.habit_id, r.due_at) for r in due] == [(habit_id, datetime(2025, 9, 4, 1, 0))]
+
+# --- Journal Tests ---
+from journal import CompletionJournal
+
+def test_journal_reads_merge_and_compaction(fresh_db, tmp_path):
+    cur = fresh_db.cursor()
+    tracker = MyHabits(cur, fresh_db)
+    tracker.add_habit("Journaled", 1)
+    habit_id = cur.execute("SELECT id FROM Habits WHERE habit_name = 'Journaled'").fetchone()[0]
+    journal = CompletionJournal(str(tmp_path / "journal.db"), group_size=2)
+
+    journal.append(habit_id, datetime(2025, 9, 1, 7, 0))
+    assert journal.is_completed(cur, habit_id, datetime(2025, 9, 1).date())   # still buffered
+    journal.append(habit_id, datetime(2025, 9, 1, 9, 0))                      # duplicate, flushes group
+    journal.append(habit_id, datetime(2025, 9, 2, 7, 0))
+    assert habit_id in journal.completed_habits_on(cur, "2025-09-02")
+
+    assert journal.compact(tracker, batch_size=2) == 3
+    assert journal.pending(cur) == []
+    rows = cur.execute("SELECT task_log_date, streak FROM Tasks WHERE habit_id = ? ORDER BY task_log_date", (habit_id,)).fetchall()
+    assert rows == [("2025-09-01", 1), ("2025-09-02", 2)]
+    assert journal.compact(tracker) == 0
+    journal.close()
+
+def test_journal_days_follow_the_rollover_and_watermark_is_absolute(fresh_db, tmp_path, monkeypatch):
+    cur = fresh_db.cursor()
+    clock = FrozenClock(datetime(2025, 9, 2, 1), rollover_hour=4)
+    tracker = MyHabits(cur, fresh_db, clock=clock)
+    tracker.add_habit("Late Night", 1)
+    habit_id = tracker.find_habit_id("Late Night")
+    monkeypatch.chdir(tmp_path)
+    journal = CompletionJournal("night.journal.db", clock=clock)
+    journal.append(habit_id)                                            # 01:00 on the 2nd is the 1st
+    assert habit_id in journal.completed_habits_on(cur, "2025-09-01")
+    assert journal.is_completed(cur, habit_id, date(2025, 9, 1))
+    assert not journal.is_completed(cur, habit_id, date(2025, 9, 2))
+
+    assert journal.compact(tracker) == 1
+    assert cur.execute("SELECT journal FROM JournalWatermark").fetchall() == [(str(tmp_path / "night.journal.db"),)]
+    assert cur.execute("SELECT task_log_date FROM Tasks").fetchall() == [("2025-09-01",)]
+    journal.close()
+
+# --- Batching Tests ---
+import sqlite3
+
+def test_batch_shares_transactions_and_isolates_failures(tmp_path):
+    path = str(tmp_path / "batch.db")
+    conn = create_connection(path)
+    create_tables(conn.cursor())
+    conn.commit()
+    observer = create_connection(path)
+    index = CompletionIndex().load(conn.cursor())
+    tracker = MyHabits(conn.cursor(), conn, listeners=[index])
+
+    with tracker.batch(max_ops=100, max_delay=60):
+        tracker.add_habit("Batched", 1)
+        habit_id = tracker.cursor.execute("SELECT id FROM Habits WHERE habit_name = 'Batched'").fetchone()[0]
+        tracker.mark_task_completed(habit_id)                       # reads its own pending write
+        with pytest.raises(sqlite3.IntegrityError):
+            tracker.add_habit("Batched", 2)                         # duplicate name, rolled back alone
+        assert observer.execute("SELECT COUNT(*) FROM Habits").fetchone()[0] == 0
+        assert index.is_done(habit_id, datetime.now())
+
+    assert observer.execute("SELECT habit_period, streak FROM Habits").fetchall() == [("daily", 1)]
+    assert observer.execute("SELECT COUNT(*) FROM Tasks").fetchone()[0] == 1
+
+    with tracker.batch(max_ops=2, max_delay=60):
+        tracker.add_habit("Auto 1", 1)
+        tracker.add_habit("Auto 2", 1)                              # hits max_ops, flushes
+        assert observer.execute("SELECT COUNT(*) FROM Habits").fetchone()[0] == 3
+    observer.close()
+    conn.close()
+
+# --- Concurrent Write Tests ---
+import multiprocessing
+
+def _completion_worker(path, habit_ids, rounds):
+    conn = create_connection(path)
+    tracker = MyHabits(conn.cursor(), conn)
+    for round_no in range(rounds):
+        for habit_id in habit_ids:
+            tracker.mark_task_completed(habit_id, idempotency_key=f"{habit_id}-{round_no % 2}")
+    conn.close()
+
+def test_concurrent_completions_are_not_lost_or_duplicated(tmp_path):
+    path = str(tmp_path / "stress.db")
+    conn = create_connection(path)
+    create_tables(conn.cursor())
+    conn.commit()
+    tracker = MyHabits(conn.cursor(), conn)
+    for i in range(6):
+        tracker.add_habit(f"Stress {i}", 1 if i % 2 else 2)
+    habit_ids = [row[0] for row in conn.execute("SELECT id FROM Habits")]
+
+    workers = [multiprocessing.Process(target=_completion_worker, args=(path, habit_ids, 5)) for _ in range(4)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    assert all(w.exitcode == 0 for w in workers)
+
+    assert conn.execute("SELECT habit_id, COUNT(*) FROM Tasks GROUP BY habit_id").fetchall() == [(h, 1) for h in habit_ids]
+    assert conn.execute("SELECT DISTINCT streak FROM Habits").fetchall() == [(1,)]
+    assert conn.execute("SELECT COUNT(*) FROM PointsLedger").fetchone()[0] == len(habit_ids)
+    assert conn.execute("SELECT COUNT(*) FROM CompletionRequests").fetchone()[0] == len(habit_ids)
+    conn.close()
+
+# --- Load Test Harness Tests ---
+from load_test import run_load_test
+
+def test_load_test_reports_throughput(tmp_path):
+    report = run_load_test(str(tmp_path / "load.db"), writers=2, readers=1, duration=0.5, habits=5, journal_mode="wal")
+    assert report["writes"]["ops"] > 0 and report["reads"]["ops"] > 0
+    assert report["errors"] == 0
+    assert report["writes"]["outcomes"].get("completed", 0) > 0
+    assert report["db_bytes_growth"] >= 0
+
+# --- Search Tests ---
+from search import search_habits, find_habits, rebuild_search_index
+
+def test_search_index_tracks_habits_and_notes(fresh_db):
+    cur = fresh_db.cursor()
+    tracker = MyHabits(cur, fresh_db)
+    tracker.add_habit("Morning Exercise", 1)
+    tracker.add_habit("Evening Reading", 1)
+    exercise = tracker.find_habit_id("morning exercise")
+    cur.execute("UPDATE Habits SET description = 'Stretching and cardio' WHERE id = ?", (exercise,))
+    cur.execute("INSERT INTO Tasks (habit_id, task_name, periodicity, task_log_date, task_status, notes) VALUES (?, 'Evening Reading', 'daily', '2025-09-01', 'completed', 'finished the novel')",
+                (tracker.find_habit_id("Evening Reading"),))
+
+    assert [r[1] for r in search_habits(cur, "exer")] == ["Morning Exercise"]
+    assert [r[1] for r in search_habits(cur, "cardio")] == ["Morning Exercise"]
+    assert [r[1] for r in search_habits(cur, "nov")] == ["Evening Reading"]
+
+    tracker.edit_habit(exercise, new_name="Workout")
+    assert search_habits(cur, "exercise") == []
+    assert find_habits(cur, "kout") == [(exercise, "Workout")]       # substring
+    assert find_habits(cur, "Wrkout") == [(exercise, "Workout")]     # typo
+    tracker.add_habit("Evening Walk", 1)
+    assert tracker.find_habit_id("evening") is None                  # ambiguous
+    before = cur.execute("SELECT rowid, * FROM HabitSearch ORDER BY rowid").fetchall()
+    rebuild_search_index(cur)
+    assert cur.execute("SELECT rowid, * FROM HabitSearch ORDER BY rowid").fetchall() == before
+
+# --- Stats Tests ---
+import numpy as np
+from stats import compute_habit_stats, compute_category_stats, rollup_moments
+
+def test_habit_stats_match_numpy_reference(fresh_db):
+    cur = fresh_db.cursor()
+    cur.execute("INSERT INTO Habits (habit_name, habit_period, creation_date, streak, habit_status, category_id) VALUES ('Stats A', 'daily', '2025-09-01', 0, 'active', 1)")
+    habit_id = cur.lastrowid
+    moods = [3, 4, 5, 2, 4, 5, 1]
+    minutes = [20, 25, 40, 10, 30, 45, 5]
+    for i, (mood, minute) in enumerate(zip(moods, minutes)):
+        cur.execute("INSERT INTO Tasks (habit_id, task_name, periodicity, task_log_date, task_status, mood, completion_time) VALUES (?, 'Stats A', 'daily', ?, 'completed', ?, ?)",
+                    (habit_id, f"2025-09-{i + 1:02d}", mood, minute))
+
+    stats = compute_habit_stats(cur)[habit_id]
+    assert stats["mood"]["count"] == 7
+    assert stats["mood"]["median"] == np.median(moods)
+    assert stats["completion_time"]["p90"] == round(float(np.percentile(minutes, 90)), 3)
+    assert stats["completion_time"]["variance"] == round(float(np.var(minutes)), 3)
+    assert stats["mood_time_correlation"] == round(float(np.corrcoef(moods, minutes)[0, 1]), 3)
+    assert stats["weekday_completions"] == [1] * 7              # 2025-09-01 is a Monday
+    assert compute_category_stats(cur)[1]["mood"]["mean"] == round(float(np.mean(moods)), 3)
+
+    moments = rollup_moments(cur, "2025-09-01", "2025-09-07")[habit_id]
+    assert moments["mood"] == {k: stats["mood"][k] for k in ("count", "mean", "variance")}
+
+# --- Report Tests ---
+import os
+from reports import build_reports, render_report, write_reports
+
+def test_weekly_reports_in_one_pass(fresh_db, tmp_path):
+    cur = fresh_db.cursor()
+    tracker = MyHabits(cur, fresh_db)
+    tracker.add_habit("Reporting", 1)
+    habit_id = tracker.find_habit_id("Reporting")
+    cur.execute("UPDATE Habits SET creation_date = '2025-09-01' WHERE id = ?", (habit_id,))
+    for day in (1, 2, 3, 8, 9):                                    # weeks of Sep 1 and Sep 8
+        tracker.mark_tasks_completed([(habit_id, datetime(2025, 9, day, 8, 0))])
+
+    first, second = build_reports(cur, "weekly", "2025-09-01", "2025-09-14", today="2025-09-20")
+    row = first["habits"][0]
+    assert (row["completed"], row["expected"], row["missed"], row["streak_end"]) == (3, 7, 4, 0)
+    assert row["points"] > 0 and first["top"] == ["Reporting"]
+    row = second["habits"][0]
+    assert (row["completed"], row["missed"], row["streak_start"], row["streak_change"]) == (2, 5, 0, 0)
+
+    assert "| Reporting | 3/7 |" in render_report(first, "markdown")
+    paths = write_reports([first, second], str(tmp_path), "json")
+    assert [os.path.basename(p) for p in paths] == ["weekly-2025-09-01.json", "weekly-2025-09-08.json"]
+
+# --- Archive Tests ---
+from datetime import date
+from archive import archive_tasks, habit_totals, detach_archive
+
+def test_archive_moves_old_tasks_and_keeps_history(fresh_db, tmp_path):
+    cur = fresh_db.cursor()
+    tracker = MyHabits(cur, fresh_db)
+    tracker.add_habit("Archived", 1)
+    habit_id = tracker.find_habit_id("Archived")
+    start = datetime(2024, 1, 1, 8, 0)
+    tracker.mark_tasks_completed([(habit_id, start + timedelta(days=i)) for i in range(40)])
+    rollup_before = cur.execute("SELECT * FROM DailyRollup ORDER BY day").fetchall()
+    totals_before = habit_totals(cur)
+
+    moved = archive_tasks(fresh_db, horizon_days=30, batch_size=7, today=date(2024, 2, 10), path=tmp_path / "cold.db")
+    assert moved == 10                                                  # 2024-01-01 .. 2024-01-10
+    assert cur.execute("SELECT COUNT(*) FROM main.Tasks").fetchone()[0] == 30
+    assert cur.execute("SELECT COUNT(*) FROM archive.Tasks").fetchone()[0] == 10
+    assert cur.execute("SELECT COUNT(*) FROM AllTasks").fetchone()[0] == 40
+    assert cur.execute("SELECT * FROM DailyRollup ORDER BY day").fetchall() == rollup_before
+    assert habit_totals(cur) == totals_before
+    assert CompletionIndex().load(cur).completed_count(habit_id) == 40
+
+    detach_archive(fresh_db)
+    assert habit_totals(cur)[habit_id]["completed"] == 40               # summary rows live in the hot DB
+    with pytest.raises(ValueError):
+        archive_tasks(fresh_db, horizon_days=3)
+
+def test_archived_task_notes_stay_searchable(fresh_db, tmp_path):
+    cur = fresh_db.cursor()
+    tracker = MyHabits(cur, fresh_db)
+    tracker.add_habit("Piano", 1)
+    habit_id = tracker.find_habit_id("Piano")
+    tracker.mark_tasks_completed([(habit_id, datetime(2024, 1, 1, 8) + timedelta(days=i)) for i in range(3)])
+    cur.execute("UPDATE Tasks SET notes = 'played the nocturne' WHERE task_log_date = '2024-01-01'")
+    fresh_db.commit()
+
+    assert archive_tasks(fresh_db, horizon_days=30, today=date(2024, 3, 1), path=tmp_path / "cold.db") == 3
+    assert [hit[0] for hit in search_habits(cur, "nocturne")] == [habit_id]
+    rebuild_search_index(cur)                                           # the archive is attached
+    assert [hit[0] for hit in search_habits(cur, "nocturne")] == [habit_id]
+
+# --- Backup Tests ---
+from backup import backup_database, restore_database, list_backups, snapshot_to_memory
+
+def test_backup_rotation_restore_and_snapshot(tmp_path):
+    db_file = str(tmp_path / "live.db")
+    conn = create_connection(db_file)
+    cur = conn.cursor()
+    create_tables(cur)
+    tracker = MyHabits(cur, conn)
+    tracker.add_habit("Backed Up", 1)
+
+    steps = []
+    first = backup_database(conn, str(tmp_path / "b"), keep=2, pages=1, throttle=0, progress=lambda done, total: steps.append(done))
+    backup_database(conn, str(tmp_path / "b"), keep=2)
+    backup_database(conn, str(tmp_path / "b"), keep=2)
+    assert len(steps) > 1                                        # copied in several steps
+    assert len(list_backups(str(tmp_path / "b"))) == 2 and first not in list_backups(str(tmp_path / "b"))
+
+    tracker.add_habit("After Backup", 1)
+    restore_database(list_backups(str(tmp_path / "b"))[-1], db_file)
+    assert [r[0] for r in cur.execute("SELECT habit_name FROM Habits")] == ["Backed Up"]
+
+    snapshot = snapshot_to_memory(conn)
+    tracker.add_habit("Live Only", 1)
+    assert snapshot.execute("SELECT COUNT(*) FROM Habits").fetchone()[0] == 1
+    snapshot.close()
+    conn.close()
+
+# --- Replica Tests ---
+import analytics
+from replica import ReadReplica
+
+@pytest.mark.parametrize("mode", ["backup", "deserialize"])
+def test_read_replica_refreshes_on_change_within_staleness(tmp_path, mode):
+    conn = create_connection(str(tmp_path / "primary.db"))
+    cur = conn.cursor()
+    create_tables(cur)
+    tracker = MyHabits(cur, conn)
+    tracker.add_habit("Replicated", 1)
+
+    replica = ReadReplica(conn, max_staleness=0.0, mode=mode)
+    replica.max_staleness = 3600
+    tracker.add_habit("Fresh", 1)
+    assert not replica.refresh_if_stale()                                # within the staleness bound
+    assert replica.cursor().execute("SELECT COUNT(*) FROM Habits").fetchone()[0] == 1
+
+    replica.max_staleness = 0.0
+    refreshes = replica.refreshes
+    assert replica.refresh_if_stale() and not replica.refresh_if_stale()  # unchanged primary: no re-copy
+    assert replica.refreshes == refreshes + 1
+
+    previous = (analytics.connection, analytics.cursor)
+    analytics.use_replica(replica)
+    try:
+        assert len(analytics.get_all_active_habits()) == 2
+        with pytest.raises(sqlite3.OperationalError):
+            analytics.cursor.execute("DELETE FROM Habits")                # replicas are read-only
+    finally:
+        analytics.use_connection(previous[0])
+    replica.close()
+    conn.close()
+
+# --- Sync Tests ---
+import time
+from sync import sync, export_changes
+
+def _device(path):
+    conn = create_connection(str(path))
+    create_tables(conn.cursor())
+    conn.commit()
+    return conn, MyHabits(conn.cursor(), conn)
+
+def _snapshot(conn):
+    habits = conn.execute("SELECT habit_name, habit_period, habit_status FROM Habits ORDER BY habit_name").fetchall()
+    tasks = conn.execute("""SELECT h.habit_name, t.task_log_date, t.task_status FROM Tasks t
+                            JOIN Habits h ON h.id = t.habit_id ORDER BY 1, 2""").fetchall()
+    return habits, tasks
+
+def test_delta_sync_converges_with_tombstones_and_conflicts(tmp_path):
+    a, tracker_a = _device(tmp_path / "a.db")
+    b, tracker_b = _device(tmp_path / "b.db")
+    tracker_a.add_habit("Phone Habit", 1)
+    tracker_b.add_habit("Laptop Habit", 2)
+    phone = tracker_a.find_habit_id("Phone Habit")
+    tracker_a.mark_tasks_completed([(phone, datetime(2025, 9, d, 8)) for d in (1, 2, 3)])
+
+    stats = sync(a, b)
+    assert stats["pulled"]["applied"] == 1 and stats["pushed"]["applied"] == 4
+    assert _snapshot(a) == _snapshot(b)
+    assert sync(a, b) == {"pulled": {"applied": 0, "skipped": 0, "received": 0},
+                          "pushed": {"applied": 0, "skipped": 0, "received": 0}}   # nothing changed
+
+    # Concurrent edits of the same habit: the later write wins on both sides
+    tracker_b.edit_habit(tracker_b.find_habit_id("Phone Habit"), new_name="Phone (B)")
+    time.sleep(0.01)
+    tracker_a.edit_habit(phone, new_name="Phone (A)")
+    sync(b, a)
+    assert _snapshot(a) == _snapshot(b) and _snapshot(a)[0][1][0] == "Phone (A)"
+
+    # Deleting a habit ships tombstones for it and its cascaded Tasks only
+    a.execute("DELETE FROM Habits WHERE id = ?", (phone,))
+    a.commit()
+    b_seq = b.execute("SELECT last_seq FROM SyncPeers").fetchone()[0]
+    assert len(export_changes(a.cursor(), b_seq)["changes"]) == 4
+    sync(a, b)
+    assert _snapshot(a) == _snapshot(b) == ([("Laptop Habit", "weekly", "active")], [])
+    a.close()
+    b.close()
+
+def test_sync_settles_habit_name_collisions(tmp_path):
+    a, tracker_a = _device(tmp_path / "a.db")
+    b, tracker_b = _device(tmp_path / "b.db")
+    tracker_a.add_habit("Run", 1)
+    tracker_b.add_habit("Run", 1)
+    tracker_a.mark_tasks_completed([(tracker_a.find_habit_id("Run"), datetime(2025, 9, 1, 8))])
+    tracker_b.mark_tasks_completed([(tracker_b.find_habit_id("Run"), datetime(2025, 9, 2, 8))])
+    gids = sorted(row[0] for conn in (a, b) for row in conn.execute("SELECT global_id FROM HabitGlobalIds"))
+
+    sync(a, b)
+    assert _snapshot(a) == _snapshot(b)
+    habits, tasks = _snapshot(a)
+    assert [h[0] for h in habits] == ["Run", f"Run ({gids[1]})"]
+    assert len(tasks) == 2 and tasks[0][0] != tasks[1][0]               # each habit kept its own Task
+    assert sync(a, b)["pulled"]["applied"] == 0
+    a.close()
+    b.close()
+
+def test_sync_derives_points_from_each_peers_ledger(tmp_path):
+    a, tracker_a = _device(tmp_path / "a.db")
+    b, tracker_b = _device(tmp_path / "b.db")
+    tracker_a.add_habit("Swim", 1)
+    swim = tracker_a.find_habit_id("Swim")
+    tracker_a.mark_tasks_completed([(swim, datetime(2025, 9, day, 8)) for day in (1, 2, 4)])
+    sync(a, b)
+
+    def points(conn):
+        return (conn.execute("SELECT habit_name, points FROM Habits").fetchall(), get_total_points(conn.cursor()),
+                conn.execute("SELECT SUM(points) FROM PointsLedger").fetchone()[0])
+
+    assert points(b) == points(a) == ([("Swim", 30)], 30, 30)
+    assert sync(a, b)["pulled"]["applied"] == 0                          # recomputed points are not re-sent
+    a.close()
+    b.close()
+
+# --- Sweeper Tests ---
+from sweeper import sweep_missed_periods
+from analytics import get_missed_period_counts
+
+def test_sweeper_marks_missed_periods_incrementally(fresh_db):
+    cur = fresh_db.cursor()
+    tracker = MyHabits(cur, fresh_db)
+    tracker.add_habit("Swept Daily", 1)
+    tracker.add_habit("Swept Weekly", 2)
+    daily, weekly = tracker.find_habit_id("Swept Daily"), tracker.find_habit_id("Swept Weekly")
+    cur.execute("UPDATE Habits SET creation_date = '2025-09-01'")     # a Monday
+    tracker.mark_tasks_completed([(daily, datetime(2025, 9, 2, 8)), (weekly, datetime(2025, 9, 10, 8))])
+
+    assert sweep_missed_periods(fresh_db, today=date(2025, 9, 5)) == 3           # Sep 1, 3, 4; week not over
+    assert sweep_missed_periods(fresh_db, today=date(2025, 9, 5)) == 0           # idempotent
+    assert sweep_missed_periods(fresh_db, today=date(2025, 9, 16)) == 11 + 1     # Sep 5..15, week of Sep 1
+    assert get_missed_period_counts(cur) == {daily: 14, weekly: 1}
+
+    # A late completion replaces the placeholder for its period
+    tracker.mark_tasks_completed([(daily, datetime(2025, 9, 3, 21))])
+    assert get_missed_period_counts(cur)[daily] == 13
+    assert cur.execute("SELECT task_status FROM Tasks WHERE habit_id = ? AND task_log_date = '2025-09-03'",
+                       (daily,)).fetchone() == ("completed",)
+
+# --- Period Status Tests ---
+from period_status import roll_over_period_status, get_due_status
+
+def test_period_status_tracks_completions_and_rolls_over(fresh_db, capsys):
+    cur = fresh_db.cursor()
+    tracker = MyHabits(cur, fresh_db)
+    tracker.add_habit("Due Daily", 1)
+    tracker.add_habit("Due Weekly", 2)
+    daily, weekly = tracker.find_habit_id("Due Daily"), tracker.find_habit_id("Due Weekly")
+    roll_over_period_status(cur, date(2025, 9, 3))                     # a Wednesday
+    assert {r[0]: (r[3], r[4]) for r in get_due_status(cur)} == {daily: ("2025-09-03", False), weekly: ("2025-09-01", False)}
+
+    tracker.mark_tasks_completed([(daily, datetime(2025, 9, 3, 8)), (weekly, datetime(2025, 9, 1, 8))])
+    assert [r[0] for r in get_due_status(cur, only_due=True)] == []
+
+    assert roll_over_period_status(cur, date(2025, 9, 4)) == 1          # only the daily habit moves
+    assert [r[0] for r in get_due_status(cur, only_due=True)] == [daily]
+    assert roll_over_period_status(cur, date(2025, 9, 4)) == 0
+
+    cur.execute("DELETE FROM Tasks WHERE habit_id = ?", (weekly,))
+    assert [r[0] for r in get_due_status(cur, "weekly", only_due=True)] == [weekly]
+
+    tracker._status_day = datetime.now().date()                        # keep the listing on the test's dates
+    tracker.list_all_active_habits()
+    assert "due" in capsys.readouterr().out
+
+# --- Category Tests ---
+from categories import get_category_summary, get_category_daily, resolve_category
+from rollup import rebuild_category_rollup
+
+def test_category_rollup_follows_tasks_and_category_moves(fresh_db):
+    cur = fresh_db.cursor()
+    tracker = MyHabits(cur, fresh_db)
+    tracker.add_habit("Run", 1)
+    tracker.add_habit("Read", 1)
+    run, read = tracker.find_habit_id("Run"), tracker.find_habit_id("Read")
+    cur.execute("UPDATE Habits SET creation_date = '2025-09-01', category_id = 1 WHERE id = ?", (run,))
+    cur.execute("UPDATE Habits SET creation_date = '2025-09-01', category_id = 3 WHERE id = ?", (read,))
+    tracker.mark_tasks_completed([(run, datetime(2025, 9, d, 7)) for d in (1, 2, 3)] + [(read, datetime(2025, 9, 1, 21))])
+
+    summary = get_category_summary(cur, "2025-09-01", "2025-09-04", today="2025-09-10")
+    assert (summary[1]["completed"], summary[1]["expected"], summary[1]["completion_rate"]) == (3, 4, 0.75)
+    assert summary[1]["points"] > 0 and summary[1]["streak_distribution"]["3-6"] == 1
+    assert summary[3]["completed"] == 1
+    assert resolve_category(cur, "learning") == 3
+
+    cur.execute("UPDATE Habits SET category_id = 1 WHERE id = ?", (read,))
+    assert [row[:2] for row in get_category_daily(cur, 1, "2025-09-01", "2025-09-04")] == [
+        ("2025-09-01", 2), ("2025-09-02", 1), ("2025-09-03", 1)]
+    cur.execute("DELETE FROM Habits WHERE id = ?", (run,))
+    expected = cur.execute("SELECT * FROM CategoryDailyRollup WHERE completed + skipped + missed > 0 ORDER BY 1, 2").fetchall()
+    rebuild_category_rollup(cur)
+    assert cur.execute("SELECT * FROM CategoryDailyRollup ORDER BY 1, 2").fetchall() == expected
+    assert expected == [(1, "2025-09-01", 1, 0, 0, 0, 0)]
+
+# --- Clock Tests ---
+from datetime import timezone
+from clock import Clock, FrozenClock, period_bounds
+
+def test_injected_clock_sets_habit_day_and_periods(fresh_db):
+    cur = fresh_db.cursor()
+    clock = FrozenClock(datetime(2025, 9, 3, 2, 30), rollover_hour=4)   # a Wednesday, before rollover
+    tracker = MyHabits(cur, fresh_db, clock=clock)
+    tracker.add_habit("Run", 1)
+    run = tracker.find_habit_id("Run")
+    tracker.mark_task_completed(run)
+    clock.advance(hours=2)
+    tracker.mark_task_completed(run)
+    assert [r[0] for r in cur.execute("SELECT task_log_date FROM Tasks ORDER BY 1")] == ["2025-09-02", "2025-09-03"]
+
+    context = clock.context()
+    assert (context.week_start, context.week_end) == (date(2025, 9, 1), date(2025, 9, 7))
+    assert context.bounds("monthly") == period_bounds("2025-09-30", "monthly") == (date(2025, 9, 1), date(2025, 9, 30))
+    assert context.last_elapsed("weekly") == date(2025, 8, 31)
+    tokyo = Clock("Asia/Tokyo", source=lambda: datetime(2025, 9, 1, 20, tzinfo=timezone.utc))
+    assert tokyo.today() == date(2025, 9, 2)
+
+def test_habit_creation_date_follows_injected_clock(fresh_db):
+    tracker = MyHabits(fresh_db.cursor(), fresh_db, clock=FrozenClock(datetime(2025, 9, 3, 9)))
+    backend = tracker.backend
+    tracker.add_habit("Clocked", 1)
+    habit_id = tracker.find_habit_id("Clocked")
+    tracker.mark_task_completed(habit_id)
+    assert backend.get_habit(habit_id).creation_date == "2025-09-03 09:00:00"
+    assert [t.task_log_date for t in backend.tasks()] == ["2025-09-03"]
+
+# --- Forecast Tests ---
+from forecast import StreakRiskModel
+from clock import set_clock
+
+def test_streak_risk_ranks_lapsed_habits_and_updates_incrementally(fresh_db):
+    cur = fresh_db.cursor()
+    today = date(2025, 9, 10)
+    for name in ("Steady", "Lapsed", "Weekends"):
+        cur.execute("INSERT INTO Habits (habit_name, habit_period, creation_date, habit_status) VALUES (?, 'daily', '2025-07-01', 'active')", (name,))
+    steady, lapsed, weekends = 1, 2, 3
+    days = [date.fromordinal(today.toordinal() - i) for i in range(1, 60)]
+    cur.executemany("INSERT INTO Tasks (habit_id, task_name, periodicity, task_log_date, streak, task_status) VALUES (?, 'x', 'daily', ?, 0, 'completed')",
+                    [(steady, d.isoformat()) for d in days] + [(lapsed, d.isoformat()) for d in days[10:]] +
+                    [(weekends, d.isoformat()) for d in days if d.weekday() >= 5])
+
+    model = StreakRiskModel().load(cur, today)
+    ranked = model.top_risks(3, today)
+    assert [habit_id for habit_id, _, _ in ranked] == [weekends, lapsed, steady]   # Wednesday: weekend-only habit is riskiest
+    assert ranked[0][2] > 0.5 > ranked[2][2]
+
+    before = ranked[1][2]
+    model.task_completed(lapsed, today.isoformat())
+    model.habit_deactivated(weekends)
+    after = {habit_id: risk for habit_id, _, risk in model.top_risks(3, today)}
+    assert weekends not in after and after[lapsed] < before
+    previous = set_clock(FrozenClock(datetime(2025, 9, 10, 12)))
+    try:
+        assert suggest_habits_to_focus(cur, model=model, top_k=1) == ["Lapsed"]
+    finally:
+        set_clock(previous)
+
+# --- Periodicity Change Tests ---
+from completion_index import CompletionIndex
+
+def test_period_change_rederives_streaks_and_missed_periods(fresh_db):
+    cur = fresh_db.cursor()
+    index = CompletionIndex()
+    tracker = MyHabits(cur, fresh_db, listeners=[index], clock=FrozenClock(datetime(2025, 9, 24, 12)))
+    tracker.add_habit("Stretch", 1)
+    habit = tracker.find_habit_id("Stretch")
+    cur.execute("UPDATE Habits SET creation_date = '2025-09-01' WHERE id = ?", (habit,))
+    # Mon-Wed of week 1, Tuesday of week 2, nothing in week 3
+    tracker.mark_tasks_completed([(habit, datetime(2025, 9, d, 8)) for d in (1, 2, 3, 9)])
+    sweep_missed_periods(fresh_db, date(2025, 9, 24))
+    index.load(cur)
+    assert cur.execute("SELECT COUNT(*) FROM Tasks WHERE habit_id = ? AND task_status = 'missed'", (habit,)).fetchone()[0] == 19
+
+    tracker.edit_habit(habit, new_period=2)
+    rows = cur.execute("SELECT task_log_date, periodicity, streak, task_status FROM Tasks WHERE habit_id = ? ORDER BY 1", (habit,)).fetchall()
+    assert {r[1] for r in rows} == {"weekly"}
+    assert [(d, s) for d, _, s, status in rows if status == "completed"] == [
+        ("2025-09-01", 1), ("2025-09-02", 1), ("2025-09-03", 1), ("2025-09-09", 2)]
+    assert [d for d, _, _, status in rows if status == "missed"] == ["2025-09-15"]
+    assert cur.execute("SELECT streak, best_streak FROM Habits WHERE id = ?", (habit,)).fetchone() == (0, 2)
+    assert index.longest_streak(habit) == 2
+
+# --- Storage Backend Tests ---
+from storage import SQLiteBackend, MemoryBackend
+
+@pytest.fixture(params=["sqlite", "memory"])
+def backend(request):
+    if request.param == "memory":
+        yield MemoryBackend()
+        return
+    conn = create_connection(":memory:")
+    create_tables(conn.cursor())
+    conn.commit()
+    yield SQLiteBackend(conn.cursor(), conn)
+    conn.close()
+
+def test_backend_conformance_habits_and_completions(backend, capsys):
+    clock = FrozenClock(datetime(2025, 9, 3, 9))                          # a Wednesday
+    tracker = MyHabits(backend=backend, clock=clock)
+    tracker.add_habit("Walk", 1)
+    tracker.add_habit("Review", 2)
+    with pytest.raises(sqlite3.IntegrityError):
+        tracker.add_habit("Walk", 2)
+    walk, review = tracker.find_habit_id("walk"), tracker.find_habit_id("Rev")
+    assert [h.habit_name for h in backend.habits()] == ["Walk", "Review"]
+    assert backend.habit_by_name("Review").id == review and backend.habit_by_name("review") is None
+
+    tracker.mark_task_completed(walk, idempotency_key="k1")
+    tracker.mark_task_completed(walk, idempotency_key="k1")
+    tracker.mark_task_completed(walk)
+    tracker.mark_task_completed(review)
+    clock.advance(days=1)
+    tracker.mark_task_completed(walk)
+    tracker.mark_task_completed(review)
+    out = capsys.readouterr().out
+    assert "already recorded" in out and "for today" in out and "this week" in out
+
+    assert [(t.task_log_date, t.streak) for t in backend.tasks() if t.habit_id == walk] == [("2025-09-03", 1), ("2025-09-04", 2)]
+    assert backend.completion_dates(walk, "2025-09-04") == ["2025-09-04"]
+    walk_row = backend.get_habit(walk)
+    assert (walk_row.streak, walk_row.best_streak, walk_row.last_completed) == (2, 2, "2025-09-04")
+    assert walk_row.points > 0
+    backend.roll_over(clock.today())
+    assert [(h.habit_name, done) for h, done in backend.due_status(clock.today(), "weekly")] == [("Review", True)]
+
+    tracker.edit_habit(walk, new_name="Long walk", new_period=2)
+    assert [t.streak for t in backend.tasks() if t.habit_id == walk] == [1, 1]
+    assert (backend.get_habit(walk).habit_period, backend.get_habit(walk).streak) == ("weekly", 1)
+    tracker.deactivate_habit(review)
+    assert [h.habit_name for h in backend.habits()] == ["Long walk"]
+
+    previous = analytics.backend
+    analytics.use_backend(backend)
+    try:
+        assert analytics.get_longest_streak() == {"habit_name": "Long walk", "streak": 1}
+        assert [t.task_name for t in analytics.get_completed_tasks_for_date("2025-09-04")] == ["Walk"]
+    finally:
+        analytics.use_backend(previous)
+
+def test_completions_survive_added_habit_and_task_columns(fresh_db):
+    cur = fresh_db.cursor()
+    cur.execute("ALTER TABLE Habits ADD COLUMN color TEXT")
+    cur.execute("ALTER TABLE Tasks ADD COLUMN location TEXT")
+    tracker = MyHabits(cur, fresh_db)
+    tracker.add_habit("Widened", 1)
+    habit_id = tracker.find_habit_id("Widened")
+    tracker.mark_task_completed(habit_id)
+    assert tracker.backend.get_habit(habit_id).streak == 1
+    assert [t.habit_id for t in tracker.backend.tasks()] == [habit_id]
+    assert recompute_points(cur) > 0
+
+def test_backend_conformance_batch_rolls_back_failed_operation(backend):
+    tracker = MyHabits(backend=backend, clock=FrozenClock(datetime(2025, 9, 3, 9)))
+    with tracker.batch(max_ops=100, max_delay=60):
+        tracker.add_habit("Read", 1)
+        read = tracker.find_habit_id("Read")
+        tracker.mark_task_completed(read)
+        with pytest.raises(sqlite3.IntegrityError):
+            tracker.edit_habit(read, new_name="Read")                   # unchanged name is fine...
+            tracker.add_habit("Read", 2)                                 # ...a duplicate is undone alone
+    assert [(h.habit_name, h.habit_period, h.streak) for h in backend.habits()] == [("Read", "daily", 1)]
+    assert len(backend.tasks()) == 1 and not backend.in_transaction
+
+# --- Metrics Tests ---
+import urllib.request
+import metrics
+
+def test_metrics_count_tracker_operations_and_export(tmp_path):
+    completed = metrics.COMPLETIONS.labels("completed")
+    duplicates = metrics.COMPLETIONS.labels("duplicate_day")
+    adds = metrics.HABIT_OPERATIONS.labels("add_habit")
+    before = (completed.value, duplicates.value, adds.value, sum(metrics.COMMIT_SECONDS.labels().counts))
+    tracker = MyHabits(backend=MemoryBackend(), clock=FrozenClock(datetime(2025, 9, 3, 9)))
+    tracker.add_habit("Stretch", 1)
+    habit_id = tracker.find_habit_id("Stretch")
+    tracker.mark_task_completed(habit_id)
+    tracker.mark_task_completed(habit_id)
+    assert (completed.value, duplicates.value, adds.value) == (before[0] + 1, before[1] + 1, before[2] + 1)
+    assert sum(metrics.COMMIT_SECONDS.labels().counts) == before[3] + 3
+
+    analytics.get_missed_period_counts(sqlite3.connect(":memory:").execute(
+        "CREATE TABLE Tasks (habit_id, task_status)"))
+    text = metrics.REGISTRY.render()
+    assert text.endswith("# EOF\n")
+    assert f'habit_tracker_completions_total{{status="completed"}} {completed.value}' in text
+    assert 'habit_tracker_analytics_seconds_bucket{function="get_missed_period_counts",le="+Inf"}' in text
+    assert 'habit_tracker_cache_lookups_total{cache="parse_date",result="hit"}' in text
+
+    path = tmp_path / "habit_tracker.prom"
+    metrics.write_textfile(str(path))
+    assert path.read_text().startswith("# TYPE habit_tracker_completions counter")
+    server = metrics.serve(port=0)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("application/openmetrics-text")
+            assert b"habit_tracker_habit_operations_total" in response.read()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+# --- History Tests ---
+from datetime import timedelta
+from history import as_of, backfill_history, habit_versions
+from db import create_history_tables
+
+def test_as_of_returns_past_habit_versions(my_habits, test_db):
+    cur = test_db.cursor()
+    my_habits.add_habit("History Swim", 1)
+    habit_id = my_habits.find_habit_id("History Swim")
+    today = date.today()
+    earlier = (today - timedelta(days=3)).isoformat()
+    # Pretend the habit was created three days ago
+    cur.execute("UPDATE HabitHistory SET valid_from = ? WHERE habit_id = ?", (earlier, habit_id))
+    test_db.commit()
+
+    my_habits.mark_task_completed(habit_id)
+    my_habits.edit_habit(habit_id, new_name="History Pool Swim")
+    my_habits.deactivate_habit(habit_id)
+    versions = habit_versions(cur, habit_id)
+    assert [(v.valid_from, v.habit_name, v.habit_status, v.streak) for v in versions] == [
+        (earlier, "History Swim", "active", 0), (today.isoformat(), "History Pool Swim", "inactive", 1)]
+    assert versions[0].valid_to == today.isoformat()
+
+    previous = analytics.backend
+    analytics.use_connection(test_db)
+    try:
+        past = analytics.as_of(today - timedelta(days=1))
+        assert past.habit(habit_id).habit_name == "History Swim"
+        assert habit_id in [v.habit_id for v in past.habits()]
+        assert past.completions(habit_id) == 0
+        now = analytics.as_of(today)
+        assert habit_id not in [v.habit_id for v in now.habits()]
+        assert now.habit(habit_id).habit_status == "inactive" and now.points()[habit_id] > 0
+        assert now.completions(habit_id) == 1
+        assert analytics.as_of(today - timedelta(days=4)).habit(habit_id) is None
+    finally:
+        analytics.use_backend(previous)
+
+# --- CLI Tests ---
+from typer.testing import CliRunner
+import cli
+
+def test_cli_delete_requires_exact_name_or_confirmation(tmp_path, monkeypatch):
+    path = str(tmp_path / "cli.db")
+    conn = create_connection(path)
+    create_tables(conn.cursor())
+    conn.executemany("INSERT INTO Habits (habit_name, habit_period, creation_date, habit_status) VALUES (?, 'daily', '2025-09-01', 'active')",
+                     [("Morning Run",), ("Evening Read",), ("Read Aloud",)])
+    conn.commit()
+    monkeypatch.setattr(cli, "create_connection", lambda *_: create_connection(path))
+    runner = CliRunner()
+
+    def names():
+        return {row[0] for row in conn.execute("SELECT habit_name FROM Habits")}
+
+    assert runner.invoke(cli.app, ["delete-habit", "Mornin Rnu"], input="n\n").exit_code == 1
+    assert runner.invoke(cli.app, ["delete-habit", "read"]).exit_code == 1          # two candidates
+    assert names() == {"Morning Run", "Evening Read", "Read Aloud"}
+    assert runner.invoke(cli.app, ["delete-habit", "Mornin Rnu", "--yes"]).exit_code == 0
+    assert runner.invoke(cli.app, ["deactivate-habit", "evening read"]).exit_code == 0
+    assert names() == {"Evening Read", "Read Aloud"}
+    assert conn.execute("SELECT habit_status FROM Habits WHERE habit_name = 'Evening Read'").fetchone()[0] == "inactive"
+    conn.close()
+
+def test_history_stamps_the_clock_day_and_backfills_from_enable_date(fresh_db):
+    clock = FrozenClock(datetime(2025, 9, 3, 23), rollover_hour=4)
+    tracker = MyHabits(fresh_db.cursor(), fresh_db, clock=clock)
+    tracker.add_habit("Night Owl", 1)
+    habit_id = tracker.find_habit_id("Night Owl")
+    clock.advance(hours=3)                                      # 02:00 on the 4th is still the 3rd
+    tracker.mark_task_completed(habit_id)
+    cur = fresh_db.cursor()
+    assert cur.execute("SELECT task_log_date FROM Tasks").fetchone()[0] == "2025-09-03"
+    assert [(v.valid_from, v.streak) for v in habit_versions(cur, habit_id)] == [("2025-09-03", 1)]
+
+    # A database from before history: existing habits start at the day it is enabled
+    cur.execute("DELETE FROM HabitHistory")
+    create_history_tables(cur)
+    set_clock(FrozenClock(datetime(2025, 9, 10, 12)))
+    try:
+        backfill_history(cur)
+    finally:
+        set_clock(Clock.from_env())
+    assert as_of(cur, "2025-09-09").habit(habit_id) is None
+    assert as_of(cur, "2025-09-10").habit(habit_id).streak == 1
+
+def test_plain_connections_can_write_habits(tmp_path):
+    db_file = str(tmp_path / "plain.db")
+    conn = create_connection(db_file)
+    create_tables(conn.cursor())
+    conn.commit()
+    conn.close()
+
+    plain = sqlite3.connect(db_file)                            # e.g. the sqlite3 shell: no app functions
+    plain.execute("INSERT INTO Habits (habit_name, habit_period, creation_date, habit_status) "
+                  "VALUES ('Shell', 'daily', '2025-09-01', 'active')")
+    plain.execute("UPDATE Habits SET habit_name = 'Shell Edit' WHERE habit_name = 'Shell'")
+    plain.commit()
+    assert plain.execute("SELECT habit_name, valid_from = date('now', 'localtime') FROM HabitHistory").fetchall() \
+        == [("Shell Edit", 1)]
+    assert plain.execute("SELECT COUNT(*) FROM MaintenanceFlags").fetchone()[0] == 0
+    plain.close()
+
+def test_period_status_opens_on_the_clock_day(fresh_db):
+    clock = FrozenClock(datetime(2025, 9, 4, 2), rollover_hour=4)   # still the 3rd
+    tracker = MyHabits(fresh_db.cursor(), fresh_db, clock=clock)
+    tracker.add_habit("Late", 1)
+    habit_id = tracker.find_habit_id("Late")
+    cur = fresh_db.cursor()
+    assert cur.execute("SELECT period_start, period_end FROM HabitPeriodStatus WHERE habit_id = ?",
+                       (habit_id,)).fetchone() == ("2025-09-03", "2025-09-04")
+    tracker.mark_task_completed(habit_id)
+    assert cur.execute("SELECT done FROM HabitPeriodStatus WHERE habit_id = ?", (habit_id,)).fetchone()[0] == 1